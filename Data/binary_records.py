@@ -0,0 +1,280 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+import struct
+import tempfile
+import time
+
+from bus_data_generator import MAX_CAPACITY, ROUTE_STOPS, STATUS_LEVELS
+
+# Packed stop record: 18 bytes per row instead of over 100 bytes of CSV text
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<u4'),        # Unix time in seconds (CSV times are stored as UTC)
+    ('bus_id', '<u2'),           # Index into the file's bus table
+    ('stop_id', 'u1'),           # Index into the file's stop table
+    ('trip_number', '<u2'),
+    ('boarding', 'u1'),
+    ('alighting', 'u1'),
+    ('ir_sensor_count', 'u1'),
+    ('camera_count', 'u1'),
+    ('validated_count', 'u1'),
+    ('actual_count', 'u1'),
+    ('sensor_mismatch', 'u1'),
+    ('status', 'u1'),            # Index into STATUS_LEVELS
+    ('flags', 'u1'),             # FLAG_* bits
+])
+
+FLAG_ALERT = 0x01
+FLAG_BACKWARD = 0x02
+
+COUNT_COLUMNS = ['boarding', 'alighting', 'ir_sensor_count', 'camera_count',
+                 'validated_count', 'actual_count', 'sensor_mismatch']
+
+# File layout: fixed header, JSON lookup tables, then records from an aligned offset
+FILE_MAGIC = b'SBODREC1'
+FILE_VERSION = 1
+HEADER_FORMAT = '<8sHHI'
+RECORD_ALIGNMENT = 64
+
+def default_stop_table():
+    """Stop lookup table in route order"""
+    return [{"name": s['name'], "lat": s['lat'], "lon": s['lon']} for s in ROUTE_STOPS]
+
+def _check_range(column, values):
+    """Raise instead of letting numpy wrap values that overflow the column's field"""
+    info = np.iinfo(RECORD_DTYPE[column])
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        raise ValueError(f"Column '{column}' outside the {info.min}-{info.max} range of its field")
+
+def encode_records(df, bus_ids=None, stops=None):
+    """Encode a DataFrame in the generator's schema into a RECORD_DTYPE array.
+
+    Returns (records, meta) where meta holds the bus and stop lookup tables.
+    """
+    if bus_ids is None:
+        bus_ids = sorted(df['bus_id'].unique())
+    if stops is None:
+        stops = default_stop_table()
+    stop_names = [s['name'] for s in stops]
+
+    records = np.zeros(len(df), dtype=RECORD_DTYPE)
+    timestamps = pd.to_datetime(df['timestamp'])
+    epoch_seconds = timestamps.values.astype('datetime64[s]').astype(np.int64)
+    _check_range('timestamp', epoch_seconds)
+    records['timestamp'] = epoch_seconds
+
+    bus_codes = pd.Categorical(df['bus_id'], categories=bus_ids).codes
+    stop_codes = pd.Categorical(df['stop_name'], categories=stop_names).codes
+    if (bus_codes < 0).any() or (stop_codes < 0).any():
+        raise ValueError("Data contains bus ids or stops missing from the lookup tables")
+    _check_range('bus_id', bus_codes)
+    _check_range('stop_id', stop_codes)
+    records['bus_id'] = bus_codes
+    records['stop_id'] = stop_codes
+
+    for column in ('trip_number',) + tuple(COUNT_COLUMNS):
+        values = df[column].values
+        _check_range(column, values)
+        records[column] = values
+
+    status_codes = pd.Categorical(df['status'], categories=STATUS_LEVELS).codes
+    if (status_codes < 0).any():
+        raise ValueError("Status outside STATUS_LEVELS")
+    records['status'] = status_codes
+    flags = np.where(df['alert_triggered'].values == 'Yes', FLAG_ALERT, 0)
+    flags |= np.where(df['direction'].values == 'Backward', FLAG_BACKWARD, 0)
+    records['flags'] = flags
+
+    meta = {"bus_ids": list(bus_ids), "stops": stops}
+    return records, meta
+
+def decode_records(records, meta):
+    """Decode records back into a DataFrame in the generator's CSV schema"""
+    stops = meta['stops']
+    stop_id = np.asarray(records['stop_id'])
+    validated = np.asarray(records['validated_count'])
+    flags = np.asarray(records['flags'])
+    timestamps = pd.to_datetime(np.asarray(records['timestamp']).astype('datetime64[s]'))
+
+    df = pd.DataFrame({
+        'timestamp': timestamps,
+        'trip_number': np.asarray(records['trip_number']).astype(int),
+        'direction': np.where(flags & FLAG_BACKWARD, 'Backward', 'Forward'),
+        'bus_id': np.asarray(meta['bus_ids'], dtype=object)[records['bus_id']],
+        'stop_name': np.array([s['name'] for s in stops], dtype=object)[stop_id],
+        'latitude': np.array([s['lat'] for s in stops])[stop_id],
+        'longitude': np.array([s['lon'] for s in stops])[stop_id],
+    })
+    for column in COUNT_COLUMNS[:6]:
+        df[column] = np.asarray(records[column]).astype(int)
+    df['occupancy_percent'] = np.round(validated / MAX_CAPACITY * 100, 2)
+    df['status'] = np.asarray(STATUS_LEVELS, dtype=object)[records['status']]
+    df['alert_triggered'] = np.where(flags & FLAG_ALERT, 'Yes', 'No')
+    df['sensor_mismatch'] = np.asarray(records['sensor_mismatch']).astype(int)
+    df['hour'] = timestamps.hour
+    return df
+
+def write_records(path, records, meta):
+    """Write records and lookup tables to a binary record file"""
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    header = struct.pack(HEADER_FORMAT, FILE_MAGIC, FILE_VERSION, RECORD_DTYPE.itemsize, len(meta_bytes))
+    preamble = header + meta_bytes
+    padding = -len(preamble) % RECORD_ALIGNMENT
+
+    with open(path, 'wb') as f:
+        f.write(preamble + b'\0' * padding)
+        np.asarray(records, dtype=RECORD_DTYPE).tofile(f)
+
+def append_records(path, records):
+    """Append records to an existing binary record file"""
+    with open(path, 'ab') as f:
+        np.asarray(records, dtype=RECORD_DTYPE).tofile(f)
+
+def read_header(path):
+    """Return (meta, data_offset) of a binary record file"""
+    with open(path, 'rb') as f:
+        header = f.read(struct.calcsize(HEADER_FORMAT))
+        magic, version, record_size, meta_len = struct.unpack(HEADER_FORMAT, header)
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path} is not a binary record file")
+        if version != FILE_VERSION or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"Unsupported record file version {version} (record size {record_size})")
+        meta = json.loads(f.read(meta_len).decode('utf-8'))
+    preamble = len(header) + meta_len
+    return meta, preamble + (-preamble % RECORD_ALIGNMENT)
+
+class RecordFile:
+    """Read-only, memory-mapped view of a binary record file.
+
+    Columns are zero-copy views into the mapping, so scanning a column only
+    touches the pages the operating system reads in; nothing is parsed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.meta, self.data_offset = read_header(path)
+        # Ignore a trailing partial record left by an interrupted append
+        count = (os.path.getsize(path) - self.data_offset) // RECORD_DTYPE.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                                     offset=self.data_offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, column):
+        """Zero-copy view of one column"""
+        return self.records[column]
+
+    @property
+    def columns(self):
+        return RECORD_DTYPE.names
+
+    def chunks(self, chunk_size=1 << 22):
+        """Iterate over record slices of at most `chunk_size` records"""
+        for start in range(0, len(self.records), chunk_size):
+            yield self.records[start:start + chunk_size]
+
+    def to_dataframe(self, start=0, stop=None):
+        """Decode a slice of the file into the generator's CSV schema"""
+        return decode_records(self.records[start:stop], self.meta)
+
+def scan_kpis(record_file, chunk_size=1 << 22):
+    """Compute the headline KPIs from a record file in one chunked pass"""
+    n_stops = len(record_file.meta['stops'])
+    total = 0
+    max_validated = 0
+    overcrowded = 0
+    alerts = 0
+    mismatch_sum = 0
+    stop_sum = np.zeros(n_stops)
+    stop_count = np.zeros(n_stops)
+    hour_sum = np.zeros(24)
+    hour_count = np.zeros(24)
+    overcrowded_code = STATUS_LEVELS.index('OVERCROWDED')
+
+    for chunk in record_file.chunks(chunk_size):
+        validated = chunk['validated_count']
+        stop_id = chunk['stop_id']
+        hour = (chunk['timestamp'] // 3600) % 24
+
+        total += len(chunk)
+        max_validated = max(max_validated, int(validated.max()))
+        overcrowded += int(np.count_nonzero(chunk['status'] == overcrowded_code))
+        alerts += int(np.count_nonzero(chunk['flags'] & FLAG_ALERT))
+        mismatch_sum += int(chunk['sensor_mismatch'].sum(dtype=np.int64))
+        stop_sum += np.bincount(stop_id, weights=validated, minlength=n_stops)
+        stop_count += np.bincount(stop_id, minlength=n_stops)
+        hour_sum += np.bincount(hour, weights=validated, minlength=24)
+        hour_count += np.bincount(hour, minlength=24)
+
+    if total == 0:
+        return {}
+
+    to_percent = 100 / MAX_CAPACITY
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stop_avg = stop_sum / stop_count * to_percent
+        hour_avg = hour_sum / hour_count * to_percent
+    busiest_stop = int(np.nanargmax(stop_avg))
+    peak_hour = int(np.nanargmax(hour_avg))
+
+    return {
+        'records': total,
+        'max_utilization': max_validated * to_percent,
+        'overcrowded_percentage': overcrowded / total * 100,
+        'total_alerts': alerts,
+        'most_crowded_stop': record_file.meta['stops'][busiest_stop]['name'],
+        'most_crowded_stop_occupancy': float(stop_avg[busiest_stop]),
+        'peak_hour': peak_hour,
+        'peak_hour_occupancy': float(hour_avg[peak_hour]),
+        'avg_sensor_mismatch': mismatch_sum / total,
+    }
+
+def main():
+    """Convert the CSV dataset and benchmark a large memory-mapped KPI scan"""
+    print("Binary Record Format")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    records, meta = encode_records(df)
+    write_records('bus_overcrowding_data.sbr', records, meta)
+    csv_size = os.path.getsize('bus_overcrowding_data.csv')
+    bin_size = os.path.getsize('bus_overcrowding_data.sbr')
+    print(f"1. Encoded {len(records)} records: CSV {csv_size / len(df):.0f} bytes/row, "
+          f"binary {RECORD_DTYPE.itemsize} bytes/row ({csv_size / bin_size:.1f}x smaller file)")
+
+    roundtrip = RecordFile('bus_overcrowding_data.sbr').to_dataframe()
+    same = (roundtrip[COUNT_COLUMNS].values == df[COUNT_COLUMNS].values).all() and \
+        (roundtrip['status'].values == df['status'].values).all()
+    print(f"2. Round trip matches CSV: {bool(same)}")
+
+    # Large scan: tile the day into a multi-million record file
+    n_copies = 100_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'large.sbr')
+        tiled = np.tile(records, n_copies)
+        write_records(path, tiled, meta)
+        del tiled
+
+        record_file = RecordFile(path)
+        start = time.perf_counter()
+        kpis = scan_kpis(record_file)
+        elapsed = time.perf_counter() - start
+        size_mb = len(record_file) * RECORD_DTYPE.itemsize / 1e6
+        print(f"3. Scanned {len(record_file):,} records ({size_mb:.0f} MB) in {elapsed:.2f}s "
+              f"({len(record_file) / elapsed / 1e6:.1f} M records/s, {size_mb / elapsed:.0f} MB/s)")
+        print(f"   Overcrowded: {kpis['overcrowded_percentage']:.1f}%, alerts: {kpis['total_alerts']:,}, "
+              f"peak hour: {kpis['peak_hour']}:00")
+        del record_file
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from datetime import datetime, timedelta
+from datetime import timedelta
 import random
 
 # Bus route information
@@ -21,6 +21,9 @@ NORMAL_THRESHOLD = 0.4  # <40% is undercrowded
 YELLOW_THRESHOLD = 0.6  # 60% nearly full
 RED_THRESHOLD = 0.8     # 80% overcrowded
 
+# Status levels in increasing order of occupancy (list index is the compact status code)
+STATUS_LEVELS = ["UNDERCROWDED", "NORMAL", "NEARLY_FULL", "OVERCROWDED"]
+
 def get_status(occupancy_percent):
     """Determine bus status based on occupancy percentage"""
     if occupancy_percent < NORMAL_THRESHOLD * 100:
@@ -85,18 +88,57 @@ def simulate_sensor_readings(actual_count):
     
     return ir_count, camera_count, validated_count
 
-def generate_bus_data():
-    """Generate realistic bus operation data for a full day"""
+def simulate_sensor_readings_batch(actual_counts, rng=None):
+    """Vectorized simulate_sensor_readings: same error model over an array of true counts"""
+    rng = rng if rng is not None else np.random.default_rng()
+    actual = np.asarray(actual_counts, dtype=np.int64)
+    crowded = actual > 40
+
+    ir_variation = np.where(crowded, rng.integers(-2, 2, len(actual)), rng.integers(-1, 2, len(actual)))
+    ir_count = np.clip(actual + ir_variation, 0, MAX_CAPACITY)
+
+    camera_accuracy = np.where(crowded, rng.uniform(0.85, 0.95, len(actual)), rng.uniform(0.90, 0.98, len(actual)))
+    camera_variation = (actual * (1 - camera_accuracy)).astype(np.int64)
+    camera_count = np.clip(actual + rng.integers(-camera_variation, camera_variation + 3), 0, MAX_CAPACITY + 3)
+
+    return ir_count, camera_count, fuse_counts(ir_count, camera_count, actual)
+
+def fuse_counts(ir_count, camera_count, actual_counts):
+    """Vectorized sensor fusion of simulate_sensor_readings (70% camera, 30% IR when they agree)"""
+    ir_count, camera_count = np.asarray(ir_count), np.asarray(camera_count)
+    validated_count = np.where(np.abs(camera_count - ir_count) <= 2,
+                               np.round(0.7 * camera_count + 0.3 * ir_count).astype(np.int64),
+                               np.where(np.asarray(actual_counts) > 30, camera_count, ir_count))
+    return np.clip(validated_count, 0, MAX_CAPACITY)
+
+def generate_bus_data(start_date='2024-01-15', days=1, profiles=None):
+    """Generate realistic bus operation data for `days` full days from `start_date`
+
+    With DemandProfiles (demand_profiles.py), demand follows each stop's
+    profile for the date's calendar day type in 15-minute steps instead of
+    the hourly generate_passenger_pattern.
+    """
+    data = []
+    first_day = pd.Timestamp(start_date).to_pydatetime().replace(hour=0, minute=0, second=0)
+    for day in range(days):
+        start_time = first_day + timedelta(days=day)
+        demand = profiles.day_table(start_time) if profiles is not None else None
+        data.extend(generate_day_records(start_time, demand))
+    return pd.DataFrame(data)
+
+def generate_day_records(date, demand=None):
+    """Stop records of one service day; `demand` is a DemandProfiles.day_table or None for the hourly pattern"""
     data = []
     
     # Simulate one full day of operation (5 AM to 11 PM)
-    start_time = datetime(2024, 1, 15, 5, 0, 0)  # Monday
+    start_time = date.replace(hour=5, minute=0, second=0)
+    end_time = start_time.replace(hour=23)       # No new trips after 11 PM
     
     # Multiple trips throughout the day
     current_time = start_time
     trip_number = 1
     
-    while current_time.hour < 23:
+    while current_time < end_time:
         # One complete trip (forward and backward)
         for direction in ['Forward', 'Backward']:
             stops = ROUTE_STOPS if direction == 'Forward' else ROUTE_STOPS[::-1]
@@ -110,7 +152,10 @@ def generate_bus_data():
                 stop_arrival = current_time
                 
                 # Passenger flow based on stop and time
-                hour_multiplier = generate_passenger_pattern(current_time.hour)
+                if demand is None:
+                    hour_multiplier = generate_passenger_pattern(current_time.hour)
+                else:
+                    hour_multiplier = demand[stop['name']][(current_time.hour * 60 + current_time.minute) // 15]
                 base_passengers = max(1, int(stop['avg_passengers'] * hour_multiplier))
                 
                 # Boarding and alighting
@@ -182,7 +227,7 @@ def generate_bus_data():
         
         trip_number += 1
     
-    return pd.DataFrame(data)
+    return data
 
 def create_visualizations(df):
     """Create all required visualizations for the evaluation section"""
@@ -289,33 +334,48 @@ def create_visualizations(df):
     plt.savefig('sensor_analysis.png', dpi=300, bbox_inches='tight')
     plt.close()
 
-def calculate_kpis(df):
-    """Calculate and display Key Performance Indicators"""
+def calculate_kpis(df, store=None):
+    """Calculate and display Key Performance Indicators
+
+    When a KPIStore is given, the KPIs are read from its summary tables
+    instead of being re-aggregated from the raw rows.
+    """
     print("\n=== KEY PERFORMANCE INDICATORS ===\n")
     
+    if store is not None:
+        kpis = store.kpis()
+        max_utilization = kpis['max_utilization']
+        overcrowded_percentage = kpis['overcrowded_percentage']
+        total_alerts = kpis['total_alerts']
+        avg_by_stop = pd.Series([kpis['most_crowded_stop_occupancy']], index=[kpis['most_crowded_stop']])
+        peak_hour = kpis['peak_hour']
+        hourly_avg = pd.Series({peak_hour: kpis['peak_hour_occupancy']})
+        avg_mismatch = kpis['avg_sensor_mismatch']
+    else:
+        max_utilization = df['occupancy_percent'].max()
+        overcrowded_percentage = (df['status'] == 'OVERCROWDED').sum() / len(df) * 100
+        total_alerts = (df['alert_triggered'] == 'Yes').sum()
+        avg_by_stop = df.groupby('stop_name')['occupancy_percent'].mean().sort_values(ascending=False)
+        hourly_avg = df.groupby('hour')['occupancy_percent'].mean()
+        peak_hour = hourly_avg.idxmax()
+        avg_mismatch = df['sensor_mismatch'].mean()
+    
     # 1. Maximum capacity utilization
-    max_utilization = df['occupancy_percent'].max()
     print(f"1. Maximum Capacity Utilization: {max_utilization:.1f}%")
     
     # 2. Percentage of time overcrowded
-    overcrowded_percentage = (df['status'] == 'OVERCROWDED').sum() / len(df) * 100
     print(f"2. Percentage of Journey Time Overcrowded: {overcrowded_percentage:.1f}%")
     
     # 3. Number of alerts
-    total_alerts = (df['alert_triggered'] == 'Yes').sum()
     print(f"3. Total Overcrowding Alerts Triggered: {total_alerts}")
     
     # 4. Most crowded stops
-    avg_by_stop = df.groupby('stop_name')['occupancy_percent'].mean().sort_values(ascending=False)
     print(f"4. Most Crowded Stop: {avg_by_stop.index[0]} ({avg_by_stop.values[0]:.1f}% average occupancy)")
     
     # 5. Peak hours
-    hourly_avg = df.groupby('hour')['occupancy_percent'].mean()
-    peak_hour = hourly_avg.idxmax()
     print(f"5. Peak Hour: {peak_hour}:00 ({hourly_avg[peak_hour]:.1f}% average occupancy)")
     
     # 6. Sensor accuracy
-    avg_mismatch = df['sensor_mismatch'].mean()
     print(f"6. Average Sensor Mismatch: {avg_mismatch:.2f} passengers")
     
     # Save KPIs to file
@@ -0,0 +1,239 @@
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+import time
+
+from bus_data_generator import STATUS_LEVELS
+from binary_records import RecordFile, FLAG_ALERT, encode_records, write_records
+from event_log import build_fleet_history
+from what_if import classify
+
+REPORT_FILE = 'classification_report.txt'
+CSV_CHUNK_ROWS = 500_000
+RECORD_CHUNK_SIZE = 1 << 22
+DIMENSIONS = ['bus_id', 'stop_name', 'hour']
+N_LEVELS = len(STATUS_LEVELS)
+RED_CODE = N_LEVELS - 1
+CELLS = N_LEVELS * N_LEVELS * 2          # true status x reported status x alert flag
+
+# True status of every possible stored count (counts are bytes in the binary format)
+TRUE_STATUS_BY_COUNT = classify(np.arange(256))[2]
+
+class ConfusionAccumulator:
+    """Streaming confusion counts of true status (from actual_count) against reported status and alerts.
+
+    Every record adds one to a (true status, reported status, alert flag)
+    cell for its bus, its stop and its hour, so a chunk costs one bincount
+    per dimension and any number of chunks, CSV or binary, fold into the
+    same arrays. Confusion matrices, per-band precision and recall and
+    alert precision and recall are all sums over those cells.
+    """
+
+    def __init__(self):
+        self.labels = {dim: [] for dim in DIMENSIONS}
+        self._index = {dim: {} for dim in DIMENSIONS}
+        self.counts = {dim: np.zeros((0, CELLS), dtype=np.int64) for dim in DIMENSIONS}
+        self.labels['hour'] = list(range(24))
+        self.counts['hour'] = np.zeros((24, CELLS), dtype=np.int64)
+
+    def _label_codes(self, dim, values):
+        """Accumulator indexes for label values, registering new labels"""
+        codes, uniques = pd.factorize(np.asarray(values))
+        index = self._index[dim]
+        for label in uniques:
+            if label not in index:
+                index[label] = len(self.labels[dim])
+                self.labels[dim].append(label)
+        missing = len(self.labels[dim]) - len(self.counts[dim])
+        if missing > 0:
+            self.counts[dim] = np.concatenate([self.counts[dim], np.zeros((missing, CELLS), dtype=np.int64)])
+        return np.array([index[label] for label in uniques], dtype=np.int64)[codes]
+
+    def add_codes(self, codes, true_status, reported_status, alert):
+        """Add records given accumulator indexes per dimension and status codes"""
+        reported_status = np.asarray(reported_status, dtype=np.int64)
+        if len(reported_status) and (reported_status.min() < 0 or reported_status.max() >= N_LEVELS):
+            raise ValueError("Reported status outside STATUS_LEVELS")
+        cell = (np.asarray(true_status, dtype=np.int64) * N_LEVELS + reported_status) * 2 + np.asarray(alert)
+        for dim in DIMENSIONS:
+            n = len(self.counts[dim])
+            self.counts[dim] += np.bincount(np.asarray(codes[dim], dtype=np.int64) * CELLS + cell,
+                                            minlength=n * CELLS).reshape(n, CELLS)
+        return self
+
+    def add_frame(self, df):
+        """Add records in the generator's CSV schema"""
+        hours = df['hour'].values if 'hour' in df.columns else pd.to_datetime(df['timestamp']).dt.hour.values
+        codes = {'bus_id': self._label_codes('bus_id', df['bus_id'].values),
+                 'stop_name': self._label_codes('stop_name', df['stop_name'].values),
+                 'hour': hours}
+        true_status = TRUE_STATUS_BY_COUNT[np.clip(df['actual_count'].values, 0, 255)]
+        reported = pd.Categorical(df['status'], categories=STATUS_LEVELS).codes
+        return self.add_codes(codes, true_status, reported, df['alert_triggered'].values == 'Yes')
+
+    def add_records(self, records, meta):
+        """Add a chunk of a binary record file (RECORD_DTYPE) with its lookup tables"""
+        bus_codes = self._label_codes('bus_id', meta['bus_ids'])
+        stop_codes = self._label_codes('stop_name', [s['name'] for s in meta['stops']])
+        codes = {'bus_id': bus_codes[records['bus_id']],
+                 'stop_name': stop_codes[records['stop_id']],
+                 'hour': (records['timestamp'] // 3600) % 24}
+        return self.add_codes(codes, TRUE_STATUS_BY_COUNT[records['actual_count']], records['status'],
+                              (records['flags'] & FLAG_ALERT) > 0)
+
+    @classmethod
+    def from_csv(cls, path, chunk_rows=CSV_CHUNK_ROWS):
+        accumulator = cls()
+        columns = ['timestamp', 'bus_id', 'stop_name', 'actual_count', 'status', 'alert_triggered']
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_rows):
+            accumulator.add_frame(chunk)
+        return accumulator
+
+    @classmethod
+    def from_record_file(cls, record_file, chunk_size=RECORD_CHUNK_SIZE):
+        accumulator = cls()
+        for chunk in record_file.chunks(chunk_size):
+            accumulator.add_records(chunk, record_file.meta)
+        return accumulator
+
+    @property
+    def records(self):
+        return int(self.counts['hour'].sum())
+
+    def _cells(self, by=None):
+        """(labels x) true x reported x alert counts"""
+        counts = self.counts['hour'].sum(axis=0) if by is None else self.counts[by]
+        return counts.reshape(counts.shape[:-1] + (N_LEVELS, N_LEVELS, 2))
+
+    def confusion(self, by=None, label=None):
+        """True status (rows) x reported status (columns), overall or for one label of a dimension"""
+        cells = self._cells(by)
+        if by is not None:
+            cells = cells[self._index[by][label]] if by != 'hour' else cells[label]
+        return pd.DataFrame(cells.sum(axis=-1), index=pd.Index(STATUS_LEVELS, name='true'),
+                            columns=pd.Index(STATUS_LEVELS, name='reported'))
+
+    def band_metrics(self):
+        """Precision, recall and F1 of each occupancy band"""
+        matrix = self.confusion().values
+        hits = np.diag(matrix)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            precision = hits / matrix.sum(axis=0)
+            recall = hits / matrix.sum(axis=1)
+            f1 = 2 * precision * recall / (precision + recall)
+        return pd.DataFrame({'true_records': matrix.sum(axis=1), 'reported_records': matrix.sum(axis=0),
+                             'precision': precision, 'recall': recall, 'f1': f1},
+                            index=pd.Index(STATUS_LEVELS, name='band'))
+
+    def summary(self):
+        """Accuracy, Cohen's kappa and macro F1 of the status classification"""
+        matrix = self.confusion().values
+        n = matrix.sum()
+        accuracy = np.trace(matrix) / n
+        chance = (matrix.sum(axis=0) * matrix.sum(axis=1)).sum() / n ** 2
+        return {'records': int(n), 'accuracy': accuracy, 'kappa': (accuracy - chance) / (1 - chance),
+                'macro_f1': self.band_metrics()['f1'].mean()}
+
+    def alert_metrics(self, by=None):
+        """Alert precision and recall against true overcrowding (actual_count at or above the red line),
+        overall (one row) or per label of a dimension"""
+        cells = self._cells(by)
+        if by is None:
+            cells = cells[None]
+        true_red = cells[:, RED_CODE].sum(axis=(1, 2))
+        alerts = cells[..., 1].sum(axis=(1, 2))
+        hits = cells[:, RED_CODE, :, 1].sum(axis=1)
+        records = cells.sum(axis=(1, 2, 3))
+        correct = np.trace(cells.sum(axis=-1), axis1=1, axis2=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table = pd.DataFrame({
+                'records': records,
+                'true_overcrowded': true_red,
+                'alerts': alerts,
+                'missed': true_red - hits,
+                'false_alerts': alerts - hits,
+                'precision': hits / alerts,
+                'recall': hits / true_red,
+                'status_accuracy': correct / records,
+            }, index=pd.Index(['all'] if by is None else self.labels[by], name=by or 'scope'))
+        return table[table['records'] > 0]
+
+def write_report(accumulator, path=REPORT_FILE, worst=5):
+    summary = accumulator.summary()
+    alerts = accumulator.alert_metrics().iloc[0]
+    with open(path, 'w') as f:
+        f.write("STATUS CLASSIFICATION REPORT - Smart Bus Overcrowding Detection System\n")
+        f.write("=" * 60 + "\n\n")
+        f.write(f"{summary['records']:,} records; true status from actual_count, reported from status\n\n")
+        f.write(f"1. Status accuracy: {summary['accuracy']:.2%} (Cohen's kappa {summary['kappa']:.3f}, "
+                f"macro F1 {summary['macro_f1']:.3f})\n")
+        f.write(f"2. Alert precision: {alerts['precision']:.2%}, recall: {alerts['recall']:.2%} "
+                f"({alerts['missed']:,.0f} missed, {alerts['false_alerts']:,.0f} false)\n\n")
+        f.write("Confusion matrix (rows: true, columns: reported)\n")
+        f.write(accumulator.confusion().to_string() + "\n\n")
+        f.write("Per band\n")
+        f.write(accumulator.band_metrics().round(4).to_string() + "\n")
+        for dim in DIMENSIONS:
+            table = accumulator.alert_metrics(by=dim).dropna(subset=['recall'])
+            f.write(f"\nLowest alert recall by {dim}\n")
+            f.write(table.nsmallest(worst, 'recall')[['records', 'true_overcrowded', 'missed', 'false_alerts',
+                                                      'precision', 'recall']].round(4).to_string() + "\n")
+
+def main():
+    """Check reported status and alerts against true occupancy, from CSV and at scale from binary records"""
+    print("Status Classification Accuracy Report")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    # 1. Stored dataset, read in chunks
+    accumulator = ConfusionAccumulator.from_csv('bus_overcrowding_data.csv')
+    summary = accumulator.summary()
+    print(f"1. {summary['records']} records: status accuracy {summary['accuracy']:.1%}, "
+          f"kappa {summary['kappa']:.3f}, macro F1 {summary['macro_f1']:.3f}")
+    bands = accumulator.band_metrics()
+    print("   Per band (precision/recall): " + ", ".join(
+        f"{band} {row['precision']:.0%}/{row['recall']:.0%}" for band, row in bands.iterrows()))
+    expected = pd.crosstab(pd.Categorical(np.asarray(STATUS_LEVELS)[TRUE_STATUS_BY_COUNT[df['actual_count']]],
+                                          categories=STATUS_LEVELS),
+                           pd.Categorical(df['status'], categories=STATUS_LEVELS), dropna=False)
+    print(f"   Confusion matrix matches raw crosstab: {bool((expected.values == accumulator.confusion().values).all())}")
+
+    # 2. Alerts against true overcrowding
+    alerts = accumulator.alert_metrics().iloc[0]
+    print(f"2. Alerts: precision {alerts['precision']:.1%}, recall {alerts['recall']:.1%} "
+          f"({alerts['missed']:,.0f} missed, {alerts['false_alerts']:,.0f} false of {alerts['alerts']:,.0f} alerts)")
+    by_stop = accumulator.alert_metrics(by='stop_name').dropna(subset=['recall'])
+    print("   Lowest recall stops: " + ", ".join(
+        f"{stop} {row['recall']:.0%}" for stop, row in by_stop.nsmallest(3, 'recall').iterrows()))
+    write_report(accumulator)
+
+    # 3. Fleet scale: chunked scan of a memory-mapped binary record file
+    fleet = build_fleet_history(df, n_buses=300, n_days=30)
+    records, meta = encode_records(fleet)
+    n_copies = 10
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'fleet.sbr')
+        write_records(path, np.tile(records, n_copies), meta)
+        record_file = RecordFile(path)
+        start = time.perf_counter()
+        large = ConfusionAccumulator.from_record_file(record_file)
+        elapsed = time.perf_counter() - start
+        print(f"3. Scanned {large.records:,} binary records in {elapsed:.2f}s "
+              f"({large.records / elapsed / 1e6:.1f}M records/s) into {len(large.labels['bus_id'])} bus, "
+              f"{len(large.labels['stop_name'])} stop and 24 hour confusion matrices")
+        scaled = (large.confusion().values == accumulator.confusion().values * 300 * 30 * n_copies).all()
+        print(f"   Matches the stored dataset's matrix x {300 * 30 * n_copies:,} copies: {bool(scaled)}")
+        del record_file
+
+    print(f"\nReport saved to '{REPORT_FILE}'")
+
+if __name__ == "__main__":
+    main()
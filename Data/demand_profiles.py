@@ -0,0 +1,156 @@
+import pandas as pd
+import numpy as np
+import random
+import time
+
+from bus_data_generator import ROUTE_STOPS, generate_bus_data, generate_passenger_pattern
+from timetable import load_timetable, TravelTimeTable, generate_timetabled_data, TIMETABLE_FILE, TRAVEL_TIME_FILE
+
+# Calendar day types, in the order of the profile array's second axis
+DAY_TYPES = ['school_weekday', 'weekday', 'saturday', 'sunday', 'holiday']
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# Sri Lankan public and bank holidays for 2024 (Poya days, national and religious holidays)
+PUBLIC_HOLIDAYS = pd.to_datetime([
+    '2024-01-15', '2024-01-25', '2024-02-04', '2024-02-23', '2024-03-08', '2024-03-24', '2024-03-29',
+    '2024-04-11', '2024-04-12', '2024-04-13', '2024-04-14', '2024-04-23', '2024-05-01', '2024-05-23',
+    '2024-05-24', '2024-06-17', '2024-06-21', '2024-07-20', '2024-08-19', '2024-09-16', '2024-09-17',
+    '2024-10-17', '2024-10-31', '2024-11-15', '2024-12-14', '2024-12-25',
+])
+
+# School terms (first and last day); replace with the published calendar for the year simulated
+SCHOOL_TERMS = [('2024-01-02', '2024-04-05'), ('2024-04-22', '2024-08-09'), ('2024-09-02', '2024-12-13')]
+
+# How strongly each kind of stop responds to each day type (school_weekday, weekday, saturday, sunday, holiday)
+STOP_KINDS = {'Colombo Fort': 'commuter', 'Pettah': 'market', 'Maradana': 'commuter',
+              'Borella': 'school', 'Narahenpita': 'residential', 'Nugegoda': 'residential'}
+DAY_TYPE_FACTORS = {
+    'commuter':    (1.0, 0.95, 0.6, 0.4, 0.45),
+    'market':      (1.0, 1.0, 1.2, 0.8, 0.6),
+    'school':      (1.0, 0.8, 0.7, 0.5, 0.5),
+    'residential': (1.0, 0.95, 0.85, 0.7, 0.75),
+}
+SCHOOL_PEAKS = [(6.5, 7.5, 0.4), (13.25, 14.5, 0.35)]    # (start hour, end hour, extra multiplier) at school stops
+
+def weekday_curve():
+    """generate_passenger_pattern in 15-minute slots: the generator's weekday"""
+    return np.repeat([generate_passenger_pattern(h) for h in range(24)], 60 // SLOT_MINUTES).astype(float)
+
+def weekend_curve(peak_hour=12.5, width=3.5, floor=0.3, height=0.9):
+    """Single midday hump for weekend and holiday travel; outside service hours the
+    generator's off-peak multiplier (0.3) applies, as on weekdays"""
+    hours = np.arange(SLOTS_PER_DAY) * SLOT_MINUTES / 60
+    curve = floor + height * np.exp(-((hours - peak_hour) / width) ** 2)
+    return np.where((hours >= 5) & (hours < 23), curve, 0.3)
+
+class DemandProfiles:
+    """Demand multipliers by stop, calendar day type and 15-minute slot.
+
+    The multipliers are one precomputed stops x day types x slots array, so
+    a multiplier for any record is an array index: vectorized simulators
+    index it with whole columns of stops, day types and slots, and the
+    scalar generator takes one day's stops x slots table as nested lists.
+    The calendar (holidays and school terms) decides each date's day type.
+    """
+
+    def __init__(self, multipliers, stop_names, holidays=PUBLIC_HOLIDAYS, school_terms=SCHOOL_TERMS):
+        multipliers = np.asarray(multipliers, dtype=float)
+        if multipliers.shape != (len(stop_names), len(DAY_TYPES), SLOTS_PER_DAY):
+            raise ValueError(f"Expected a {len(stop_names)} x {len(DAY_TYPES)} x {SLOTS_PER_DAY} array")
+        if (multipliers < 0).any():
+            raise ValueError("Multipliers must be non-negative")
+        self.multipliers = multipliers
+        self.stop_names = list(stop_names)
+        self.stop_index = {name: i for i, name in enumerate(self.stop_names)}
+        self.holidays = pd.DatetimeIndex(holidays).normalize()
+        self.school_terms = [(pd.Timestamp(first), pd.Timestamp(last)) for first, last in school_terms]
+
+    @classmethod
+    def default(cls, stop_names=None, **calendar):
+        """Profiles for the route stops (or any stop names; unknown stops count as residential)"""
+        stop_names = stop_names or [s['name'] for s in ROUTE_STOPS]
+        hours = np.arange(SLOTS_PER_DAY) * SLOT_MINUTES / 60
+        school_bump = sum(np.where((hours >= start) & (hours < end), extra, 0.0) for start, end, extra in SCHOOL_PEAKS)
+        weekday, weekend = weekday_curve(), weekend_curve()
+        shapes = np.stack([weekday, weekday, weekend, weekend, weekend])
+
+        multipliers = np.empty((len(stop_names), len(DAY_TYPES), SLOTS_PER_DAY))
+        for i, name in enumerate(stop_names):
+            kind = STOP_KINDS.get(name, 'residential')
+            multipliers[i] = shapes * np.array(DAY_TYPE_FACTORS[kind])[:, None]
+            if kind == 'school':
+                multipliers[i, DAY_TYPES.index('school_weekday')] += school_bump
+        return cls(multipliers, stop_names, **calendar)
+
+    def day_type_codes(self, dates):
+        """Index into DAY_TYPES for each date: holidays first, then weekends, then school terms"""
+        dates = pd.DatetimeIndex(pd.to_datetime(dates)).normalize()
+        in_term = np.zeros(len(dates), dtype=bool)
+        for first, last in self.school_terms:
+            in_term |= (dates >= first) & (dates <= last)
+        codes = np.where(in_term, DAY_TYPES.index('school_weekday'), DAY_TYPES.index('weekday'))
+        codes = np.where(dates.weekday == 5, DAY_TYPES.index('saturday'), codes)
+        codes = np.where(dates.weekday == 6, DAY_TYPES.index('sunday'), codes)
+        return np.where(dates.isin(self.holidays), DAY_TYPES.index('holiday'), codes)
+
+    def lookup(self, stop_ids, day_type_codes, seconds_of_day):
+        """Multipliers for arrays of stop indices, day type codes and times (seconds from midnight)"""
+        slots = (np.asarray(seconds_of_day) // (SLOT_MINUTES * 60)).astype(np.int64) % SLOTS_PER_DAY
+        return self.multipliers[stop_ids, day_type_codes, slots]
+
+    def day_table(self, date):
+        """Stop name -> list of slot multipliers for one date, for per-record lookups in scalar code"""
+        code = self.day_type_codes([date])[0]
+        return dict(zip(self.stop_names, self.multipliers[:, code, :].tolist()))
+
+def main():
+    """Build calendar demand profiles and generate multi-week data with them"""
+    print("Calendar Demand Profiles")
+    print("=" * 50)
+
+    # 1. Profiles and the 2024 calendar
+    profiles = DemandProfiles.default()
+    dates = pd.date_range('2024-01-01', '2024-12-31')
+    codes = profiles.day_type_codes(dates)
+    counts = pd.Series(np.asarray(DAY_TYPES)[codes]).value_counts().reindex(DAY_TYPES)
+    print(f"1. {profiles.multipliers.shape[0]} stops x {len(DAY_TYPES)} day types x {SLOTS_PER_DAY} slots "
+          f"({profiles.multipliers.nbytes / 1024:.0f} KiB); 2024: " +
+          ", ".join(f"{n} {t}" for t, n in counts.items()))
+
+    # 2. The scalar generator over four weeks: a table lookup costs no more than the if-chain
+    timings = {}
+    for label, kwargs in (('hourly pattern', {}), ('calendar profiles', {'profiles': profiles})):
+        random.seed(0)
+        start = time.perf_counter()
+        weeks = generate_bus_data(start_date='2024-02-05', days=28, **kwargs)
+        timings[label] = (time.perf_counter() - start, len(weeks))
+    print("2. generate_bus_data, 28 days: " + ", ".join(
+        f"{label} {seconds:.2f}s ({seconds / rows * 1e6:.0f} us/record)" for label, (seconds, rows) in timings.items()))
+
+    # 3. A year of timetabled service, vectorized, with and without profiles
+    timetable = load_timetable(TIMETABLE_FILE)
+    travel_times = TravelTimeTable.from_csv(TRAVEL_TIME_FILE)
+    start = time.perf_counter()
+    generate_timetabled_data(timetable, travel_times, start_date='2024-01-01', days=366)
+    plain_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    year = generate_timetabled_data(timetable, travel_times, start_date='2024-01-01', days=366, profiles=profiles)
+    profile_seconds = time.perf_counter() - start
+    print(f"3. Timetabled 2024 ({len(year):,} records): {plain_seconds:.2f}s hourly pattern, "
+          f"{profile_seconds:.2f}s with calendar profiles")
+
+    # 4. Weekly seasonality and day-type effects
+    dates = year['timestamp'].dt.normalize()
+    year['day_type'] = np.asarray(DAY_TYPES)[profiles.day_type_codes(dates)]
+    daily = year.groupby(dates).agg(boardings=('boarding', 'sum'), day_type=('day_type', 'first'))
+    by_weekday = daily.groupby(daily.index.day_name())['boardings'].mean()
+    by_weekday = by_weekday.reindex(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+    print("4. Mean daily boardings by weekday: " + ", ".join(f"{d[:3]} {v:,.0f}" for d, v in by_weekday.items()))
+    by_type = daily.groupby('day_type')['boardings'].mean().reindex(DAY_TYPES)
+    print("   By day type: " + ", ".join(f"{t} {v:,.0f}" for t, v in by_type.items()))
+    peak = year.groupby(['day_type', 'hour'])['occupancy_percent'].mean().groupby(level='day_type').idxmax()
+    print("   Peak hour: " + ", ".join(f"{t} {peak[t][1]}:00" for t in DAY_TYPES))
+
+if __name__ == "__main__":
+    main()
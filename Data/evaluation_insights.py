@@ -1,358 +1,221 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime, timedelta
 import random
+import time
+import json
+import os
+import shutil
+from scipy import stats
 
-# Bus route information
-ROUTE_STOPS = [
-    {"name": "Colombo Fort", "lat": 6.9271, "lon": 79.8612, "avg_passengers": 35},
-    {"name": "Pettah", "lat": 6.9356, "lon": 79.8487, "avg_passengers": 42},
-    {"name": "Maradana", "lat": 6.9287, "lon": 79.8631, "avg_passengers": 38},
-    {"name": "Borella", "lat": 6.9146, "lon": 79.8779, "avg_passengers": 30},
-    {"name": "Narahenpita", "lat": 6.9015, "lon": 79.8772, "avg_passengers": 25},
-    {"name": "Nugegoda", "lat": 6.8649, "lon": 79.8997, "avg_passengers": 15}
-]
+from bus_data_generator import generate_bus_data
+from rollup_cube import RollupCube
+from what_if import reclassify
 
-# Constants from the Arduino code
-MAX_CAPACITY = 50
-NORMAL_THRESHOLD = 0.4  # <40% is undercrowded
-YELLOW_THRESHOLD = 0.6  # 60% nearly full
-RED_THRESHOLD = 0.8     # 80% overcrowded
+# Each run's aggregates are cached as a rollup cube under this directory
+RUNS_DIR = 'evaluation_runs'
+REPORT_FILE = 'run_comparison_report.txt'
+SOURCE_FILE = 'source.json'
 
-def get_status(occupancy_percent):
-    """Determine bus status based on occupancy percentage"""
-    if occupancy_percent < NORMAL_THRESHOLD * 100:
-        return "UNDERCROWDED"
-    elif occupancy_percent < YELLOW_THRESHOLD * 100:
-        return "NORMAL"
-    elif occupancy_percent < RED_THRESHOLD * 100:
-        return "NEARLY_FULL"
-    else:
-        return "OVERCROWDED"
+# Significance level after Benjamini-Hochberg adjustment across all cells
+ALPHA = 0.05
 
-def generate_passenger_pattern(hour):
-    """Generate realistic passenger patterns based on time of day"""
-    # Morning rush: 7-9 AM
-    if 7 <= hour <= 9:
-        base_multiplier = 1.5
-    # Evening rush: 5-7 PM
-    elif 17 <= hour <= 19:
-        base_multiplier = 1.4
-    # Mid-day: 11 AM - 2 PM
-    elif 11 <= hour <= 14:
-        base_multiplier = 0.8
-    # Early morning: 5-7 AM
-    elif 5 <= hour <= 7:
-        base_multiplier = 0.6
-    # Late evening: 8-10 PM
-    elif 20 <= hour <= 22:
-        base_multiplier = 0.4
-    else:
-        base_multiplier = 0.3
-    
-    return base_multiplier
+KPI_LABELS = {
+    'avg_utilization': 'Average Utilization (%)',
+    'max_utilization': 'Maximum Capacity Utilization (%)',
+    'overcrowded_percentage': 'Journey Time Overcrowded (%)',
+    'total_alerts': 'Total Overcrowding Alerts',
+    'alerts_per_1000_stops': 'Alerts per 1000 Stop Visits',
+    'total_passengers': 'Total Passengers',
+    'avg_sensor_mismatch': 'Average Sensor Mismatch (passengers)',
+}
 
-def simulate_sensor_readings(actual_count):
-    """Simulate IR and camera sensor readings with realistic variations"""
-    # IR sensor is generally accurate but might miss in crowded conditions
-    if actual_count > 40:
-        ir_variation = random.randint(-2, 1)
-    else:
-        ir_variation = random.randint(-1, 1)
-    
-    ir_count = max(0, min(MAX_CAPACITY, actual_count + ir_variation))
-    
-    # Camera accuracy varies based on crowding
-    if actual_count > 40:
-        camera_accuracy = random.uniform(0.85, 0.95)
-    else:
-        camera_accuracy = random.uniform(0.90, 0.98)
-    
-    camera_variation = int(actual_count * (1 - camera_accuracy))
-    camera_count = max(0, min(MAX_CAPACITY + 3, actual_count + random.randint(-camera_variation, camera_variation + 2)))
-    
-    # Sensor fusion (70% camera, 30% IR when crowded)
-    if abs(camera_count - ir_count) <= 2:
-        validated_count = round(0.7 * camera_count + 0.3 * ir_count)
-    elif actual_count > 30:
-        validated_count = camera_count
-    else:
-        validated_count = ir_count
-    
-    validated_count = max(0, min(MAX_CAPACITY, validated_count))
-    
-    return ir_count, camera_count, validated_count
+def generate_run(n_days, n_buses, start_date='2024-01-01', seed=0):
+    """Several buses over several days from the one-day generator, each bus-day independent"""
+    random.seed(seed)
+    frames = []
+    for day in range(n_days):
+        for bus in range(n_buses):
+            bus_day = generate_bus_data()
+            bus_day['timestamp'] = bus_day['timestamp'] - bus_day['timestamp'].dt.normalize() + \
+                pd.Timestamp(start_date) + pd.Timedelta(days=day)
+            bus_day['bus_id'] = f"BUS-138-{bus:04d}"
+            frames.append(bus_day)
+    df = pd.concat(frames, ignore_index=True)
+    df['hour'] = df['timestamp'].dt.hour
+    return df
+
+def apply_fusion_rule(df, camera_weight):
+    """Re-fuse IR and camera counts with a fixed camera weight and reclassify every row"""
+    fused = camera_weight * df['camera_count'] + (1 - camera_weight) * df['ir_sensor_count']
+    return reclassify(df.assign(validated_count=np.round(fused).astype(int)))
+
+def cache_run(name, df, source, runs_dir=RUNS_DIR):
+    """Aggregate a dataset once into a fresh cube for the run; later comparisons read only the cube.
 
-def generate_bus_data():
-    """Generate realistic bus operation data for a full day"""
-    data = []
-    
-    # Simulate one full day of operation (5 AM to 11 PM)
-    start_time = datetime(2024, 1, 15, 5, 0, 0)  # Monday
-    
-    # Multiple trips throughout the day
-    current_time = start_time
-    trip_number = 1
-    
-    while current_time.hour < 23:
-        # One complete trip (forward and backward)
-        for direction in ['Forward', 'Backward']:
-            stops = ROUTE_STOPS if direction == 'Forward' else ROUTE_STOPS[::-1]
-            
-            # Initialize passenger count for this trip
-            if direction == 'Forward':
-                passenger_count = random.randint(5, 15)  # Start with some passengers
-            
-            for stop_idx, stop in enumerate(stops):
-                # Time at stop
-                stop_arrival = current_time
-                
-                # Passenger flow based on stop and time
-                hour_multiplier = generate_passenger_pattern(current_time.hour)
-                base_passengers = max(1, int(stop['avg_passengers'] * hour_multiplier))
-                
-                # Boarding and alighting
-                if stop_idx == 0:  # First stop
-                    boarding = max(1, min(random.randint(base_passengers - 5, base_passengers + 5), MAX_CAPACITY - passenger_count))
-                    alighting = 0
-                elif stop_idx == len(stops) - 1:  # Last stop
-                    boarding = 0
-                    alighting = passenger_count
-                else:
-                    # Ensure we have passengers before trying to alight
-                    if passenger_count > 2:
-                        alighting = random.randint(2, min(10, passenger_count))
-                    elif passenger_count > 0:
-                        alighting = random.randint(0, passenger_count)
-                    else:
-                        alighting = 0
-                    # Calculate available space
-                    available_space = MAX_CAPACITY - passenger_count + alighting
-                    # Calculate boarding range
-                    min_boarding = max(0, base_passengers - 8)
-                    max_boarding = min(base_passengers + 8, available_space)
-                    
-                    # Ensure valid range
-                    if min_boarding > max_boarding:
-                        boarding = min(available_space, base_passengers)
-                    else:
-                        boarding = random.randint(min_boarding, max_boarding)
-                
-                passenger_count = passenger_count - alighting + boarding
-                passenger_count = max(0, min(MAX_CAPACITY, passenger_count))
-                
-                # Simulate sensor readings
-                ir_count, camera_count, validated_count = simulate_sensor_readings(passenger_count)
-                
-                # Calculate occupancy and status
-                occupancy_percent = (validated_count / MAX_CAPACITY) * 100
-                status = get_status(occupancy_percent)
-                
-                # Determine if alert triggered
-                alert_triggered = "Yes" if status == "OVERCROWDED" else "No"
-                
-                # Record data
-                data.append({
-                    'timestamp': stop_arrival,
-                    'trip_number': trip_number,
-                    'direction': direction,
-                    'bus_id': 'BUS-138-CMB',
-                    'stop_name': stop['name'],
-                    'latitude': stop['lat'],
-                    'longitude': stop['lon'],
-                    'boarding': boarding,
-                    'alighting': alighting,
-                    'ir_sensor_count': ir_count,
-                    'camera_count': camera_count,
-                    'validated_count': validated_count,
-                    'actual_count': passenger_count,
-                    'occupancy_percent': round(occupancy_percent, 2),
-                    'status': status,
-                    'alert_triggered': alert_triggered,
-                    'sensor_mismatch': abs(camera_count - ir_count)
-                })
-                
-                # Move to next stop (3-5 minutes travel time)
-                current_time += timedelta(minutes=random.randint(3, 5))
-            
-            # Break between trips (5-10 minutes)
-            current_time += timedelta(minutes=random.randint(5, 10))
-        
-        trip_number += 1
-    
-    return pd.DataFrame(data)
+    `source` describes how the data was produced (e.g. generator settings) and
+    is stored with the cube, together with the row count and time range, so
+    load_run can tell when the cube no longer matches its data.
+    """
+    path = os.path.join(runs_dir, name)
+    # Cubes only ever add, so rebuilding into an old cube would double-count
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    cube = RollupCube(path)
+    for _, day in df.groupby(df['timestamp'].dt.date):
+        cube.ingest(day)
 
-def create_visualizations(df):
-    """Create all required visualizations for the evaluation section"""
-    
-    # Set style - handle different matplotlib versions
+    fingerprint = {'source': source, 'rows': len(df),
+                   'first': str(df['timestamp'].min()), 'last': str(df['timestamp'].max())}
+    with open(os.path.join(path, SOURCE_FILE), 'w') as f:
+        json.dump(fingerprint, f)
+    return cube
+
+def load_run(name, source, runs_dir=RUNS_DIR):
+    """The run's cached cube, or None if it is missing or was built from a different source"""
+    path = os.path.join(runs_dir, name)
     try:
-        plt.style.use('seaborn-v0_8-darkgrid')
-    except:
-        try:
-            plt.style.use('seaborn-darkgrid')
-        except:
-            plt.style.use('default')
-    
-    sns.set_palette("husl")
-    
-    # 1. Passenger Count Over Time (Line Graph)
-    plt.figure(figsize=(14, 6))
-    hourly_avg = df.groupby('hour')['validated_count'].mean()
-    
-    plt.subplot(1, 2, 1)
-    plt.plot(hourly_avg.index, hourly_avg.values, marker='o', linewidth=2, markersize=8)
-    plt.fill_between(hourly_avg.index, hourly_avg.values, alpha=0.3)
-    plt.axhline(y=MAX_CAPACITY * RED_THRESHOLD, color='red', linestyle='--', label='Overcrowded Threshold')
-    plt.axhline(y=MAX_CAPACITY * YELLOW_THRESHOLD, color='orange', linestyle='--', label='Nearly Full Threshold')
-    plt.xlabel('Hour of Day')
-    plt.ylabel('Average Passenger Count')
-    plt.title('Average Passenger Count Throughout the Day')
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    
-    # 2. Peak Hours Analysis
-    plt.subplot(1, 2, 2)
-    peak_hours = df[df['occupancy_percent'] > 80].groupby('hour').size()
-    if not peak_hours.empty:
-        plt.bar(peak_hours.index, peak_hours.values, color='red', alpha=0.7)
-        plt.xlabel('Hour of Day')
-        plt.ylabel('Number of Overcrowding Events')
-        plt.title('Overcrowding Events by Hour')
-    
-    plt.tight_layout()
-    plt.savefig('passenger_count_analysis.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    
-    # 3. Bus Stop Crowding Heatmap
-    plt.figure(figsize=(12, 8))
-    pivot_data = df.pivot_table(values='occupancy_percent', index='stop_name', columns='hour', aggfunc='mean')
-    
-    # Reorder stops in route order
-    stop_order = [stop['name'] for stop in ROUTE_STOPS]
-    pivot_data = pivot_data.reindex(stop_order)
-    
-    sns.heatmap(pivot_data, cmap='YlOrRd', annot=True, fmt='.0f', cbar_kws={'label': 'Occupancy %'})
-    plt.title('Average Occupancy Percentage by Stop and Hour')
-    plt.xlabel('Hour of Day')
-    plt.ylabel('Bus Stop')
-    plt.tight_layout()
-    plt.savefig('stop_crowding_heatmap.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    
-    # 4. Status Distribution (Pie Chart)
-    plt.figure(figsize=(10, 5))
-    
-    plt.subplot(1, 2, 1)
-    status_counts = df['status'].value_counts()
-    colors = {'UNDERCROWDED': '#90EE90', 'NORMAL': '#87CEEB', 'NEARLY_FULL': '#FFD700', 'OVERCROWDED': '#FF6B6B'}
-    plt.pie(status_counts.values, labels=status_counts.index, autopct='%1.1f%%', 
-            colors=[colors[status] for status in status_counts.index])
-    plt.title('Distribution of Bus Status Throughout Day')
-    
-    # 5. Alert Analysis by Stop
-    plt.subplot(1, 2, 2)
-    alerts_by_stop = df[df['alert_triggered'] == 'Yes'].groupby('stop_name').size()
-    if not alerts_by_stop.empty:
-        alerts_by_stop = alerts_by_stop.reindex(stop_order, fill_value=0)
-        plt.bar(range(len(alerts_by_stop)), alerts_by_stop.values, 
-                color=['red' if x > 0 else 'green' for x in alerts_by_stop.values])
-        plt.xticks(range(len(alerts_by_stop)), alerts_by_stop.index, rotation=45, ha='right')
-        plt.xlabel('Bus Stop')
-        plt.ylabel('Number of Alerts')
-        plt.title('Overcrowding Alerts by Stop')
-    
-    plt.tight_layout()
-    plt.savefig('status_and_alerts.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    
-    # 6. Sensor Accuracy Analysis
-    plt.figure(figsize=(12, 5))
-    
-    plt.subplot(1, 2, 1)
-    plt.scatter(df['ir_sensor_count'], df['camera_count'], alpha=0.5, s=30)
-    plt.plot([0, MAX_CAPACITY], [0, MAX_CAPACITY], 'r--', label='Perfect Agreement')
-    plt.xlabel('IR Sensor Count')
-    plt.ylabel('Camera Count')
-    plt.title('IR Sensor vs Camera Count Comparison')
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    
-    plt.subplot(1, 2, 2)
-    mismatch_by_occupancy = df.groupby(pd.cut(df['occupancy_percent'], 
-                                              bins=[0, 40, 60, 80, 100]))['sensor_mismatch'].mean()
-    mismatch_by_occupancy.plot(kind='bar', color='orange')
-    plt.xlabel('Occupancy Percentage Range')
-    plt.ylabel('Average Sensor Mismatch')
-    plt.title('Sensor Mismatch vs Occupancy Level')
-    plt.xticks(rotation=45)
-    
-    plt.tight_layout()
-    plt.savefig('sensor_analysis.png', dpi=300, bbox_inches='tight')
-    plt.close()
+        with open(os.path.join(path, SOURCE_FILE)) as f:
+            fingerprint = json.load(f)
+    except FileNotFoundError:
+        return None
+    if fingerprint['source'] != json.loads(json.dumps(source)):
+        return None
+    return RollupCube(path)
+
+def run_kpis(cube):
+    """Headline KPIs of one run from its cube"""
+    summary = cube.kpi_summary()
+    records = cube.query()['records'].sum()
+    kpis = {key: summary[key] for key in KPI_LABELS if key in summary}
+    kpis['alerts_per_1000_stops'] = summary['total_alerts'] / records * 1000
+    return kpis
+
+def compare_kpis(runs, baseline=None):
+    """KPI table with one column per run plus deltas against the baseline run"""
+    baseline = baseline or next(iter(runs))
+    table = pd.DataFrame({name: run_kpis(cube) for name, cube in runs.items()}).reindex(list(KPI_LABELS))
+    for name in runs:
+        if name != baseline:
+            table[f"delta {name}"] = table[name] - table[baseline]
+            table[f"delta% {name}"] = (table[name] / table[baseline] - 1) * 100
+    table.index = [KPI_LABELS[k] for k in table.index]
+    return table
+
+def benjamini_hochberg(p_values):
+    """False-discovery-rate adjusted p-values"""
+    p = np.asarray(p_values, dtype=np.float64)
+    order = np.argsort(p)
+    ranked = p[order] * len(p) / np.arange(1, len(p) + 1)
+    adjusted = np.minimum.accumulate(ranked[::-1])[::-1]
+    result = np.empty_like(p)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+def compare_cells(base, other, by=('stop', 'hour'), alpha=ALPHA):
+    """Per-cell deltas with Welch's t-test on occupancy and a two-proportion z-test on alert rate.
+
+    Means and variances come from the cubes' records, occupancy sums and
+    squared sums, so no raw rows are read.
+    """
+    by = list(by)
+    columns = ['records', 'occupancy_sum', 'occupancy_sq_sum', 'alerts']
+    a = base.query(by)[columns]
+    b = other.query(by)[columns]
+    cells = a.join(b, how='inner', lsuffix='_base', rsuffix='_run')
+    n1, n2 = cells['records_base'], cells['records_run']
+
+    mean1, mean2 = cells['occupancy_sum_base'] / n1, cells['occupancy_sum_run'] / n2
+    var1 = np.maximum(cells['occupancy_sq_sum_base'] - n1 * mean1 ** 2, 0) / np.maximum(n1 - 1, 1)
+    var2 = np.maximum(cells['occupancy_sq_sum_run'] - n2 * mean2 ** 2, 0) / np.maximum(n2 - 1, 1)
+    se1, se2 = var1 / n1, var2 / n2
+    se = np.sqrt(se1 + se2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = (mean2 - mean1) / se
+        dof = (se1 + se2) ** 2 / (se1 ** 2 / np.maximum(n1 - 1, 1) + se2 ** 2 / np.maximum(n2 - 1, 1))
+    occupancy_p = np.where(se > 0, 2 * stats.t.sf(np.abs(t), dof), 1.0)
 
-def calculate_kpis(df):
-    """Calculate and display Key Performance Indicators"""
-    print("\n=== KEY PERFORMANCE INDICATORS ===\n")
-    
-    # 1. Maximum capacity utilization
-    max_utilization = df['occupancy_percent'].max()
-    print(f"1. Maximum Capacity Utilization: {max_utilization:.1f}%")
-    
-    # 2. Percentage of time overcrowded
-    overcrowded_percentage = (df['status'] == 'OVERCROWDED').sum() / len(df) * 100
-    print(f"2. Percentage of Journey Time Overcrowded: {overcrowded_percentage:.1f}%")
-    
-    # 3. Number of alerts
-    total_alerts = (df['alert_triggered'] == 'Yes').sum()
-    print(f"3. Total Overcrowding Alerts Triggered: {total_alerts}")
-    
-    # 4. Most crowded stops
-    avg_by_stop = df.groupby('stop_name')['occupancy_percent'].mean().sort_values(ascending=False)
-    print(f"4. Most Crowded Stop: {avg_by_stop.index[0]} ({avg_by_stop.values[0]:.1f}% average occupancy)")
-    
-    # 5. Peak hours
-    hourly_avg = df.groupby('hour')['occupancy_percent'].mean()
-    peak_hour = hourly_avg.idxmax()
-    print(f"5. Peak Hour: {peak_hour}:00 ({hourly_avg[peak_hour]:.1f}% average occupancy)")
-    
-    # 6. Sensor accuracy
-    avg_mismatch = df['sensor_mismatch'].mean()
-    print(f"6. Average Sensor Mismatch: {avg_mismatch:.2f} passengers")
-    
-    # Save KPIs to file
-    with open('kpi_summary.txt', 'w', encoding='utf-8') as f:
-        f.write("KEY PERFORMANCE INDICATORS - Smart Bus Overcrowding Detection System\n")
-        f.write("="*60 + "\n\n")
-        f.write(f"1. Maximum Capacity Utilization: {max_utilization:.1f}%\n")
-        f.write(f"2. Percentage of Journey Time Overcrowded: {overcrowded_percentage:.1f}%\n")
-        f.write(f"3. Total Overcrowding Alerts Triggered: {total_alerts}\n")
-        f.write(f"4. Most Crowded Stop: {avg_by_stop.index[0]} ({avg_by_stop.values[0]:.1f}% average occupancy)\n")
-        f.write(f"5. Peak Hour: {peak_hour}:00 ({hourly_avg[peak_hour]:.1f}% average occupancy)\n")
-        f.write(f"6. Average Sensor Mismatch: {avg_mismatch:.2f} passengers\n")
+    rate1, rate2 = cells['alerts_base'] / n1, cells['alerts_run'] / n2
+    pooled = (cells['alerts_base'] + cells['alerts_run']) / (n1 + n2)
+    pooled_se = np.sqrt(pooled * (1 - pooled) * (1 / n1 + 1 / n2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (rate2 - rate1) / pooled_se
+    alert_p = np.where(pooled_se > 0, 2 * stats.norm.sf(np.abs(z)), 1.0)
+
+    result = pd.DataFrame({
+        'records_base': n1.astype(int), 'records_run': n2.astype(int),
+        'occupancy_base': mean1, 'occupancy_run': mean2, 'occupancy_delta': mean2 - mean1,
+        'occupancy_p': occupancy_p,
+        'alert_rate_base': rate1 * 100, 'alert_rate_run': rate2 * 100, 'alert_rate_delta': (rate2 - rate1) * 100,
+        'alert_p': alert_p,
+    }, index=cells.index)
+    result['occupancy_q'] = benjamini_hochberg(result['occupancy_p'])
+    result['alert_q'] = benjamini_hochberg(result['alert_p'])
+    result['significant'] = (result['occupancy_q'] < alpha) | (result['alert_q'] < alpha)
+    return result
+
+def write_report(kpi_table, cell_tables, path=REPORT_FILE):
+    """Save the KPI table and the significant cell changes of every comparison"""
+    with open(path, 'w') as f:
+        f.write("RUN COMPARISON - Smart Bus Overcrowding Detection System\n")
+        f.write("=" * 60 + "\n\n")
+        f.write(kpi_table.to_string(float_format=lambda x: f"{x:,.2f}") + "\n")
+        for label, cells in cell_tables.items():
+            significant = cells[cells['significant']].sort_index()
+            f.write(f"\n{label}: {len(significant)} of {len(cells)} stop-hours changed significantly "
+                    f"(FDR {ALPHA:.0%})\n")
+            if len(significant):
+                f.write(significant[['occupancy_base', 'occupancy_run', 'occupancy_delta', 'occupancy_q',
+                                     'alert_rate_base', 'alert_rate_run', 'alert_q']]
+                        .to_string(float_format=lambda x: f"{x:.3g}") + "\n")
+
+def main():
+    """Compare a baseline month with a repeat run and a fusion-rule change"""
+    print("Run Comparison Engine")
+    print("=" * 50)
+
+    n_days, n_buses = 60, 25
+    scenarios = {
+        'baseline': dict(seed=0),
+        'baseline_repeat': dict(seed=1),
+        'fusion_50_50': dict(seed=2, camera_weight=0.5),
+    }
+
+    # 1. Aggregate each run once; later invocations reuse the cached cubes while the settings match
+    runs = {}
+    for name, scenario in scenarios.items():
+        source = dict(scenario, n_days=n_days, n_buses=n_buses)
+        cube = load_run(name, source)
+        if cube is None:
+            start = time.perf_counter()
+            df = generate_run(n_days, n_buses, seed=scenario['seed'])
+            if 'camera_weight' in scenario:
+                df = apply_fusion_rule(df, scenario['camera_weight'])
+            cube = cache_run(name, df, source)
+            print(f"1. Cached run '{name}': {len(df):,} records in {time.perf_counter() - start:.1f}s")
+        else:
+            print(f"1. Using cached run '{name}' ({len(cube.days)} days)")
+        runs[name] = cube
+
+    # 2. KPI deltas and per stop-hour significance, from the cubes only
+    start = time.perf_counter()
+    kpi_table = compare_kpis(runs)
+    cell_tables = {f"{name} vs baseline": compare_cells(runs['baseline'], runs[name])
+                   for name in runs if name != 'baseline'}
+    elapsed = time.perf_counter() - start
+    print(f"\n2. Compared {len(runs)} runs in {elapsed * 1000:.0f} ms")
+    print(kpi_table.to_string(float_format=lambda x: f"{x:,.2f}"))
+
+    for label, cells in cell_tables.items():
+        significant = cells[cells['significant']]
+        print(f"\n3. {label}: {len(significant)} of {len(cells)} stop-hours changed significantly "
+              f"(FDR {ALPHA:.0%})")
+        largest = significant['occupancy_delta'].abs().sort_values(ascending=False).index[:3]
+        for (stop, hour), row in significant.loc[largest].iterrows():
+            print(f"   - {stop} {hour:02d}:00: occupancy {row['occupancy_base']:.1f}% -> {row['occupancy_run']:.1f}%, "
+                  f"alert rate {row['alert_rate_base']:.1f}% -> {row['alert_rate_run']:.1f}%")
+
+    write_report(kpi_table, cell_tables)
+    print(f"\nReport saved to '{REPORT_FILE}'")
 
 if __name__ == "__main__":
-    print("Generating bus operation data...")
-    df = generate_bus_data()
-    
-    # Add hour column before saving
-    df['hour'] = df['timestamp'].dt.hour
-    
-    # Save to CSV
-    df.to_csv('bus_overcrowding_data.csv', index=False)
-    print(f"Data saved to 'bus_overcrowding_data.csv' ({len(df)} records)")
-    
-    # Calculate KPIs
-    calculate_kpis(df)
-    
-    # Create visualizations
-    print("\nGenerating visualizations...")
-    create_visualizations(df)
-    print("Visualizations saved:")
-    print("- passenger_count_analysis.png")
-    print("- stop_crowding_heatmap.png")
-    print("- status_and_alerts.png")
-    print("- sensor_analysis.png")
-    print("- kpi_summary.txt")
\ No newline at end of file
+    main()
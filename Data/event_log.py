@@ -0,0 +1,400 @@
+import pandas as pd
+import numpy as np
+import bisect
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from binary_records import (RECORD_DTYPE, append_records, decode_records, default_stop_table,
+                            encode_records, read_header, write_records)
+
+# Segment sizing and sparse index density
+SEGMENT_RECORDS = 1 << 20
+INDEX_STRIDE = 1024
+
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = 'writer.lock'
+
+# Synthetic fleet bus ids keep the route number, as in 'BUS-138-CMB', so route_from_bus_id still applies
+FLEET_BUS_ID = "BUS-138-{:04d}"
+
+def to_epoch_seconds(timestamp):
+    """Convert a timestamp-like value to the record format's epoch seconds"""
+    return int(pd.Timestamp(timestamp).value // 10**9)
+
+def _read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_manifest(directory, manifest):
+    """Atomically replace the manifest so readers never see a partial file"""
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _segment_paths(directory, name):
+    base = os.path.join(directory, name)
+    return base + '.sbr', base + '.tidx.npy', base + '.bidx.npz'
+
+class EventLogWriter:
+    """Single writer for an append-only, segmented log of stop records.
+
+    Records must arrive in non-decreasing timestamp order. Data is written and
+    fsynced before the manifest advances a segment's committed record count,
+    so concurrent readers only ever see complete records.
+    """
+
+    def __init__(self, directory, segment_records=SEGMENT_RECORDS, stops=None):
+        self.directory = directory
+        self.segment_records = segment_records
+        os.makedirs(directory, exist_ok=True)
+
+        # The kernel drops a flock when its holder exits, so a crashed writer never leaves a stale lock
+        lock_path = os.path.join(directory, LOCK_NAME)
+        self._lock_fd = os.open(lock_path, os.O_CREAT | os.O_WRONLY)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            raise RuntimeError(f"Another writer holds {lock_path}")
+        os.ftruncate(self._lock_fd, 0)
+        os.write(self._lock_fd, f"{os.getpid()}\n".encode())
+
+        if os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+            self.manifest = _read_manifest(directory)
+        else:
+            self.manifest = {"bus_ids": [], "stops": stops or default_stop_table(), "segments": []}
+            _write_manifest(directory, self.manifest)
+        self._bus_codes = {bus: i for i, bus in enumerate(self.manifest['bus_ids'])}
+        self._discard_uncommitted()
+
+    def _discard_uncommitted(self):
+        """Cut the open segment back to its committed records.
+
+        A writer that crashed between writing records and advancing the
+        manifest leaves their bytes at the segment's tail; appending after
+        them would misalign everything readers map from then on.
+        """
+        segments = self.manifest['segments']
+        if not segments or segments[-1]['sealed']:
+            return
+        data_path = _segment_paths(self.directory, segments[-1]['name'])[0]
+        _, offset = read_header(data_path)
+        committed = offset + segments[-1]['records'] * RECORD_DTYPE.itemsize
+        if os.path.getsize(data_path) > committed:
+            os.truncate(data_path, committed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def last_timestamp(self):
+        segments = self.manifest['segments']
+        return segments[-1]['max_ts'] if segments else None
+
+    def append(self, df):
+        """Append a DataFrame of stop records in the generator's schema"""
+        if len(df) == 0:
+            return 0
+        df = df.sort_values('timestamp', kind='stable')
+
+        for bus in pd.unique(df['bus_id']):
+            if bus not in self._bus_codes:
+                self._bus_codes[bus] = len(self.manifest['bus_ids'])
+                self.manifest['bus_ids'].append(bus)
+
+        records, _ = encode_records(df, bus_ids=self.manifest['bus_ids'], stops=self.manifest['stops'])
+        if self.last_timestamp is not None and records['timestamp'][0] < self.last_timestamp:
+            raise ValueError("Event log is append-only: records older than the last committed timestamp")
+
+        written = 0
+        while written < len(records):
+            segment = self._active_segment()
+            room = self.segment_records - segment['records']
+            chunk = records[written:written + room]
+            data_path = _segment_paths(self.directory, segment['name'])[0]
+
+            append_records(data_path, chunk)
+            with open(data_path, 'rb+') as f:
+                os.fsync(f.fileno())
+
+            segment['records'] += len(chunk)
+            segment['min_ts'] = segment['min_ts'] if segment['min_ts'] is not None else int(chunk['timestamp'][0])
+            segment['max_ts'] = int(chunk['timestamp'][-1])
+            if segment['records'] >= self.segment_records:
+                self._seal(segment)
+            _write_manifest(self.directory, self.manifest)
+            written += len(chunk)
+
+        return written
+
+    def _active_segment(self):
+        """Return the open segment, creating a new one if needed"""
+        segments = self.manifest['segments']
+        if segments and not segments[-1]['sealed']:
+            return segments[-1]
+
+        name = f"segment_{len(segments) + 1:06d}"
+        # Bus codes are log-wide; the authoritative bus table lives in the manifest
+        write_records(_segment_paths(self.directory, name)[0], np.zeros(0, dtype=RECORD_DTYPE),
+                      {"bus_ids": [], "stops": self.manifest['stops']})
+        segment = {"name": name, "records": 0, "min_ts": None, "max_ts": None, "sealed": False}
+        segments.append(segment)
+        return segment
+
+    def _seal(self, segment):
+        """Freeze a full segment and write its sparse time index and bus index"""
+        data_path, tidx_path, bidx_path = _segment_paths(self.directory, segment['name'])
+        records = _map_segment(data_path, segment['records'])
+
+        np.save(tidx_path, np.ascontiguousarray(records['timestamp'][::INDEX_STRIDE]))
+
+        # Stable sort keeps each bus's records in time order
+        order = np.argsort(records['bus_id'], kind='stable').astype(np.uint32)
+        bus_starts = np.searchsorted(records['bus_id'][order], np.arange(len(self.manifest['bus_ids']) + 1))
+        np.savez(bidx_path, positions=order, timestamps=records['timestamp'][order],
+                 bus_starts=bus_starts.astype(np.uint32))
+        segment['sealed'] = True
+
+    def seal(self):
+        """Seal the open segment so its bus index is available to readers"""
+        segments = self.manifest['segments']
+        if segments and not segments[-1]['sealed'] and segments[-1]['records'] > 0:
+            self._seal(segments[-1])
+            _write_manifest(self.directory, self.manifest)
+
+    def close(self):
+        if self._lock_fd is None:
+            return
+        # Leave the lock file in place: unlinking it would let a second writer lock a fresh inode
+        fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+def _map_segment(data_path, count):
+    """Memory-map the first `count` committed records of a segment"""
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    _, offset = read_header(data_path)
+    return np.memmap(data_path, dtype=RECORD_DTYPE, mode='r', offset=offset, shape=(count,))
+
+class EventLog:
+    """Reader for an event log; safe to use while a writer is appending.
+
+    Every query works on a snapshot of the manifest, so it sees exactly the
+    records committed when the query started.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._maps = {}
+        self._indexes = {}
+
+    def snapshot(self):
+        return _read_manifest(self.directory)
+
+    def _records(self, segment):
+        """Committed records of a segment, reusing the mapping while the segment is unchanged"""
+        key = (segment['name'], segment['records'])
+        if key not in self._maps:
+            self._maps = {k: v for k, v in self._maps.items() if k[0] != segment['name']}
+            self._maps[key] = _map_segment(_segment_paths(self.directory, segment['name'])[0], segment['records'])
+        return self._maps[key]
+
+    def _index(self, segment):
+        if segment['name'] not in self._indexes:
+            _, tidx_path, bidx_path = _segment_paths(self.directory, segment['name'])
+            with np.load(bidx_path) as bidx:
+                self._indexes[segment['name']] = (np.load(tidx_path), dict(bidx))
+        return self._indexes[segment['name']]
+
+    def _time_range(self, segment, records, start_ts, end_ts):
+        """Positions [lo, hi) of records with start_ts <= timestamp < end_ts"""
+        timestamps = records['timestamp']
+        if not segment['sealed']:
+            return (int(np.searchsorted(timestamps, start_ts, side='left')),
+                    int(np.searchsorted(timestamps, end_ts, side='left')))
+
+        # Search the sparse index first, then a single stride-sized block of the data
+        sparse, _ = self._index(segment)
+        bounds = []
+        for ts in (start_ts, end_ts):
+            block = max(int(np.searchsorted(sparse, ts, side='left')) - 1, 0)
+            lo = block * INDEX_STRIDE
+            hi = min(lo + 2 * INDEX_STRIDE, len(records))
+            bounds.append(lo + int(np.searchsorted(timestamps[lo:hi], ts, side='left')))
+        return bounds[0], bounds[1]
+
+    def query_records(self, start, end, bus_id=None, manifest=None):
+        """Raw records with start <= timestamp < end, optionally for one bus"""
+        manifest = manifest or self.snapshot()
+        start_ts, end_ts = to_epoch_seconds(start), to_epoch_seconds(end)
+
+        bus_code = None
+        if bus_id is not None:
+            if bus_id not in manifest['bus_ids']:
+                return np.zeros(0, dtype=RECORD_DTYPE)
+            bus_code = manifest['bus_ids'].index(bus_id)
+
+        # Segments are time ordered, so skip straight to the first candidate
+        segments = [s for s in manifest['segments'] if s['records'] > 0]
+        first = bisect.bisect_left([s['max_ts'] for s in segments], start_ts)
+
+        parts = []
+        for segment in segments[first:]:
+            if segment['min_ts'] >= end_ts:
+                break
+            records = self._records(segment)
+
+            if bus_code is not None and segment['sealed']:
+                _, bidx = self._index(segment)
+                starts = bidx['bus_starts']
+                if bus_code + 1 >= len(starts):
+                    continue  # Bus first seen after this segment was sealed
+                lo, hi = int(starts[bus_code]), int(starts[bus_code + 1])
+                bus_times = bidx['timestamps'][lo:hi]
+                a = lo + np.searchsorted(bus_times, start_ts, side='left')
+                b = lo + np.searchsorted(bus_times, end_ts, side='left')
+                parts.append(records[bidx['positions'][a:b]])
+                continue
+
+            lo, hi = self._time_range(segment, records, start_ts, end_ts)
+            chunk = records[lo:hi]
+            if bus_code is not None:
+                chunk = chunk[chunk['bus_id'] == bus_code]
+            parts.append(np.array(chunk))
+
+        if not parts:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.concatenate(parts)
+
+    def query(self, start, end, bus_id=None):
+        """Stop records with start <= timestamp < end as a DataFrame"""
+        manifest = self.snapshot()
+        records = self.query_records(start, end, bus_id=bus_id, manifest=manifest)
+        return decode_records(records, manifest)
+
+    def bus_history(self, bus_id, start, end):
+        """History of one bus as JSON-ready dicts, one per stop record, with stop and GPS location"""
+        df = self.query(start, end, bus_id=bus_id)
+        return [{
+            "timestamp": row.timestamp.isoformat(),
+            "stop": row.stop_name,
+            "direction": row.direction,
+            "passengers": int(row.validated_count),
+            "occupancy": float(row.occupancy_percent),
+            "status": row.status,
+            "alert": row.alert_triggered == 'Yes',
+            "location": {"lat": float(row.latitude), "lon": float(row.longitude)},
+        } for row in df.itertuples(index=False)]
+
+def build_fleet_history(df, n_buses, n_days):
+    """Replicate the one-bus day across buses and days (ids from FLEET_BUS_ID), in timestamp order"""
+    frames = []
+    for day in range(n_days):
+        day_df = df.copy()
+        day_df['timestamp'] = day_df['timestamp'] + pd.Timedelta(days=day)
+        frames.append(day_df)
+    days = pd.concat(frames, ignore_index=True)
+
+    bus_ids = np.array([FLEET_BUS_ID.format(i) for i in range(n_buses)], dtype=object)
+    fleet = days.loc[days.index.repeat(n_buses)].reset_index(drop=True)
+    fleet['bus_id'] = np.tile(bus_ids, len(days))
+    return fleet.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+def main():
+    """Build a fleet event log and time a bus/time-window history lookup"""
+    print("Event Log with Sparse Time Index")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    fleet = build_fleet_history(df, n_buses=200, n_days=28)
+    directory = tempfile.mkdtemp(prefix='sbod_event_log_')
+    try:
+        # 1. Writer appends one day at a time while a reader polls concurrently
+        day_starts = fleet['timestamp'].dt.normalize()
+        reads = []
+        done = threading.Event()
+
+        def reader():
+            log = EventLog(directory)
+            while not done.is_set():
+                if os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+                    reads.append(len(log.query('2024-01-15 07:00', '2024-01-15 09:00', bus_id=FLEET_BUS_ID.format(7))))
+                time.sleep(0.01)
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        start = time.perf_counter()
+        with EventLogWriter(directory, segment_records=SEGMENT_RECORDS) as writer:
+            for _, day_df in fleet.groupby(day_starts, sort=True):
+                writer.append(day_df)
+            writer.seal()
+        elapsed = time.perf_counter() - start
+        done.set()
+        thread.join()
+
+        manifest = _read_manifest(directory)
+        print(f"1. Appended {len(fleet):,} records into {len(manifest['segments'])} segments in {elapsed:.2f}s")
+        print(f"   Concurrent reader ran {len(reads)} queries while writing, results always complete: "
+              f"{all(r in (0, reads[-1]) for r in reads)}")
+
+        # 2. "Show bus X between 07:00 and 09:00 on day D"
+        log = EventLog(directory)
+        log.query('2024-01-29 07:00', '2024-01-29 09:00', bus_id=FLEET_BUS_ID.format(42))
+        start = time.perf_counter()
+        history = log.bus_history(FLEET_BUS_ID.format(42), '2024-01-29 07:00', '2024-01-29 09:00')
+        indexed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        mask = (fleet['bus_id'] == FLEET_BUS_ID.format(42)) & (fleet['timestamp'] >= '2024-01-29 07:00') & \
+            (fleet['timestamp'] < '2024-01-29 09:00')
+        expected = int(mask.sum())
+        scan = time.perf_counter() - start
+
+        print(f"2. Bus history lookup: {len(history)} records in {indexed * 1000:.2f} ms "
+              f"(full in-memory scan: {scan * 1000:.1f} ms), matches scan: {len(history) == expected}")
+        if history:
+            print(f"   First entry: {history[0]}")
+
+        # 3. A writer crashes after writing a day's records but before committing them
+        crash_dir = os.path.join(directory, 'crash')
+        days = [day_df for _, day_df in df.groupby(df['timestamp'].dt.normalize())] + \
+            [df.assign(timestamp=df['timestamp'] + pd.Timedelta(days=d)) for d in (1, 2)]
+        with EventLogWriter(crash_dir) as writer:
+            writer.append(days[0])
+            manifest = writer.manifest
+            segment_path = _segment_paths(crash_dir, manifest['segments'][-1]['name'])[0]
+        uncommitted, _ = encode_records(days[1], bus_ids=manifest['bus_ids'], stops=manifest['stops'])
+        append_records(segment_path, uncommitted)
+        with EventLogWriter(crash_dir) as writer:
+            writer.append(days[2])
+        recovered = EventLog(crash_dir).query(days[0]['timestamp'].min(), days[2]['timestamp'].max() + pd.Timedelta(1, 's'))
+        expected = pd.concat([days[0], days[2]])['timestamp'].sort_values()
+        print(f"3. Reopened after a crash between write and commit: {len(recovered)} records, "
+              f"uncommitted day dropped and new day intact: "
+              f"{recovered['timestamp'].tolist() == expected.tolist()}")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ import pandas as pd
 import numpy as np
 import os
 
+from load_test_results import RESULTS_FILE, ALERT_SLA_SECONDS, load_results, max_sustainable
+
 # Create Visuals folder if it doesn't exist
 if not os.path.exists('Visuals'):
     os.makedirs('Visuals')
@@ -210,8 +212,27 @@ def create_notification_flow():
     plt.savefig('Visuals/notification_flow.png', dpi=300, bbox_inches='tight', facecolor='white')
     plt.close()
 
-def create_test_results_table():
+def format_rate(per_second):
+    """Message rate with a unit that suits its size, e.g. '450 msg/s' or '77k msg/s'"""
+    if per_second >= 1e6:
+        return f"{per_second / 1e6:.1f}M msg/s"
+    if per_second >= 1e3:
+        return f"{per_second / 1e3:.0f}k msg/s"
+    return f"{per_second:.0f} msg/s"
+
+def performance_test_result(results_path=RESULTS_FILE):
+    """Expected output, result and notes for QA-15 from a load_generator.py run, if one was saved"""
+    expected = f"<{ALERT_SLA_SECONDS:g} sec alert time"
+    if not os.path.exists(results_path):
+        return expected, 'NOT RUN', 'Run load_generator.py'
+    best = max_sustainable(load_results(results_path))
+    if best is None:
+        return expected, 'FAIL', 'SLA missed at lowest load'
+    return expected, 'PASS', f"P99 {best['latency_p99_ms']:.0f} ms @ {format_rate(best['achieved_per_second'])}"
+
+def create_test_results_table(results_path=RESULTS_FILE):
     """Create Comprehensive Test Results Table"""
+    perf_expected, perf_result, perf_notes = performance_test_result(results_path)
     
     # Define comprehensive test cases
     test_data = {
@@ -236,13 +257,13 @@ def create_test_results_table():
                           'Count accuracy ±1', 'Count accuracy ±3', 'Orange LED + Fusion',
                           'Update location', 'Track movement', 'Deny entry',
                           'Prevent exit', 'Buffer data locally', 'Reject invalid',
-                          'All systems respond', '<2 sec alert time'],
+                          'All systems respond', perf_expected],
         'Result': ['PASS', 'PASS', 'PASS', 'PASS', 'PASS', 'PASS', 'PASS', 'PASS',
-                  'PASS', 'PASS', 'PASS', 'PASS', 'PASS', 'PASS', 'PASS'],
+                  'PASS', 'PASS', 'PASS', 'PASS', 'PASS', 'PASS', perf_result],
         'Notes': ['System stable', 'LCD shows correct count', 'Driver notified', 'NTC alert sent',
                  '100% accuracy', '95% accuracy', 'Fusion improved accuracy', 'Stop name updated',
                  'Route adherence OK', 'Buzzer warning', 'Logic prevented error', '24hr buffer OK',
-                 'Validation working', 'Integration successful', '1.8 sec average']
+                 'Validation working', 'Integration successful', perf_notes]
     }
     
     # Create DataFrame
@@ -275,8 +296,10 @@ def create_test_results_table():
     for i in range(1, len(df) + 1):
         if df.iloc[i-1]['Result'] == 'PASS':
             table[(i, 5)].set_facecolor('#90EE90')
-        else:
+        elif df.iloc[i-1]['Result'] == 'FAIL':
             table[(i, 5)].set_facecolor('#FFB6C1')
+        else:
+            table[(i, 5)].set_facecolor('#D3D3D3')
     
     # Alternate row colors
     for i in range(1, len(df) + 1):
@@ -290,7 +313,8 @@ def create_test_results_table():
     Total Tests: {len(df)}
     Passed: {len(df[df['Result'] == 'PASS'])}
     Failed: {len(df[df['Result'] == 'FAIL']) if 'FAIL' in df['Result'].values else 0}
-    Success Rate: 100%
+    Not Run: {len(df[~df['Result'].isin(['PASS', 'FAIL'])])}
+    Success Rate: {(df['Result'] == 'PASS').sum() / max(df['Result'].isin(['PASS', 'FAIL']).sum(), 1):.0%}
     
     Categories Tested:
     • Normal Operations: Validated
@@ -0,0 +1,162 @@
+import pandas as pd
+import numpy as np
+from scipy.spatial import cKDTree
+import time
+
+from bus_data_generator import ROUTE_STOPS
+
+EARTH_RADIUS_M = 6371000.0
+
+# A ping within this distance of a stop counts as being at the stop
+STOP_RADIUS_M = 50.0
+# Consecutive matched pings further apart than this start a new visit
+MAX_PING_GAP_S = 60
+# Visits shorter than this are drive-bys, not stops
+MIN_DWELL_S = 10
+
+def to_unit_xyz(latitude, longitude):
+    """Convert degrees to points on the unit sphere (vectorized)"""
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+class StopMatcher:
+    """Nearest-stop lookup for GPS fixes backed by a KD-tree.
+
+    Stops are indexed as 3D points on the sphere, so the chord distance used
+    by the tree is monotonic in great-circle distance and no projection is
+    needed wherever the route is.
+    """
+
+    def __init__(self, stops=ROUTE_STOPS, radius_m=STOP_RADIUS_M):
+        self.stops = stops
+        self.stop_names = np.array([s['name'] for s in stops], dtype=object)
+        self.radius_m = radius_m
+        self.tree = cKDTree(to_unit_xyz([s['lat'] for s in stops], [s['lon'] for s in stops]))
+
+    def match(self, latitude, longitude):
+        """Match fixes to the nearest stop within the radius.
+
+        Returns (stop_index, distance_m); stop_index is -1 where no stop is close enough.
+        """
+        points = to_unit_xyz(latitude, longitude)
+        max_chord = 2 * np.sin(self.radius_m / EARTH_RADIUS_M / 2)
+        chord, index = self.tree.query(points, k=1, distance_upper_bound=max_chord)
+
+        matched = np.isfinite(chord)
+        stop_index = np.where(matched, index, -1)
+        distance_m = np.full(len(points), np.inf)
+        distance_m[matched] = 2 * np.arcsin(chord[matched] / 2) * EARTH_RADIUS_M
+        return stop_index, distance_m
+
+def detect_stop_events(pings, matcher, max_gap_s=MAX_PING_GAP_S, min_dwell_s=MIN_DWELL_S):
+    """Turn raw GPS pings into stop visits with arrival and departure times.
+
+    `pings` needs bus_id, timestamp, latitude and longitude columns. Pings are
+    processed as whole arrays: a visit is a run of matched pings for one bus at
+    one stop with no gap longer than `max_gap_s`, which also bridges short
+    stretches where GPS jitter puts the bus just outside the radius.
+    """
+    stop_index, _ = matcher.match(pings['latitude'].values, pings['longitude'].values)
+    matched = stop_index >= 0
+
+    bus_codes, bus_ids = pd.factorize(pings['bus_id'].values[matched])
+    seconds = pd.to_datetime(pings['timestamp'].values[matched]).values.astype('datetime64[s]').astype(np.int64)
+    stops = stop_index[matched]
+
+    order = np.lexsort((seconds, bus_codes))
+    bus_codes, seconds, stops = bus_codes[order], seconds[order], stops[order]
+    if len(seconds) == 0:
+        return pd.DataFrame(columns=['bus_id', 'stop_name', 'arrival_time', 'departure_time',
+                                     'dwell_seconds', 'n_pings'])
+
+    new_visit = np.ones(len(seconds), dtype=bool)
+    new_visit[1:] = ((bus_codes[1:] != bus_codes[:-1]) | (stops[1:] != stops[:-1]) |
+                     (np.diff(seconds) > max_gap_s))
+    first = np.flatnonzero(new_visit)
+    last = np.append(first[1:], len(seconds)) - 1
+
+    dwell = seconds[last] - seconds[first]
+    keep = dwell >= min_dwell_s
+    first, last, dwell = first[keep], last[keep], dwell[keep]
+
+    return pd.DataFrame({
+        'bus_id': bus_ids[bus_codes[first]],
+        'stop_name': matcher.stop_names[stops[first]],
+        'arrival_time': pd.to_datetime(seconds[first], unit='s'),
+        'departure_time': pd.to_datetime(seconds[last], unit='s'),
+        'dwell_seconds': dwell,
+        'n_pings': last - first + 1,
+    })
+
+def stop_events_to_long(visits):
+    """Split visits into separate ARRIVAL and DEPARTURE events in time order"""
+    arrivals = visits[['bus_id', 'stop_name', 'arrival_time']].rename(columns={'arrival_time': 'timestamp'})
+    departures = visits[['bus_id', 'stop_name', 'departure_time']].rename(columns={'departure_time': 'timestamp'})
+    arrivals['event'] = 'ARRIVAL'
+    departures['event'] = 'DEPARTURE'
+    events = pd.concat([arrivals, departures], ignore_index=True)
+    return events.sort_values(['bus_id', 'timestamp', 'event'], kind='stable').reset_index(drop=True)
+
+def simulate_gps_pings(n_buses, duration_s, interval_s=5, speed_kmh=20, dwell_s=40, noise_m=8, seed=42):
+    """Simulate noisy GPS fixes for buses shuttling along the route"""
+    rng = np.random.default_rng(seed)
+    stops = ROUTE_STOPS + ROUTE_STOPS[-2:0:-1]
+    lat = np.array([s['lat'] for s in stops] + [stops[0]['lat']])
+    lon = np.array([s['lon'] for s in stops] + [stops[0]['lon']])
+
+    # Piecewise timeline of one round trip: dwell at each stop, then drive to the next
+    xyz = to_unit_xyz(lat, lon)
+    leg_m = 2 * np.arcsin(np.linalg.norm(np.diff(xyz, axis=0), axis=1) / 2) * EARTH_RADIUS_M
+    leg_s = leg_m / (speed_kmh / 3.6)
+    knot_times = np.zeros(2 * len(leg_s) + 1)
+    knot_times[1::2] = dwell_s
+    knot_times[2::2] = leg_s
+    knot_times = np.cumsum(knot_times)
+    knot_lat = np.repeat(lat, 2)[:len(knot_times)]
+    knot_lon = np.repeat(lon, 2)[:len(knot_times)]
+    cycle_s = knot_times[-1]
+
+    ticks = np.arange(0, duration_s, interval_s)
+    offsets = rng.uniform(0, cycle_s, n_buses)
+    t = (ticks[None, :] + offsets[:, None]) % cycle_s
+
+    noise_deg = noise_m / EARTH_RADIUS_M * 180 / np.pi
+    latitude = np.interp(t, knot_times, knot_lat) + rng.normal(0, noise_deg, t.shape)
+    longitude = np.interp(t, knot_times, knot_lon) + rng.normal(0, noise_deg, t.shape)
+
+    start = np.datetime64('2024-01-15T06:00:00')
+    return pd.DataFrame({
+        'bus_id': np.repeat([f"BUS-{i:04d}-CMB" for i in range(n_buses)], len(ticks)),
+        'timestamp': np.tile(start + ticks.astype('timedelta64[s]'), n_buses),
+        'latitude': latitude.ravel(),
+        'longitude': longitude.ravel(),
+    })
+
+def main():
+    """Benchmark stop matching and event detection on simulated fleet GPS"""
+    print("GPS Stop Matching")
+    print("=" * 50)
+
+    pings = simulate_gps_pings(n_buses=500, duration_s=4 * 3600)
+    matcher = StopMatcher()
+
+    start = time.perf_counter()
+    stop_index, _ = matcher.match(pings['latitude'].values, pings['longitude'].values)
+    elapsed = time.perf_counter() - start
+    print(f"1. Matched {len(pings):,} pings in {elapsed:.2f}s ({len(pings) / elapsed / 1e6:.1f} M pings/s), "
+          f"{(stop_index >= 0).mean() * 100:.1f}% within {STOP_RADIUS_M:.0f} m of a stop")
+
+    start = time.perf_counter()
+    visits = detect_stop_events(pings, matcher)
+    elapsed = time.perf_counter() - start
+    print(f"2. Detected {len(visits):,} stop visits in {elapsed:.2f}s "
+          f"(median dwell {visits['dwell_seconds'].median():.0f}s)")
+
+    events = stop_events_to_long(visits)
+    print("3. First events for BUS-0000-CMB:")
+    print(events[events['bus_id'] == 'BUS-0000-CMB'].head(6).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import pandas as pd
+import numpy as np
+import heapq
+from collections import Counter
+import time
+
+from passenger_km import route_from_bus_id
+
+# Time slices are summarized separately and merged over the sliding window
+SLICE_MINUTES = 15
+WINDOW_SLICES = 4
+SUMMARY_CAPACITY = 1000
+TOP_K = 10
+
+class SpaceSaving:
+    """Space-saving heavy-hitter summary with a fixed number of counters.
+
+    A new key arriving when all counters are taken replaces the smallest
+    one and inherits its count as the error bound, so every reported count
+    overestimates the true count by at most `error`, and any key with a true
+    count above total / capacity is guaranteed to be kept. The smallest
+    counter is found through a lazily updated min-heap.
+    """
+
+    def __init__(self, capacity=SUMMARY_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []
+
+    def update(self, key, weight=1):
+        self.total += weight
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+        else:
+            floor, evicted = self._pop_min()
+            del self.counts[evicted], self.errors[evicted]
+            self.counts[key] = floor + weight
+            self.errors[key] = floor
+        heapq.heappush(self._heap, (self.counts[key], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, k) for k, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        # Skip heap entries left behind by later increments
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return count, key
+
+    def update_counts(self, counts):
+        """Add a batch given as key -> weight, largest first"""
+        for key, weight in sorted(counts.items(), key=lambda item: -item[1]):
+            self.update(key, weight)
+
+    @property
+    def min_count(self):
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    @classmethod
+    def merged(cls, summaries, capacity=SUMMARY_CAPACITY):
+        """Combine summaries: a key missing from a full summary may have had up to its minimum there"""
+        counts, errors = {}, {}
+        floors = [s.min_count for s in summaries]
+        keys = set().union(*(s.counts for s in summaries)) if summaries else set()
+        for key in keys:
+            counts[key] = sum(s.counts.get(key, floor) for s, floor in zip(summaries, floors))
+            errors[key] = sum(s.errors[key] if key in s.counts else floor for s, floor in zip(summaries, floors))
+
+        result = cls(capacity)
+        for key in heapq.nlargest(capacity, counts, key=counts.get):
+            result.counts[key] = counts[key]
+            result.errors[key] = errors[key]
+        result.total = sum(s.total for s in summaries)
+        result._heap = [(count, key) for key, count in result.counts.items()]
+        heapq.heapify(result._heap)
+        return result
+
+    def top(self, k=TOP_K):
+        """[(key, count, error)] for the k largest counters"""
+        keys = heapq.nlargest(k, self.counts, key=self.counts.get)
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+class HotspotTracker:
+    """Top-K (route, stop, hour) overcrowding hotspots over a sliding event-time window.
+
+    Alerts are counted in one space-saving summary per time slice; the
+    window keeps the last `window_slices` summaries and merges them on
+    demand, so memory is fixed at window_slices x capacity counters.
+    """
+
+    def __init__(self, slice_minutes=SLICE_MINUTES, window_slices=WINDOW_SLICES, capacity=SUMMARY_CAPACITY):
+        self.slice_minutes = slice_minutes
+        self.window_slices = window_slices
+        self.capacity = capacity
+        self.slices = {}    # slice index -> SpaceSaving
+
+    def ingest(self, df):
+        """Count the alerting rows of a batch of stop records"""
+        alerts = df[df['alert_triggered'].values == 'Yes']
+        if len(alerts) == 0:
+            return
+        routes = alerts['route'].values if 'route' in alerts.columns else route_from_bus_id(alerts['bus_id'])
+        minutes = pd.to_datetime(alerts['timestamp']).values.astype('datetime64[m]').astype(np.int64)
+        keys = zip((minutes // self.slice_minutes).tolist(), routes.tolist(),
+                   alerts['stop_name'].values.tolist(), ((minutes // 60) % 24).tolist())
+        per_slice = {}
+        for (index, route, stop, hour), count in Counter(keys).items():
+            per_slice.setdefault(index, {})[(route, stop, hour)] = count
+
+        for index in sorted(per_slice):
+            summary = self.slices.get(index)
+            if summary is None:
+                if self.slices and index <= max(self.slices) - self.window_slices:
+                    continue    # Too old for the window
+                summary = self.slices[index] = SpaceSaving(self.capacity)
+            summary.update_counts(per_slice[index])
+
+        # Drop slices that have left the window
+        newest = max(self.slices)
+        for index in [i for i in self.slices if i <= newest - self.window_slices]:
+            del self.slices[index]
+
+    def top(self, k=TOP_K):
+        """Hotspots in the current window, with the count's error bound"""
+        window = SpaceSaving.merged(list(self.slices.values()), self.capacity)
+        rows = [{'route': key[0], 'stop_name': key[1], 'hour': key[2], 'alerts': count, 'max_error': error,
+                 'guaranteed_alerts': count - error} for key, count, error in window.top(k)]
+        return pd.DataFrame(rows, columns=['route', 'stop_name', 'hour', 'alerts', 'max_error', 'guaranteed_alerts'])
+
+    def window_bounds(self):
+        if not self.slices:
+            return None, None
+        minutes = self.slice_minutes
+        start = pd.Timestamp((max(self.slices) - self.window_slices + 1) * minutes * 60, unit='s')
+        end = pd.Timestamp((max(self.slices) + 1) * minutes * 60, unit='s')
+        return start, end
+
+    def to_dashboard(self, k=TOP_K):
+        """Current hotspots as JSON-friendly dicts"""
+        start, end = self.window_bounds()
+        return {
+            'window_start': None if start is None else start.isoformat(),
+            'window_end': None if end is None else end.isoformat(),
+            'hotspots': [{key: (int(v) if isinstance(v, (np.integer, int)) else v) for key, v in row.items()}
+                         for row in self.top(k).to_dict('records')],
+        }
+
+def format_hotspots(hotspots):
+    """Report lines for a hotspot frame"""
+    return [f"Route {h.route} at {h.stop_name} ({h.hour:02d}:00): {h.alerts} alerts"
+            f"{f' (at least {h.guaranteed_alerts})' if h.max_error else ''}"
+            for h in hotspots.itertuples(index=False)]
+
+def simulate_network_alerts(n_events, n_routes=2000, n_stops=40, start='2024-01-15 05:00', hours=18, seed=0):
+    """Alert events over a large network with Zipf-distributed hotspot popularity"""
+    rng = np.random.default_rng(seed)
+    n_keys = n_routes * n_stops
+    popularity = 1.0 / np.arange(1, n_keys + 1) ** 1.1
+    key = rng.permutation(n_keys)[rng.choice(n_keys, n_events, p=popularity / popularity.sum())]
+    offsets = np.sort(rng.integers(0, hours * 3600, n_events))
+    timestamps = pd.Timestamp(start) + pd.to_timedelta(offsets, unit='s')
+    return pd.DataFrame({
+        'timestamp': timestamps,
+        'route': (key // n_stops).astype(str),
+        'stop_name': np.char.add('Stop-', (key % n_stops).astype(str)),
+        'alert_triggered': 'Yes',
+    })
+
+def main():
+    """Track network hotspots over a sliding window and check against exact counts"""
+    print("Top-K Overcrowding Hotspots (Space-Saving)")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    # 1. Whole day of the dataset in one window
+    tracker = HotspotTracker(slice_minutes=60, window_slices=24)
+    tracker.ingest(df)
+    print("1. Dataset hotspots (whole day):")
+    for line in format_hotspots(tracker.top(5)):
+        print(f"   - {line}")
+
+    # 2. Network-scale stream, fed in one-minute batches
+    events = simulate_network_alerts(3_000_000)
+    tracker = HotspotTracker()
+    start = time.perf_counter()
+    for _, batch in events.groupby(events['timestamp'].dt.floor('1min'), sort=True):
+        tracker.ingest(batch)
+    elapsed = time.perf_counter() - start
+    print(f"\n2. Streamed {len(events):,} alerts over {events['route'].nunique():,} routes in {elapsed:.1f}s "
+          f"({len(events) / elapsed:,.0f} alerts/s), {tracker.window_slices} x {tracker.capacity} counters")
+
+    # 3. Compare the window's top-K with exact counts over the same window
+    window_start, window_end = tracker.window_bounds()
+    in_window = events[(events['timestamp'] >= window_start) & (events['timestamp'] < window_end)]
+    exact = in_window.groupby(['route', 'stop_name', in_window['timestamp'].dt.hour]).size().nlargest(TOP_K)
+    approx = tracker.top(TOP_K)
+    found = set(zip(approx['route'], approx['stop_name'], approx['hour']))
+    recall = sum(key in found for key in exact.index) / TOP_K
+    print(f"3. Window {window_start:%H:%M}-{window_end:%H:%M}: top-{TOP_K} recall vs exact {recall:.0%}, "
+          f"largest count overestimate {approx['max_error'].max()}")
+    for line in format_hotspots(approx.head(5)):
+        print(f"   - {line}")
+
+if __name__ == "__main__":
+    main()
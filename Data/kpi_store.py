@@ -0,0 +1,304 @@
+import pandas as pd
+import numpy as np
+import sqlite3
+import tempfile
+import time
+import os
+
+from bus_data_generator import STATUS_LEVELS
+from event_log import build_fleet_history
+
+STORE_FILE = 'bus_kpi_store.db'
+INSERT_CHUNK_ROWS = 200_000
+
+# Stop records keep the CSV's columns; timestamps are stored as Unix seconds
+RECORD_COLUMNS = ['timestamp', 'trip_number', 'direction', 'bus_id', 'stop_name', 'latitude', 'longitude',
+                  'boarding', 'alighting', 'ir_sensor_count', 'camera_count', 'validated_count', 'actual_count',
+                  'occupancy_percent', 'status', 'alert_triggered', 'sensor_mismatch', 'hour']
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS stop_records (
+    timestamp INTEGER NOT NULL,
+    trip_number INTEGER,
+    direction TEXT,
+    bus_id TEXT NOT NULL,
+    stop_name TEXT NOT NULL,
+    latitude REAL,
+    longitude REAL,
+    boarding INTEGER,
+    alighting INTEGER,
+    ir_sensor_count INTEGER,
+    camera_count INTEGER,
+    validated_count INTEGER,
+    actual_count INTEGER,
+    occupancy_percent REAL,
+    status TEXT,
+    alert_triggered TEXT,
+    sensor_mismatch INTEGER,
+    hour INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stop_records_bus_time ON stop_records (bus_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_stop_records_stop_hour ON stop_records (stop_name, hour);
+
+-- Additive per day x hour x stop totals; means are derived at query time
+CREATE TABLE IF NOT EXISTS kpi_hourly (
+    day TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    stop_name TEXT NOT NULL,
+    records INTEGER NOT NULL,
+    occupancy_sum REAL NOT NULL,
+    occupancy_max REAL NOT NULL,
+    validated_sum REAL NOT NULL,
+    validated_min INTEGER NOT NULL,
+    validated_max INTEGER NOT NULL,
+    ir_sum REAL NOT NULL,
+    camera_sum REAL NOT NULL,
+    boarding INTEGER NOT NULL,
+    alighting INTEGER NOT NULL,
+    alerts INTEGER NOT NULL,
+    mismatch_sum REAL NOT NULL,
+    {', '.join(f'{s.lower()} INTEGER NOT NULL' for s in STATUS_LEVELS)},
+    PRIMARY KEY (day, hour, stop_name)
+) WITHOUT ROWID;
+"""
+
+# Upsert columns: how an incoming chunk total combines with the stored one
+SUMMARY_MERGE = {
+    'records': 'sum', 'occupancy_sum': 'sum', 'occupancy_max': 'max', 'validated_sum': 'sum',
+    'validated_min': 'min', 'validated_max': 'max', 'ir_sum': 'sum', 'camera_sum': 'sum',
+    'boarding': 'sum', 'alighting': 'sum', 'alerts': 'sum', 'mismatch_sum': 'sum',
+    **{s.lower(): 'sum' for s in STATUS_LEVELS},
+}
+
+class KPIStore:
+    """SQLite file holding raw stop records and incrementally maintained KPI totals.
+
+    Each insert_frame call loads the rows with executemany and upserts the
+    chunk's per day x hour x stop totals into kpi_hourly in the same
+    transaction, so the summary never disagrees with the raw table.
+    """
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self.conn.execute("PRAGMA cache_size = -65536")  # 64 MiB page cache
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def insert_frame(self, df, chunk_rows=INSERT_CHUNK_ROWS):
+        """Bulk-load stop records in the generator's schema and update the summaries"""
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            timestamps = pd.to_datetime(chunk['timestamp'])
+            columns = {c: chunk[c].tolist() for c in RECORD_COLUMNS if c not in ('timestamp', 'hour')}
+            columns['timestamp'] = (timestamps.values.astype('datetime64[s]').astype(np.int64)).tolist()
+            columns['hour'] = timestamps.dt.hour.tolist()
+            rows = zip(*(columns[c] for c in RECORD_COLUMNS))
+
+            placeholders = ', '.join('?' * len(RECORD_COLUMNS))
+            with self.conn:
+                self.conn.executemany(f"INSERT INTO stop_records ({', '.join(RECORD_COLUMNS)}) "
+                                      f"VALUES ({placeholders})", rows)
+                self._upsert_summary(chunk, timestamps)
+
+    def _upsert_summary(self, chunk, timestamps):
+        totals = chunk.assign(
+            day=timestamps.dt.strftime('%Y-%m-%d').values,
+            hour=timestamps.dt.hour.values,
+            alerts=(chunk['alert_triggered'] == 'Yes').astype(int),
+            **{s.lower(): (chunk['status'] == s).astype(int) for s in STATUS_LEVELS},
+        ).groupby(['day', 'hour', 'stop_name'], sort=False).agg(
+            records=('validated_count', 'size'),
+            occupancy_sum=('occupancy_percent', 'sum'),
+            occupancy_max=('occupancy_percent', 'max'),
+            validated_sum=('validated_count', 'sum'),
+            validated_min=('validated_count', 'min'),
+            validated_max=('validated_count', 'max'),
+            ir_sum=('ir_sensor_count', 'sum'),
+            camera_sum=('camera_count', 'sum'),
+            boarding=('boarding', 'sum'),
+            alighting=('alighting', 'sum'),
+            alerts=('alerts', 'sum'),
+            mismatch_sum=('sensor_mismatch', 'sum'),
+            **{s.lower(): (s.lower(), 'sum') for s in STATUS_LEVELS},
+        ).reset_index()
+
+        columns = ['day', 'hour', 'stop_name'] + list(SUMMARY_MERGE)
+        merge = {'sum': '{c} + excluded.{c}', 'max': 'MAX({c}, excluded.{c})', 'min': 'MIN({c}, excluded.{c})'}
+        updates = ', '.join(f"{c} = " + merge[how].format(c=c) for c, how in SUMMARY_MERGE.items())
+        self.conn.executemany(
+            f"INSERT INTO kpi_hourly ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT (day, hour, stop_name) DO UPDATE SET {updates}",
+            totals[columns].astype(object).itertuples(index=False, name=None))
+
+    def rebuild_summary(self):
+        """Recompute kpi_hourly from the raw records, e.g. after manual edits.
+
+        The delete and every chunk's upsert share one transaction, so readers
+        never see an empty or partial summary and a crash keeps the old one.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM kpi_hourly")
+            for chunk in pd.read_sql_query("SELECT * FROM stop_records", self.conn, chunksize=INSERT_CHUNK_ROWS):
+                chunk['timestamp'] = pd.to_datetime(chunk['timestamp'], unit='s')
+                self._upsert_summary(chunk, chunk['timestamp'])
+
+    def query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def _summary_filter(self, days):
+        if days is None:
+            return "", ()
+        days = [pd.Timestamp(d).strftime('%Y-%m-%d') for d in np.atleast_1d(days)]
+        return f"WHERE day IN ({', '.join('?' * len(days))})", tuple(days)
+
+    def kpis(self, days=None):
+        """The six headline KPIs of calculate_kpis, from the summary table"""
+        where, params = self._summary_filter(days)
+        totals = self.query(f"SELECT SUM(records) AS records, MAX(occupancy_max) AS max_utilization, "
+                            f"SUM(overcrowded) AS overcrowded, SUM(alerts) AS alerts, "
+                            f"SUM(mismatch_sum) AS mismatch_sum FROM kpi_hourly {where}", params).iloc[0]
+        by_stop = self.query(f"SELECT stop_name, SUM(occupancy_sum) / SUM(records) AS occupancy "
+                             f"FROM kpi_hourly {where} GROUP BY stop_name ORDER BY occupancy DESC", params)
+        by_hour = self.query(f"SELECT hour, SUM(occupancy_sum) / SUM(records) AS occupancy "
+                             f"FROM kpi_hourly {where} GROUP BY hour ORDER BY occupancy DESC, hour", params)
+        return {
+            'max_utilization': float(totals['max_utilization']),
+            'overcrowded_percentage': float(totals['overcrowded'] / totals['records'] * 100),
+            'total_alerts': int(totals['alerts']),
+            'most_crowded_stop': by_stop['stop_name'].iloc[0],
+            'most_crowded_stop_occupancy': float(by_stop['occupancy'].iloc[0]),
+            'peak_hour': int(by_hour['hour'].iloc[0]),
+            'peak_hour_occupancy': float(by_hour['occupancy'].iloc[0]),
+            'avg_sensor_mismatch': float(totals['mismatch_sum'] / totals['records']),
+        }
+
+    def peak_hour_stats(self, days=None):
+        """Hourly frame in the layout create_peak_hour_analysis builds from raw rows"""
+        where, params = self._summary_filter(days)
+        hourly = self.query(
+            f"SELECT hour, SUM(validated_sum) * 1.0 / SUM(records) AS validated_mean, "
+            f"MAX(validated_max) AS validated_max, MIN(validated_min) AS validated_min, "
+            f"SUM(boarding) AS boarding, SUM(alighting) AS alighting, SUM(alerts) AS alerts "
+            f"FROM kpi_hourly {where} GROUP BY hour ORDER BY hour", params).set_index('hour')
+        return pd.DataFrame({
+            ('validated_count', 'mean'): hourly['validated_mean'],
+            ('validated_count', 'max'): hourly['validated_max'],
+            ('validated_count', 'min'): hourly['validated_min'],
+            ('boarding', 'sum'): hourly['boarding'],
+            ('alighting', 'sum'): hourly['alighting'],
+            ('alert_triggered', '<lambda>'): hourly['alerts'],
+        })
+
+    def stop_metrics(self, days=None):
+        """Per-stop frame in the layout create_stop_performance_dashboard builds"""
+        where, params = self._summary_filter(days)
+        return self.query(
+            f"SELECT stop_name, SUM(boarding) AS boarding, SUM(alighting) AS alighting, "
+            f"SUM(validated_sum) * 1.0 / SUM(records) AS validated_count, SUM(alerts) AS alert_triggered, "
+            f"SUM(records) AS visits FROM kpi_hourly {where} GROUP BY stop_name", params).set_index('stop_name')
+
+    def kpi_summary(self, days=None):
+        """Headline values used by create_kpi_summary_dashboard"""
+        where, params = self._summary_filter(days)
+        totals = self.query(
+            f"SELECT SUM(records) AS records, MAX(occupancy_max) AS max_utilization, "
+            f"SUM(occupancy_sum) AS occupancy_sum, SUM(alerts) AS alerts, SUM(boarding) AS boarding, "
+            f"SUM(mismatch_sum) AS mismatch_sum, {', '.join(f'SUM({s.lower()}) AS {s}' for s in STATUS_LEVELS)} "
+            f"FROM kpi_hourly {where}", params).iloc[0]
+        hourly = self.query(f"SELECT hour, SUM(occupancy_sum) / SUM(records) AS occupancy "
+                            f"FROM kpi_hourly {where} GROUP BY hour ORDER BY hour", params).set_index('hour')
+        records = totals['records']
+        status_counts = totals[STATUS_LEVELS].astype(float)
+        return {
+            'max_utilization': float(totals['max_utilization']),
+            'avg_utilization': float(totals['occupancy_sum'] / records),
+            'overcrowded_percentage': float(totals['OVERCROWDED'] / records * 100),
+            'total_alerts': int(totals['alerts']),
+            'total_passengers': int(totals['boarding']),
+            'avg_sensor_mismatch': float(totals['mismatch_sum'] / records),
+            'status_percentages': status_counts[status_counts > 0] / records * 100,
+            'hourly_avg': hourly['occupancy'],
+        }
+
+    def bus_history(self, bus_id, start, end):
+        """Raw records of one bus in [start, end), served by the (bus_id, timestamp) index"""
+        history = self.query("SELECT * FROM stop_records WHERE bus_id = ? AND timestamp >= ? AND timestamp < ? "
+                             "ORDER BY timestamp",
+                             (bus_id, pd.Timestamp(start).value // 10**9, pd.Timestamp(end).value // 10**9))
+        history['timestamp'] = pd.to_datetime(history['timestamp'], unit='s')
+        return history
+
+    def stop_hour_records(self, stop_name, hour):
+        """Raw records at one stop and hour of day, served by the (stop_name, hour) index"""
+        records = self.query("SELECT * FROM stop_records WHERE stop_name = ? AND hour = ?", (stop_name, hour))
+        records['timestamp'] = pd.to_datetime(records['timestamp'], unit='s')
+        return records
+
+def main():
+    """Load the dataset and a fleet history into a store and time KPI queries"""
+    print("Indexed KPI Store (SQLite)")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    directory = tempfile.mkdtemp(prefix='sbod_kpi_store_')
+    store = KPIStore(os.path.join(directory, STORE_FILE))
+    try:
+        # 1. Bulk load a fleet history
+        fleet = build_fleet_history(df, n_buses=500, n_days=10)
+        start = time.perf_counter()
+        store.insert_frame(fleet)
+        elapsed = time.perf_counter() - start
+        print(f"1. Loaded {len(fleet):,} records in {elapsed:.1f}s ({len(fleet) / elapsed * 60:,.0f} rows/minute)")
+
+        # 2. KPIs from the summary table vs re-aggregating the raw rows
+        start = time.perf_counter()
+        kpis = store.kpis()
+        summary_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        store.query("SELECT stop_name, AVG(occupancy_percent) FROM stop_records GROUP BY stop_name")
+        raw_ms = (time.perf_counter() - start) * 1000
+        print(f"2. Headline KPIs from kpi_hourly in {summary_ms:.1f} ms "
+              f"(one raw-table GROUP BY alone takes {raw_ms:.0f} ms)")
+        print(f"   Max utilization {kpis['max_utilization']:.1f}%, overcrowded {kpis['overcrowded_percentage']:.1f}%, "
+              f"{kpis['total_alerts']:,} alerts, peak hour {kpis['peak_hour']}:00, "
+              f"most crowded stop {kpis['most_crowded_stop']}")
+
+        # 3. Indexed lookups
+        start = time.perf_counter()
+        history = store.bus_history('BUS-138-0042', '2024-01-17 07:00', '2024-01-17 10:00')
+        records = store.stop_hour_records('Pettah', 8)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"3. Bus window ({len(history)} rows) and stop-hour ({len(records):,} rows) lookups in {elapsed:.0f} ms")
+
+        # 4. Chart frames: the store stands in for the raw rows in the KPI charts
+        start = time.perf_counter()
+        hourly = store.peak_hour_stats()
+        per_stop = store.stop_metrics()
+        store.kpi_summary()
+        elapsed = (time.perf_counter() - start) * 1000
+        raw_hourly = fleet.groupby('hour').agg({'validated_count': ['mean', 'max', 'min'],
+                                               'boarding': 'sum', 'alighting': 'sum'})
+        matches = bool(np.allclose(hourly[raw_hourly.columns].values, raw_hourly.values) and
+                       (per_stop['visits'] == fleet.groupby('stop_name').size()).all())
+        print(f"4. Peak-hour, stop and KPI dashboard frames in {elapsed:.1f} ms, match raw aggregation: {matches}")
+    finally:
+        store.close()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ import os
 from matplotlib.gridspec import GridSpec
 import matplotlib.dates as mdates
 
+from quantile_sketch import CellSketches
+
 # Create KPI folder if it doesn't exist
 if not os.path.exists('KPI'):
     os.makedirs('KPI')
@@ -284,17 +286,21 @@ def create_time_series_analysis(df):
     plt.savefig('KPI/6_time_series_analysis.png', dpi=300, bbox_inches='tight')
     plt.close()
 
-def create_stop_performance_dashboard(df):
+def create_stop_performance_dashboard(df, cube=None):
     """7. Additional Chart - Stop Performance Dashboard"""
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(14, 10))
     
-    # Calculate stop metrics
-    stop_metrics = df.groupby('stop_name').agg({
-        'boarding': 'sum',
-        'alighting': 'sum',
-        'validated_count': 'mean',
-        'alert_triggered': lambda x: (x == 'Yes').sum()
-    })
+    # Calculate stop metrics (read from a RollupCube or KPIStore when one is given)
+    if cube is not None:
+        stop_metrics = cube.stop_metrics()
+    else:
+        stop_metrics = df.groupby('stop_name').agg({
+            'boarding': 'sum',
+            'alighting': 'sum',
+            'validated_count': 'mean',
+            'alert_triggered': lambda x: (x == 'Yes').sum()
+        })
+        stop_metrics['visits'] = df.groupby('stop_name').size()
     
     stop_order = ['Colombo Fort', 'Pettah', 'Maradana', 'Borella', 'Narahenpita', 'Nugegoda']
     stop_metrics = stop_metrics.reindex(stop_order)
@@ -335,8 +341,7 @@ def create_stop_performance_dashboard(df):
     ax3.grid(True, alpha=0.3)
     
     # 4. Alert rate by stop
-    total_visits = df.groupby('stop_name').size().reindex(stop_order)
-    alert_rate = (stop_metrics['alert_triggered'] / total_visits * 100).fillna(0)
+    alert_rate = (stop_metrics['alert_triggered'] / stop_metrics['visits'] * 100).fillna(0)
     bars = ax4.bar(stop_order, alert_rate, color='#FF5252', edgecolor='black', linewidth=1)
     ax4.set_xlabel('Bus Stop')
     ax4.set_ylabel('Alert Rate (%)')
@@ -354,17 +359,24 @@ def create_stop_performance_dashboard(df):
     plt.savefig('KPI/7_stop_performance_dashboard.png', dpi=300, bbox_inches='tight')
     plt.close()
 
-def create_peak_hour_analysis(df):
-    """8. Additional Chart - Peak Hour Analysis"""
+def create_peak_hour_analysis(df, cube=None, quantiles=None):
+    """8. Additional Chart - Peak Hour Analysis
+
+    `quantiles` is an optional hour-indexed frame of passenger-count
+    percentiles (p50, p90, p99), e.g. from CellSketches.percentiles.
+    """
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10), sharex=True)
     
-    # Group by hour
-    hourly_stats = df.groupby('hour').agg({
-        'validated_count': ['mean', 'max', 'min'],
-        'boarding': 'sum',
-        'alighting': 'sum',
-        'alert_triggered': lambda x: (x == 'Yes').sum()
-    })
+    # Group by hour (read from a RollupCube or KPIStore when one is given)
+    if cube is not None:
+        hourly_stats = cube.peak_hour_stats()
+    else:
+        hourly_stats = df.groupby('hour').agg({
+            'validated_count': ['mean', 'max', 'min'],
+            'boarding': 'sum',
+            'alighting': 'sum',
+            'alert_triggered': lambda x: (x == 'Yes').sum()
+        })
     
     # Top panel - Passenger count statistics
     hours = hourly_stats.index
@@ -375,6 +387,13 @@ def create_peak_hour_analysis(df):
     ax1.plot(hours, mean_count, 'o-', linewidth=3, markersize=8, label='Average', color='#2E86AB')
     ax1.fill_between(hours, min_count, max_count, alpha=0.3, color='#2E86AB', label='Min-Max Range')
     
+    # Percentile bands
+    if quantiles is not None:
+        bands = quantiles.reindex(hours)
+        ax1.fill_between(hours, bands['p50'], bands['p90'], alpha=0.35, color='#F18F01', label='P50-P90')
+        ax1.fill_between(hours, bands['p90'], bands['p99'], alpha=0.2, color='#C73E1D', label='P90-P99')
+        ax1.plot(hours, bands['p50'], '--', linewidth=2, color='#F18F01', label='Median (P50)')
+    
     # Mark peak hours
     morning_peak = (hours >= 7) & (hours <= 9)
     evening_peak = (hours >= 17) & (hours <= 19)
@@ -417,18 +436,31 @@ def create_peak_hour_analysis(df):
     plt.savefig('KPI/8_peak_hour_analysis.png', dpi=300, bbox_inches='tight')
     plt.close()
 
-def create_kpi_summary_dashboard(df):
+def create_kpi_summary_dashboard(df, cube=None):
     """9. KPI Summary Dashboard"""
     fig = plt.figure(figsize=(16, 10))
     gs = GridSpec(3, 3, figure=fig, hspace=0.3, wspace=0.3)
     
-    # Calculate KPIs
-    max_utilization = df['occupancy_percent'].max()
-    avg_utilization = df['occupancy_percent'].mean()
-    overcrowded_percentage = (df['status'] == 'OVERCROWDED').sum() / len(df) * 100
-    total_alerts = (df['alert_triggered'] == 'Yes').sum()
-    total_passengers = df['boarding'].sum()
-    avg_sensor_mismatch = df['sensor_mismatch'].mean()
+    # Calculate KPIs (read from a RollupCube or KPIStore when one is given)
+    if cube is not None:
+        summary = cube.kpi_summary()
+        max_utilization = summary['max_utilization']
+        avg_utilization = summary['avg_utilization']
+        overcrowded_percentage = summary['overcrowded_percentage']
+        total_alerts = summary['total_alerts']
+        total_passengers = summary['total_passengers']
+        avg_sensor_mismatch = summary['avg_sensor_mismatch']
+        status_percentages = summary['status_percentages']
+        hourly_avg = summary['hourly_avg']
+    else:
+        max_utilization = df['occupancy_percent'].max()
+        avg_utilization = df['occupancy_percent'].mean()
+        overcrowded_percentage = (df['status'] == 'OVERCROWDED').sum() / len(df) * 100
+        total_alerts = (df['alert_triggered'] == 'Yes').sum()
+        total_passengers = df['boarding'].sum()
+        avg_sensor_mismatch = df['sensor_mismatch'].mean()
+        status_percentages = df['status'].value_counts(normalize=True) * 100
+        hourly_avg = df.groupby('hour')['occupancy_percent'].mean()
     
     # KPI 1: Utilization Gauge
     ax1 = fig.add_subplot(gs[0, 0])
@@ -461,7 +493,6 @@ def create_kpi_summary_dashboard(df):
     ax4 = fig.add_subplot(gs[1, :])
     status_colors = {'UNDERCROWDED': '#4CAF50', 'NORMAL': '#2196F3', 
                     'NEARLY_FULL': '#FF9800', 'OVERCROWDED': '#F44336'}
-    status_percentages = df['status'].value_counts(normalize=True) * 100
     
     y_pos = 0
     for status in ['UNDERCROWDED', 'NORMAL', 'NEARLY_FULL', 'OVERCROWDED']:
@@ -478,7 +509,6 @@ def create_kpi_summary_dashboard(df):
     
     # KPI 5: Hourly pattern
     ax5 = fig.add_subplot(gs[2, :])
-    hourly_avg = df.groupby('hour')['occupancy_percent'].mean()
     ax5.bar(hourly_avg.index, hourly_avg.values, 
             color=['red' if x >= 80 else 'orange' if x >= 60 else 'green' for x in hourly_avg.values])
     ax5.axhline(y=80, color='red', linestyle='--', alpha=0.5, label='Overcrowded')
@@ -546,7 +576,8 @@ def main():
     create_stop_performance_dashboard(df)
     
     print("8. Creating peak hour analysis...")
-    create_peak_hour_analysis(df)
+    quantiles = CellSketches('validated_count').ingest(df).percentiles(['hour'])
+    create_peak_hour_analysis(df, quantiles=quantiles)
     
     print("9. Creating KPI summary dashboard...")
     create_kpi_summary_dashboard(df)
@@ -0,0 +1,316 @@
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import multiprocessing
+import socket
+import threading
+import time
+
+from bus_data_generator import MAX_CAPACITY, STATUS_LEVELS
+from load_test_results import ALERT_SLA_SECONDS, RESULTS_FILE, max_sustainable
+from quantile_sketch import KLLSketch, RunningStats
+from replay_streamer import sleep_until
+from telemetry_buffer import simulate_telemetry
+from what_if import classify
+
+UPLOAD_INTERVAL_SECONDS = 30        # CLOUD_UPLOAD_INTERVAL on the device
+RAMP_BUSES = (100, 250, 500, 1000, 2500, 5000, 10000, 20000, 40000, 80000, 160000)
+RATE_PER_BUS = 1.0                  # Packets per second per virtual bus during the test
+STEP_SECONDS = 5.0
+DRAIN_SECONDS = 5.0                 # Wait this long for outstanding replies after the last send
+MIN_DELIVERY_RATIO = 0.98           # A step is sustainable if nearly all offered packets are answered in time
+MAX_BATCH_RECORDS = 1000
+RED_CODE = len(STATUS_LEVELS) - 1
+
+# One reply per packet from the pipeline: packet sequence number, status code
+# and whether this packet raised an NTC alert
+REPLY_DTYPE = np.dtype([('seq', '<u4'), ('status', 'u1'), ('alert', 'u1'), ('pad', '<u2')])
+
+# Cloud upload packet as printed by generateCloudDataPacket in the firmware,
+# plus a sequence number so replies can be matched to sends
+PACKET_TEMPLATE = ('{"seq": %d, "timestamp": "%s", "data_packet": {"bus_id": "%s", '
+                   '"sensor_records": {"ir_count": %d, "validated_count": %d, "gps": [%.4f, %.4f]}, '
+                   '"upload_status": "SUCCESS"}}\n')
+
+def parse_packet(line):
+    """(seq, bus_id, validated_count) of one uplink line; count -1 when the body is unusable.
+
+    Raises ValueError when the line is not JSON or carries no usable sequence
+    number, since such a packet cannot be answered.
+    """
+    try:
+        packet = json.loads(line)
+        seq = int(packet['seq'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Malformed packet") from e
+    if not 0 <= seq < 2 ** 32:
+        raise ValueError("Malformed packet")
+    try:
+        body = packet['data_packet']
+        return seq, body['bus_id'], int(body['sensor_records']['validated_count'])
+    except (KeyError, TypeError, ValueError):
+        return seq, None, -1
+
+def handle_connection(conn):
+    """Ingest-and-alert loop for one uplink: parse, validate, classify, alert.
+
+    Like the device, a bus raises one alert when it enters OVERCROWDED and
+    re-arms once it drops below the line again. Invalid packets (counts
+    outside 0 to capacity, or an unreadable body) are answered with status
+    255 and never alert. Lines that are not JSON or have no sequence number
+    cannot be answered; they are dropped and counted. Returns that count.
+    """
+    last_status = {}
+    pending = b''
+    rejected = 0
+    while True:
+        data = conn.recv(1 << 16)
+        if not data:
+            break
+        lines = (pending + data).split(b'\n')
+        pending = lines.pop()
+        packets = []
+        for line in lines:
+            try:
+                packets.append(parse_packet(line))
+            except ValueError:
+                rejected += 1
+        if not packets:
+            continue
+        seqs = np.array([p[0] for p in packets], dtype=np.uint32)
+        counts = np.array([p[2] for p in packets])
+        valid = (counts >= 0) & (counts <= MAX_CAPACITY)
+        _, _, codes = classify(np.where(valid, counts, 0))
+
+        replies = np.zeros(len(packets), dtype=REPLY_DTYPE)
+        replies['seq'] = seqs
+        replies['status'] = np.where(valid, codes, 255)
+        for i, (_, bus_id, _) in enumerate(packets):
+            if not valid[i]:
+                continue
+            red = codes[i] == RED_CODE
+            if red and not last_status.get(bus_id, False):
+                replies['alert'][i] = 1
+            last_status[bus_id] = red
+        conn.sendall(replies.tobytes())
+    return rejected
+
+def serve_pipeline(address_pipe, host='127.0.0.1'):
+    """Pipeline process: accept uplinks one after another until terminated"""
+    server = socket.create_server((host, 0))
+    address_pipe.send(server.getsockname())
+    while True:
+        conn, _ = server.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with conn:
+            rejected = handle_connection(conn)
+        if rejected:
+            print(f"   Pipeline rejected {rejected:,} malformed packets")
+
+class IngestPipeline:
+    """Local ingest-and-alert server in its own process, so it does not share the generator's interpreter"""
+
+    def __init__(self):
+        parent, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serve_pipeline, args=(child,), daemon=True)
+        self.process.start()
+        self.address = parent.recv()
+
+    def close(self):
+        self.process.terminate()
+        self.process.join()
+
+def virtual_fleet_packets(n_buses, rate_per_bus, duration, seed=0):
+    """Send schedule and encoded packets for `n_buses` buses each sending `rate_per_bus` packets per second.
+
+    Buses start at random phases within one send interval. Each packet
+    carries the bus's next upload: consecutive packets from a bus are
+    UPLOAD_INTERVAL_SECONDS apart on a simulated day of telemetry, starting
+    at a random time of day, so the fleet crosses the alert line at a
+    realistic rate.
+    """
+    rng = np.random.default_rng(seed)
+    day = simulate_telemetry(86400, seed=seed)
+    per_bus = int(np.ceil(duration * rate_per_bus))
+    phases = rng.uniform(0, 1 / rate_per_bus, n_buses)
+    offsets = rng.integers(0, 86400, n_buses)
+
+    bus = np.repeat(np.arange(n_buses), per_bus)
+    k = np.tile(np.arange(per_bus), n_buses)
+    send_at = phases[bus] + k / rate_per_bus
+    keep = send_at < duration
+    bus, k, send_at = bus[keep], k[keep], send_at[keep]
+    order = np.argsort(send_at, kind='stable')
+    bus, k, send_at = bus[order], k[order], send_at[order]
+
+    samples = day[(offsets[bus] + k * UPLOAD_INTERVAL_SECONDS) % len(day)]
+    times = pd.to_datetime(samples['timestamp'], unit='s').strftime('%Y-%m-%dT%H:%M:%S')
+    bus_ids = [f"VBUS-{b:05d}" for b in range(n_buses)]
+    packets = [(PACKET_TEMPLATE % (seq, t, bus_ids[b], ir, count, lat, lon)).encode()
+               for seq, (t, b, ir, count, lat, lon) in enumerate(zip(
+                   times, bus.tolist(), samples['ir_count'].tolist(), samples['passenger_count'].tolist(),
+                   samples['latitude'].tolist(), samples['longitude'].tolist()))]
+    return send_at, packets
+
+class ReplyCollector:
+    """Reads pipeline replies on its own thread and stamps them with their arrival time"""
+
+    def __init__(self, sock, n_packets):
+        self.sock = sock
+        self.received_at = np.full(n_packets, np.nan)
+        self.status = np.zeros(n_packets, dtype=np.uint8)
+        self.alert = np.zeros(n_packets, dtype=bool)
+        self.replies = 0
+        self.done = threading.Event()
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+
+    def _collect(self):
+        pending = b''
+        while self.replies < len(self.received_at):
+            try:
+                data = self.sock.recv(1 << 16)
+            except OSError:
+                break
+            if not data:
+                break
+            now = time.perf_counter()
+            pending += data
+            n = len(pending) // REPLY_DTYPE.itemsize
+            replies = np.frombuffer(pending[:n * REPLY_DTYPE.itemsize], dtype=REPLY_DTYPE)
+            pending = pending[n * REPLY_DTYPE.itemsize:]
+            seqs = replies['seq'].astype(np.int64)
+            self.received_at[seqs] = now
+            self.status[seqs] = replies['status']
+            self.alert[seqs] = replies['alert'] == 1
+            self.replies += n
+        self.done.set()
+
+    def wait(self, timeout):
+        self.done.wait(timeout)
+
+def run_step(address, n_buses, rate_per_bus=RATE_PER_BUS, duration=STEP_SECONDS, sla=ALERT_SLA_SECONDS,
+             seed=0):
+    """Offer one fleet size to the pipeline and measure what came back.
+
+    Latency runs from each packet's scheduled send time to the arrival of its
+    reply, so time a packet spends waiting behind a slow sender counts
+    against the pipeline instead of silently lowering the offered load.
+    """
+    send_at, packets = virtual_fleet_packets(n_buses, rate_per_bus, duration, seed)
+    sock = socket.create_connection(address)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    collector = ReplyCollector(sock, len(packets))
+
+    start = time.perf_counter()
+    targets = start + send_at
+    i = 0
+    while i < len(packets):
+        now = time.perf_counter()
+        if targets[i] > now:
+            sleep_until(targets[i])
+            now = time.perf_counter()
+        j = min(int(np.searchsorted(targets, now, side='right')), i + MAX_BATCH_RECORDS)
+        sock.sendall(b''.join(packets[i:max(j, i + 1)]))
+        i = max(j, i + 1)
+    send_seconds = time.perf_counter() - start
+    collector.wait(DRAIN_SECONDS)
+    sock.close()
+
+    latency_ms = (collector.received_at - targets) * 1000
+    answered = ~np.isnan(latency_ms)
+    in_time = answered & (latency_ms <= sla * 1000)
+    running = RunningStats()
+    sketch = KLLSketch(seed=seed)
+    for value in latency_ms[answered]:
+        running.update(value)
+    sketch.update(latency_ms[answered].tolist())
+    quantiles = sketch.quantile([0.5, 0.95, 0.99]) if answered.any() else (np.nan,) * 3
+    alert_latency = latency_ms[collector.alert]
+    last_reply = np.nanmax(collector.received_at) if answered.any() else start
+
+    offered = len(packets) / duration
+    return {
+        'buses': n_buses,
+        'rate_per_bus': rate_per_bus,
+        'equivalent_fleet': int(n_buses * rate_per_bus * UPLOAD_INTERVAL_SECONDS),
+        'offered_per_second': offered,
+        'achieved_per_second': answered.sum() / max(last_reply - start, send_seconds),
+        'packets': len(packets),
+        'answered': int(answered.sum()),
+        'delivered_in_sla_percent': in_time.mean() * 100,
+        'latency_mean_ms': running.mean,
+        'latency_p50_ms': quantiles[0],
+        'latency_p95_ms': quantiles[1],
+        'latency_p99_ms': quantiles[2],
+        'latency_max_ms': np.nanmax(latency_ms) if answered.any() else np.nan,
+        'alerts': int(collector.alert.sum()),
+        'alert_latency_mean_ms': alert_latency.mean() if len(alert_latency) else np.nan,
+        'alert_latency_max_ms': alert_latency.max() if len(alert_latency) else np.nan,
+        'sustainable': bool(in_time.mean() >= MIN_DELIVERY_RATIO and quantiles[2] <= sla * 1000),
+    }
+
+def ramp(address, bus_counts=RAMP_BUSES, rate_per_bus=RATE_PER_BUS, duration=STEP_SECONDS,
+         sla=ALERT_SLA_SECONDS):
+    """Run steps of increasing fleet size until the pipeline stops keeping up"""
+    rows = []
+    for step, n_buses in enumerate(bus_counts):
+        rows.append(run_step(address, n_buses, rate_per_bus, duration, sla, seed=step))
+        yield rows[-1]
+        if not rows[-1]['sustainable']:
+            break
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the ingest-and-alert pipeline with a virtual fleet")
+    parser.add_argument('--buses', type=int, nargs='+', default=list(RAMP_BUSES),
+                        help="fleet sizes to ramp through")
+    parser.add_argument('--rate', type=float, default=RATE_PER_BUS, help="packets per second per virtual bus")
+    parser.add_argument('--step-seconds', type=float, default=STEP_SECONDS, help="send time per fleet size")
+    parser.add_argument('--sla', type=float, default=ALERT_SLA_SECONDS, help="end-to-end latency target (s)")
+    parser.add_argument('--output', default=RESULTS_FILE, help="results CSV")
+    args = parser.parse_args(argv)
+    if args.rate <= 0 or args.step_seconds <= 0:
+        parser.error("--rate and --step-seconds must be positive")
+    return args
+
+def main(argv=None):
+    """Ramp a virtual fleet against a local pipeline and record latency percentiles and throughput"""
+    args = parse_args(argv)
+    print("Virtual Fleet Load Test")
+    print("=" * 50)
+
+    pipeline = IngestPipeline()
+    try:
+        # 1. Ramp the fleet until latency or delivery falls outside the SLA
+        print(f"1. Ramping {args.rate:g} packets/s per bus, {args.step_seconds:g}s per step, "
+              f"SLA P99 <= {args.sla:g}s:")
+        rows = []
+        for row in ramp(pipeline.address, args.buses, args.rate, args.step_seconds, args.sla):
+            rows.append(row)
+            print(f"   - {row['buses']:,} buses: offered {row['offered_per_second']:,.0f}/s, "
+                  f"achieved {row['achieved_per_second']:,.0f}/s, P50 {row['latency_p50_ms']:.1f} ms, "
+                  f"P99 {row['latency_p99_ms']:.1f} ms, {row['alerts']} alerts "
+                  f"({'OK' if row['sustainable'] else 'saturated'})")
+    finally:
+        pipeline.close()
+
+    results = pd.DataFrame(rows)
+    results.to_csv(args.output, index=False)
+
+    # 2. Headline numbers for the QA table
+    best = max_sustainable(results)
+    if best is None:
+        print("2. The pipeline could not sustain the smallest fleet within the SLA")
+    else:
+        print(f"2. Max sustainable throughput: {best['achieved_per_second']:,.0f} packets/s "
+              f"({best['buses']:,} virtual buses, about {best['equivalent_fleet']:,} buses "
+              f"at one upload every {UPLOAD_INTERVAL_SECONDS}s)")
+        print(f"   At that load: P50 {best['latency_p50_ms']:.1f} ms, P95 {best['latency_p95_ms']:.1f} ms, "
+              f"P99 {best['latency_p99_ms']:.1f} ms; {best['alerts']} alerts, "
+              f"mean alert latency {best['alert_latency_mean_ms']:.1f} ms")
+
+    print(f"\nResults saved to '{args.output}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import pandas as pd
+
+# Where load_generator.py saves its ramp, and the QA-15 target it is judged against
+RESULTS_FILE = 'load_test_results.csv'
+ALERT_SLA_SECONDS = 2.0             # QA-15: alert must reach the NTC within this time
+
+def max_sustainable(results):
+    """Highest sustainable step of a ramp, or None if even the first step failed"""
+    ok = results[results['sustainable']]
+    return ok.loc[ok['achieved_per_second'].idxmax()] if len(ok) else None
+
+def load_results(path=RESULTS_FILE):
+    """Saved ramp results, one row per fleet size"""
+    return pd.read_csv(path)
@@ -0,0 +1,140 @@
+import pandas as pd
+import numpy as np
+import random
+import time
+import os
+from collections import Counter
+from multiprocessing import Pool
+
+from bus_data_generator import MAX_CAPACITY, generate_bus_data
+from quantile_sketch import CONFIDENCE, TARGET_PRECISION, KLLSketch, RunningStats
+
+REPORT_FILE = 'monte_carlo_kpis.txt'
+N_REPLICAS = 400
+BATCH_SIZE = 20            # Replicas per worker task
+
+KPI_LABELS = {
+    'max_utilization': 'Maximum Capacity Utilization (%)',
+    'avg_utilization': 'Average Capacity Utilization (%)',
+    'overcrowded_percentage': 'Journey Time Overcrowded (%)',
+    'total_alerts': 'Total Overcrowding Alerts',
+    'most_crowded_stop_occupancy': 'Most Crowded Stop Occupancy (%)',
+    'peak_hour_occupancy': 'Peak Hour Occupancy (%)',
+    'avg_sensor_mismatch': 'Average Sensor Mismatch (passengers)',
+    'total_passengers': 'Total Passengers Boarded',
+}
+
+def replica_kpis(df):
+    """Headline KPIs of one simulated day, as in calculate_kpis"""
+    by_stop = df.groupby('stop_name')['occupancy_percent'].mean()
+    by_hour = df.groupby(df['timestamp'].dt.hour)['occupancy_percent'].mean()
+    return {
+        'max_utilization': df['occupancy_percent'].max(),
+        'avg_utilization': df['validated_count'].mean() / MAX_CAPACITY * 100,
+        'overcrowded_percentage': (df['status'] == 'OVERCROWDED').mean() * 100,
+        'total_alerts': (df['alert_triggered'] == 'Yes').sum(),
+        'most_crowded_stop_occupancy': by_stop.max(),
+        'peak_hour_occupancy': by_hour.max(),
+        'avg_sensor_mismatch': df['sensor_mismatch'].mean(),
+        'total_passengers': df['boarding'].sum(),
+        'most_crowded_stop': by_stop.idxmax(),
+        'peak_hour': int(by_hour.idxmax()),
+    }
+
+def run_replica_batch(seeds):
+    """Worker task: one generate_bus_data day per seed"""
+    results = []
+    for seed in seeds:
+        random.seed(seed)
+        results.append(replica_kpis(generate_bus_data()))
+    return results
+
+class ReplicaSummary:
+    """Streaming summary of replica KPIs: Welford accumulators for means and
+    confidence intervals, KLL sketches for the spread of single days, and
+    counts of which stop and hour come out on top."""
+
+    def __init__(self):
+        self.stats = {key: RunningStats() for key in KPI_LABELS}
+        self.sketches = {key: KLLSketch(seed=0) for key in KPI_LABELS}
+        self.most_crowded_stop = Counter()
+        self.peak_hour = Counter()
+
+    def update(self, kpis):
+        for key in KPI_LABELS:
+            self.stats[key].update(float(kpis[key]))
+            self.sketches[key].update(float(kpis[key]))
+        self.most_crowded_stop[kpis['most_crowded_stop']] += 1
+        self.peak_hour[kpis['peak_hour']] += 1
+
+    @property
+    def n(self):
+        return self.stats['max_utilization'].n
+
+    def table(self, confidence=CONFIDENCE):
+        rows = []
+        for key, label in KPI_LABELS.items():
+            running = self.stats[key]
+            mean, low, high = running.confidence_interval(confidence)
+            p5, p95 = self.sketches[key].quantile([0.05, 0.95])
+            rows.append({'kpi': label, 'mean': mean, 'ci_low': low, 'ci_high': high, 'std': running.std,
+                         'p5': p5, 'p95': p95, 'replicas_for_1pct': running.replicas_for_precision()})
+        return pd.DataFrame(rows).set_index('kpi')
+
+def run_replicas(n_replicas=N_REPLICAS, base_seed=0, processes=None, batch_size=BATCH_SIZE):
+    """Run seeded replicas in a process pool, folding results in as batches finish"""
+    seeds = list(range(base_seed, base_seed + n_replicas))
+    batches = [seeds[i:i + batch_size] for i in range(0, len(seeds), batch_size)]
+    summary = ReplicaSummary()
+    with Pool(processes or os.cpu_count()) as pool:
+        for results in pool.imap(run_replica_batch, batches):
+            for kpis in results:
+                summary.update(kpis)
+    return summary
+
+def write_report(summary, path=REPORT_FILE, confidence=CONFIDENCE):
+    table = summary.table(confidence)
+    with open(path, 'w') as f:
+        f.write("MONTE CARLO KPIs - Smart Bus Overcrowding Detection System\n")
+        f.write("=" * 60 + "\n\n")
+        f.write(f"{summary.n} replica days, {confidence:.0%} confidence intervals (Student t)\n\n")
+        for i, (label, row) in enumerate(table.iterrows(), 1):
+            f.write(f"{i}. {label}: {row['mean']:.2f} [{row['ci_low']:.2f}, {row['ci_high']:.2f}], "
+                    f"daily P5-P95 {row['p5']:.1f}-{row['p95']:.1f}\n")
+        stop, count = summary.most_crowded_stop.most_common(1)[0]
+        hour, hour_count = summary.peak_hour.most_common(1)[0]
+        f.write(f"\nMost crowded stop: {stop} in {count / summary.n:.0%} of replicas\n")
+        f.write(f"Peak hour: {hour}:00 in {hour_count / summary.n:.0%} of replicas\n")
+
+def main():
+    """Run replica days in parallel and report KPI confidence intervals"""
+    print("Monte Carlo Replica Runner")
+    print("=" * 50)
+
+    # 1. Replicas in parallel, streamed into the accumulators
+    start = time.perf_counter()
+    summary = run_replicas()
+    elapsed = time.perf_counter() - start
+    print(f"1. Ran {summary.n} replica days on {os.cpu_count()} process(es) in {elapsed:.1f}s")
+
+    # 2. Confidence intervals and day-to-day spread
+    table = summary.table()
+    print(f"2. KPI means with {CONFIDENCE:.0%} confidence intervals:")
+    for label, row in table.iterrows():
+        print(f"   - {label}: {row['mean']:.2f} [{row['ci_low']:.2f}, {row['ci_high']:.2f}] "
+              f"(single day P5-P95: {row['p5']:.1f}-{row['p95']:.1f})")
+
+    # 3. Categorical outcomes and the replica count needed for tight intervals
+    stop, count = summary.most_crowded_stop.most_common(1)[0]
+    hour, hour_count = summary.peak_hour.most_common(1)[0]
+    print(f"3. Most crowded stop: {stop} in {count / summary.n:.0%} of replicas; "
+          f"peak hour {hour}:00 in {hour_count / summary.n:.0%}")
+    needed = table['replicas_for_1pct'].max()
+    print(f"   Replicas for +/-{TARGET_PRECISION:.0%} on every KPI: {needed:,.0f} "
+          f"(limited by {table['replicas_for_1pct'].idxmax()})")
+
+    write_report(summary)
+    print(f"\nReport saved to '{REPORT_FILE}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import pandas as pd
+import numpy as np
+import random
+import time
+
+from bus_data_generator import MAX_CAPACITY, ROUTE_STOPS, generate_bus_data
+
+DIRECTIONS = ['Forward', 'Backward']
+
+# Pseudo-count that shrinks sparse stop x hour x weekday cells toward coarser averages
+PRIOR_STRENGTH = 5.0
+
+class OccupancyForecaster:
+    """Forecast validated_count at a bus's next stops.
+
+    Training accumulates sums in dense direction x stop x hour x weekday tables
+    (one bincount per chunk), so months of history can be streamed in with
+    partial_fit. Each forecast step adds the learned load change at the next
+    stop to the current load and blends the result with that stop's baseline
+    occupancy; the blend weight is fitted by least squares in calibrate().
+    """
+
+    def __init__(self, route_stops=ROUTE_STOPS, capacity=MAX_CAPACITY):
+        self.stop_names = [s['name'] for s in route_stops]
+        self.n_stops = len(self.stop_names)
+        self.capacity = capacity
+        self.shape = (len(DIRECTIONS), self.n_stops, 24, 7)
+        size = int(np.prod(self.shape))
+
+        self._load_sum = np.zeros(size)
+        self._delta_sum = np.zeros(size)
+        self._count = np.zeros(size)
+        self._hop_sum = np.zeros(len(DIRECTIONS) * self.n_stops)
+        self._hop_count = np.zeros(len(DIRECTIONS) * self.n_stops)
+        self._calibration = np.zeros(2)
+        self.persistence = 0.5
+        self.baseline = None
+
+    def _positions(self, direction, stop_name):
+        """Direction code and position of each stop along its direction of travel"""
+        direction_code = pd.Categorical(direction, categories=DIRECTIONS).codes.astype(np.int64)
+        stop_code = pd.Categorical(stop_name, categories=self.stop_names).codes.astype(np.int64)
+        if (direction_code < 0).any() or (stop_code < 0).any():
+            raise ValueError("Unknown direction or stop name")
+        position = np.where(direction_code == 0, stop_code, self.n_stops - 1 - stop_code)
+        return direction_code, position
+
+    def _cell(self, direction_code, position, hour, weekday):
+        return np.ravel_multi_index((direction_code, position, hour, weekday), self.shape)
+
+    def _prepare(self, df):
+        """Cell index, observed load and load change since the previous stop of each row"""
+        # Trip numbers restart every day, so a trip is identified by bus, service date, number and direction
+        df = df.assign(service_date=pd.to_datetime(df['timestamp']).dt.normalize())
+        df = df.sort_values(['bus_id', 'service_date', 'trip_number', 'direction', 'timestamp'], kind='stable')
+        timestamps = pd.to_datetime(df['timestamp'])
+        direction_code, position = self._positions(df['direction'].values, df['stop_name'].values)
+        cell = self._cell(direction_code, position, timestamps.dt.hour.values, timestamps.dt.weekday.values)
+
+        load = df['validated_count'].values.astype(np.float64)
+        same_trip = np.zeros(len(df), dtype=bool)
+        same_trip[1:] = ((df['bus_id'].values[1:] == df['bus_id'].values[:-1]) &
+                         (df['service_date'].values[1:] == df['service_date'].values[:-1]) &
+                         (df['trip_number'].values[1:] == df['trip_number'].values[:-1]) &
+                         (direction_code[1:] == direction_code[:-1]))
+        previous = np.zeros(len(df))
+        previous[1:] = load[:-1]
+        previous[~same_trip] = 0.0
+
+        minutes = np.zeros(len(df))
+        minutes[1:] = np.diff(timestamps.values).astype('timedelta64[s]').astype(np.float64) / 60
+        hop_key = direction_code * self.n_stops + position
+        return cell, load, load - previous, previous, same_trip, minutes, hop_key
+
+    def partial_fit(self, df):
+        """Accumulate statistics from a chunk of history in the generator's schema"""
+        cell, load, delta, _, same_trip, minutes, hop_key = self._prepare(df)
+        size = self._count.size
+        self._load_sum += np.bincount(cell, weights=load, minlength=size)
+        self._delta_sum += np.bincount(cell, weights=delta, minlength=size)
+        self._count += np.bincount(cell, minlength=size)
+        # Travel time into each stop, keyed by the stop being arrived at
+        self._hop_sum += np.bincount(hop_key[same_trip], weights=minutes[same_trip], minlength=self._hop_sum.size)
+        self._hop_count += np.bincount(hop_key[same_trip], minlength=self._hop_count.size)
+        self._finalize()
+        return self
+
+    def _shrunk_mean(self, total):
+        """Cell means shrunk toward the weekday-pooled, then hour-pooled, means"""
+        total = total.reshape(self.shape)
+        count = self._count.reshape(self.shape)
+
+        stop_total, stop_count = total.sum(axis=(2, 3), keepdims=True), count.sum(axis=(2, 3), keepdims=True)
+        stop_mean = np.divide(stop_total, stop_count, out=np.zeros_like(stop_total), where=stop_count > 0)
+
+        hour_total, hour_count = total.sum(axis=3, keepdims=True), count.sum(axis=3, keepdims=True)
+        hour_mean = (hour_total + PRIOR_STRENGTH * stop_mean) / (hour_count + PRIOR_STRENGTH)
+
+        return ((total + PRIOR_STRENGTH * hour_mean) / (count + PRIOR_STRENGTH)).ravel()
+
+    def _finalize(self):
+        self.baseline = self._shrunk_mean(self._load_sum)
+        self.delta = self._shrunk_mean(self._delta_sum)
+        overall_hop = self._hop_sum.sum() / max(self._hop_count.sum(), 1)
+        self.hop_minutes = (self._hop_sum + overall_hop) / (self._hop_count + 1)
+
+    def calibrate(self, df):
+        """Fit the persistence weight on one-step-ahead errors over a chunk of history"""
+        cell, load, _, previous, same_trip, _, _ = self._prepare(df)
+        chained = np.clip(previous + self.delta[cell], 0, self.capacity)[same_trip]
+        base = self.baseline[cell][same_trip]
+        diff = chained - base
+        self._calibration += [np.sum((load[same_trip] - base) * diff), np.sum(diff * diff)]
+        if self._calibration[1] > 0:
+            self.persistence = float(np.clip(self._calibration[0] / self._calibration[1], 0, 1))
+        return self
+
+    def fit(self, df):
+        """Train tables and persistence weight on a single DataFrame"""
+        return self.partial_fit(df).calibrate(df)
+
+    def _rollout(self, direction, stop_name, load, timestamp, n_stops):
+        """Yield (direction_code, position, minutes, predicted) for each step ahead"""
+        direction_code, position = self._positions(np.asarray(direction), np.asarray(stop_name))
+        current = np.asarray(load, dtype=np.float64)
+        minutes = pd.to_datetime(np.asarray(timestamp)).values.astype('datetime64[m]').astype(np.int64)
+
+        for _ in range(n_stops):
+            position = position + 1
+            wrapped = position >= self.n_stops
+            direction_code = np.where(wrapped, 1 - direction_code, direction_code)
+            position = np.where(wrapped, 0, position)
+            current = np.where(wrapped, 0.0, current)  # Everyone alights at the terminus
+
+            minutes = minutes + self.hop_minutes[direction_code * self.n_stops + position]
+            whole_minutes = minutes.astype(np.int64)
+            hour = (whole_minutes // 60) % 24
+            weekday = (whole_minutes // 1440 + 3) % 7  # 1970-01-01 was a Thursday
+            cell = self._cell(direction_code, position, hour, weekday)
+
+            chained = np.clip(current + self.delta[cell], 0, self.capacity)
+            current = self.persistence * chained + (1 - self.persistence) * self.baseline[cell]
+            yield direction_code, position, minutes, current
+
+    def predict(self, direction, stop_name, load, timestamp, n_stops=3):
+        """Predict validated_count at the next `n_stops` stops for every bus.
+
+        Inputs are arrays describing each bus's last served stop. Buses wrap onto
+        the return direction after the terminus. Returns an (n_buses, n_stops)
+        array of predicted counts and the matching stop names.
+        """
+        predictions = np.empty((len(load), n_stops))
+        stop_index = np.empty((len(load), n_stops), dtype=np.int64)
+        steps = self._rollout(direction, stop_name, load, timestamp, n_stops)
+        for step, (direction_code, position, _, current) in enumerate(steps):
+            predictions[:, step] = current
+            stop_index[:, step] = np.where(direction_code == 0, position, self.n_stops - 1 - position)
+
+        return predictions, np.asarray(self.stop_names, dtype=object)[stop_index]
+
+    def forecast_frame(self, direction, stop_name, load, timestamp, n_stops=3):
+        """Long-format forecast: one row per bus and step with projected time and stop"""
+        steps = list(self._rollout(direction, stop_name, load, timestamp, n_stops))
+        direction_code = np.concatenate([s[0] for s in steps])
+        position = np.concatenate([s[1] for s in steps])
+        stop_index = np.where(direction_code == 0, position, self.n_stops - 1 - position)
+        minutes = np.concatenate([s[2] for s in steps]).astype(np.int64)
+        return pd.DataFrame({
+            'bus_index': np.tile(np.arange(len(load)), n_stops),
+            'step': np.repeat(np.arange(1, n_stops + 1), len(load)),
+            'direction': np.asarray(DIRECTIONS, dtype=object)[direction_code],
+            'stop_position': position,
+            'stop_name': np.asarray(self.stop_names, dtype=object)[stop_index],
+            'projected_time': minutes.astype('datetime64[m]').astype('datetime64[ns]'),
+            'predicted_count': np.concatenate([s[3] for s in steps]),
+        })
+
+def generate_history(n_days, start_date='2024-01-01', seed=0):
+    """Generate `n_days` of data from `start_date` with a fixed seed"""
+    random.seed(seed)
+    return generate_bus_data(start_date=start_date, days=n_days)
+
+def one_step_targets(df):
+    """Pair each stop record with the next stop of the same trip"""
+    df = df.assign(service_date=pd.to_datetime(df['timestamp']).dt.normalize())
+    df = df.sort_values(['bus_id', 'service_date', 'trip_number', 'direction', 'timestamp']).reset_index(drop=True)
+    nxt = df.shift(-1)
+    same = ((nxt['bus_id'] == df['bus_id']) & (nxt['service_date'] == df['service_date']) &
+            (nxt['trip_number'] == df['trip_number']) & (nxt['direction'] == df['direction']))
+    return df[same], nxt[same]
+
+def main():
+    """Train on generated history, score held-out days and time fleet inference"""
+    print("Next-Stop Occupancy Forecasting")
+    print("=" * 50)
+
+    history = generate_history(35)
+    cutoff = history['timestamp'].min().normalize() + pd.Timedelta(days=28)
+    train, test = history[history['timestamp'] < cutoff], history[history['timestamp'] >= cutoff]
+
+    start = time.perf_counter()
+    model = OccupancyForecaster()
+    for _, week in train.groupby(train['timestamp'].dt.isocalendar().week):
+        model.partial_fit(week)
+    model.calibrate(train)
+    elapsed = time.perf_counter() - start
+    print(f"1. Trained on {len(train):,} records ({train['timestamp'].dt.date.nunique()} days) "
+          f"in {elapsed * 1000:.0f} ms, persistence weight {model.persistence:.2f}")
+
+    current, target = one_step_targets(test)
+    predicted, _ = model.predict(current['direction'].values, current['stop_name'].values,
+                                 current['validated_count'].values, current['timestamp'].values, n_stops=1)
+    mae = np.abs(predicted[:, 0] - target['validated_count'].values).mean()
+    naive = np.abs(current['validated_count'].values - target['validated_count'].values).mean()
+    print(f"2. Held-out next-stop MAE: {mae:.2f} passengers (carry-forward baseline: {naive:.2f})")
+
+    # Score a large fleet snapshot in one call
+    n_buses = 10_000
+    rng = np.random.default_rng(1)
+    directions = rng.choice(DIRECTIONS, n_buses)
+    stops = rng.choice(model.stop_names, n_buses)
+    loads = rng.integers(0, MAX_CAPACITY + 1, n_buses)
+    now = np.full(n_buses, np.datetime64('2024-02-05T08:10'))
+    model.predict(directions, stops, loads, now, n_stops=5)
+    start = time.perf_counter()
+    fleet_forecast, next_stops = model.predict(directions, stops, loads, now, n_stops=5)
+    elapsed = time.perf_counter() - start
+    print(f"3. Forecast 5 stops ahead for {n_buses:,} buses in {elapsed * 1000:.1f} ms")
+    print(f"   Example: {directions[0]} bus at {stops[0]} with {loads[0]} passengers -> " +
+          ", ".join(f"{s}: {p:.0f}" for s, p in zip(next_stops[0], fleet_forecast[0])))
+
+if __name__ == "__main__":
+    main()
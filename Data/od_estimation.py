@@ -0,0 +1,203 @@
+import pandas as pd
+import numpy as np
+import time
+
+from bus_data_generator import ROUTE_STOPS
+from passenger_km import route_from_bus_id
+
+DIRECTIONS = ['Forward', 'Backward']
+
+# Iterative proportional fitting controls
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-4               # Max row/column sum error relative to trip volume
+MEMORY_BUDGET_BYTES = 256 * 1024 * 1024
+
+def ipf(boardings, alightings, seed=None, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """Estimate per-trip OD matrices by iterative proportional fitting.
+
+    `boardings` and `alightings` are (n_trips, n_stops) arrays in travel order.
+    Trips are fitted together as one (n_trips, n_stops, n_stops) array, so each
+    iteration is two broadcast multiplications. Passengers can only travel
+    forward, so the seed is strictly upper triangular. Alightings are rescaled
+    to the boarding total of each trip so the margins are consistent. Trips
+    drop out of the iteration as soon as they converge.
+
+    Returns (od, converged, iterations, max_error) where max_error is the
+    worst relative row error among trips that did not converge.
+    """
+    boardings = np.asarray(boardings, dtype=np.float64)
+    alightings = np.asarray(alightings, dtype=np.float64)
+    n_trips, n_stops = boardings.shape
+
+    total = boardings.sum(axis=1)
+    alight_total = alightings.sum(axis=1)
+    col_target = alightings * np.divide(total, alight_total, out=np.zeros_like(total),
+                                        where=alight_total > 0)[:, None]
+
+    if seed is None:
+        seed = np.triu(np.ones((n_stops, n_stops)), k=1)
+    od = np.broadcast_to(seed, (n_trips, n_stops, n_stops)).copy()
+
+    scale = np.maximum(total, 1.0)
+    converged = np.zeros(n_trips, dtype=bool)
+    active = np.arange(n_trips)
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        block, rows, cols = od[active], boardings[active], col_target[active]
+        row_sum = block.sum(axis=2)
+        block *= np.divide(rows, row_sum, out=np.zeros_like(row_sum), where=row_sum > 0)[:, :, None]
+        col_sum = block.sum(axis=1)
+        block *= np.divide(cols, col_sum, out=np.zeros_like(col_sum), where=col_sum > 0)[:, None, :]
+        od[active] = block
+
+        # Columns are exact after the column step; convergence is judged on the rows
+        row_error = np.abs(block.sum(axis=2) - rows).max(axis=1, initial=0.0) / scale[active]
+        done = row_error < tolerance
+        converged[active[done]] = True
+        active = active[~done]
+        if len(active) == 0:
+            break
+
+    max_error = 0.0
+    if len(active):
+        max_error = float((np.abs(od[active].sum(axis=2) - boardings[active]).max(axis=1) / scale[active]).max())
+    return od, converged, iteration, max_error
+
+def trip_margins(df, stop_names):
+    """Boarding and alighting vectors per trip, in travel order.
+
+    Passengers already on board at a trip's first stop are counted as
+    boarding there, since their true origin is unknown.
+    """
+    df = df.sort_values('timestamp', kind='stable')
+    n_stops = len(stop_names)
+    direction = df['direction'].values
+    stop_code = pd.Categorical(df['stop_name'], categories=stop_names).codes.astype(np.int64)
+    if (stop_code < 0).any():
+        raise ValueError("Data contains stops outside the route's stop sequence")
+    position = np.where(direction == 'Backward', n_stops - 1 - stop_code, stop_code)
+
+    # Trip numbers restart every day, so the service date is part of the trip key
+    service_date = pd.to_datetime(df['timestamp']).dt.normalize().values
+    trip_key = pd.MultiIndex.from_arrays([df['bus_id'].values, service_date, df['trip_number'].values, direction])
+    trip_index, trips = pd.factorize(trip_key)
+    n_trips = len(trips)
+
+    flat = trip_index * n_stops + position
+    boardings = np.bincount(flat, weights=df['boarding'].values, minlength=n_trips * n_stops).reshape(n_trips, n_stops)
+    alightings = np.bincount(flat, weights=df['alighting'].values, minlength=n_trips * n_stops).reshape(n_trips, n_stops)
+
+    # Load carried into the first stop = on-board count after it - net boarding there
+    first_row = np.full(n_trips, -1)
+    first_row[trip_index[::-1]] = np.arange(len(df))[::-1]
+    first = df.iloc[first_row]
+    carried = np.maximum(first['actual_count'].values - first['boarding'].values + first['alighting'].values, 0)
+    boardings[np.arange(n_trips), position[first_row]] += carried
+
+    trip_info = pd.DataFrame({
+        'bus_id': trips.get_level_values(0),
+        'service_date': trips.get_level_values(1),
+        'trip_number': trips.get_level_values(2),
+        'direction': trips.get_level_values(3),
+        'hour': pd.to_datetime(first['timestamp']).dt.hour.values,
+    })
+    return boardings, alightings, trip_info
+
+def estimate_od(df, stop_sequences=None, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE,
+                memory_budget=MEMORY_BUDGET_BYTES):
+    """Estimate OD matrices per trip and aggregate them by route, hour and direction.
+
+    `stop_sequences` maps route -> stop names in forward order (default: the
+    generator's route for every route). Trips are fitted in chunks sized to
+    the memory budget. Returns a dict keyed by (route, direction) holding the
+    stop order, the hours present and an (n_hours, n_stops, n_stops) array of
+    summed OD flows, plus a fit summary.
+    """
+    routes = df['route'].values if 'route' in df.columns else route_from_bus_id(df['bus_id'])
+    results = {}
+    summary = {'trips': 0, 'converged': 0, 'max_error': 0.0, 'max_iterations_used': 0}
+
+    for route in pd.unique(routes):
+        stop_names = (stop_sequences or {}).get(route, [s['name'] for s in ROUTE_STOPS])
+        n_stops = len(stop_names)
+        boardings, alightings, trip_info = trip_margins(df[routes == route], stop_names)
+
+        # Bytes per trip: OD array plus temporaries from the broadcast updates
+        chunk = max(1, memory_budget // (3 * n_stops * n_stops * 8))
+
+        for direction in DIRECTIONS:
+            in_direction = np.flatnonzero(trip_info['direction'].values == direction)
+            if len(in_direction) == 0:
+                continue
+            hours = trip_info['hour'].values[in_direction]
+            hour_values = np.unique(hours)
+            totals = np.zeros((len(hour_values), n_stops, n_stops))
+            hour_slot = np.searchsorted(hour_values, hours)
+
+            for start in range(0, len(in_direction), chunk):
+                rows = in_direction[start:start + chunk]
+                od, converged, iterations, max_error = ipf(boardings[rows], alightings[rows],
+                                                           max_iterations=max_iterations, tolerance=tolerance)
+                # Sum each chunk's trips into their hour slots
+                slots = hour_slot[start:start + chunk]
+                order = np.argsort(slots, kind='stable')
+                starts = np.flatnonzero(np.diff(slots[order], prepend=-1))
+                totals[slots[order][starts]] += np.add.reduceat(od[order], starts, axis=0)
+
+                summary['trips'] += len(rows)
+                summary['converged'] += int(converged.sum())
+                summary['max_error'] = max(summary['max_error'], float(max_error))
+                summary['max_iterations_used'] = max(summary['max_iterations_used'], iterations)
+
+            travel_order = stop_names if direction == 'Forward' else stop_names[::-1]
+            results[(route, direction)] = {'stops': list(travel_order), 'hours': hour_values, 'od': totals}
+
+    return results, summary
+
+def od_table(results, route, direction, hours=None):
+    """Labelled OD matrix for one route and direction, summed over the given hours"""
+    entry = results[(route, direction)]
+    mask = np.ones(len(entry['hours']), dtype=bool) if hours is None else np.isin(entry['hours'], hours)
+    return pd.DataFrame(entry['od'][mask].sum(axis=0), index=entry['stops'], columns=entry['stops'])
+
+def synthetic_margins(n_trips, n_stops, seed=0):
+    """Random but consistent boarding/alighting vectors drawn from a known OD pattern"""
+    rng = np.random.default_rng(seed)
+    true_od = rng.poisson(2.0, (n_trips, n_stops, n_stops)) * np.triu(np.ones((n_stops, n_stops)), k=1)
+    return true_od.sum(axis=2), true_od.sum(axis=1)
+
+def main():
+    """Estimate OD flows for the dataset and benchmark large fits"""
+    print("Origin-Destination Estimation (IPF)")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    results, summary = estimate_od(df)
+    print(f"1. Fitted {summary['trips']} trips, {summary['converged']} converged "
+          f"(max error {summary['max_error']:.1e}, up to {summary['max_iterations_used']} iterations)")
+    print("\n2. Morning peak (7-9h) forward OD flows, route 138:")
+    print(od_table(results, '138', 'Forward', hours=[7, 8, 9]).round(0).astype(int).to_string())
+
+    # Benchmarks on synthetic margins
+    print("\n3. IPF throughput on synthetic margins:")
+    for n_trips, n_stops in [(1_000_000, 6), (2_000, 200)]:
+        boardings, alightings = synthetic_margins(n_trips, n_stops)
+        chunk = max(1, MEMORY_BUDGET_BYTES // (3 * n_stops * n_stops * 8))
+        start = time.perf_counter()
+        converged = 0
+        for lo in range(0, n_trips, chunk):
+            _, ok, _, _ = ipf(boardings[lo:lo + chunk], alightings[lo:lo + chunk])
+            converged += int(ok.sum())
+        elapsed = time.perf_counter() - start
+        print(f"   - {n_trips:,} trips x {n_stops} stops: {elapsed:.2f}s "
+              f"({n_trips / elapsed:,.0f} trips/s), {converged / n_trips * 100:.1f}% converged")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import pandas as pd
+import numpy as np
+import time
+
+from bus_data_generator import ROUTE_STOPS
+from event_log import build_fleet_history
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between coordinate arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def route_from_bus_id(bus_ids):
+    """Route number embedded in ids like 'BUS-138-CMB'"""
+    codes, uniques = pd.factorize(np.asarray(bus_ids))
+    routes = np.array([bus.split('-')[1] for bus in uniques], dtype=object)
+    return routes[codes]
+
+def compute_segments(df, load_column='validated_count'):
+    """Build one row per travelled segment between consecutive stops of each trip.
+
+    The load on a segment is the on-board count recorded at the stop the bus
+    departs from (after boarding and alighting there).
+    """
+    routes = df['route'].values if 'route' in df.columns else route_from_bus_id(df['bus_id'])
+    timestamps = pd.to_datetime(df['timestamp']).values
+
+    # Order rows so each trip's stops are contiguous and in time order; trip numbers
+    # restart every day, so the service date is part of the trip key
+    service_date = timestamps.astype('datetime64[D]')
+    trip_key = np.zeros(len(df), dtype=np.int64)
+    for values in (df['bus_id'].values, service_date, df['trip_number'].values, df['direction'].values):
+        codes, uniques = pd.factorize(values)
+        trip_key = trip_key * len(uniques) + codes
+    order = np.lexsort((timestamps, trip_key))
+    trip_key = trip_key[order]
+
+    # A segment starts at every row whose successor belongs to the same trip
+    has_next = np.zeros(len(df), dtype=bool)
+    has_next[:-1] = trip_key[1:] == trip_key[:-1]
+    frm = order[np.flatnonzero(has_next)]
+    to = order[np.flatnonzero(has_next) + 1]
+
+    lat = df['latitude'].values
+    lon = df['longitude'].values
+    load = df[load_column].values
+    distance_km = haversine_km(lat[frm], lon[frm], lat[to], lon[to])
+
+    return pd.DataFrame({
+        'route': routes[frm],
+        'bus_id': df['bus_id'].values[frm],
+        'trip_number': df['trip_number'].values[frm],
+        'direction': df['direction'].values[frm],
+        'hour': pd.DatetimeIndex(timestamps[frm]).hour,
+        'from_stop': df['stop_name'].values[frm],
+        'to_stop': df['stop_name'].values[to],
+        'distance_km': distance_km,
+        'load': load[frm],
+        'passenger_km': load[frm] * distance_km,
+    })
+
+def passenger_km_by_route_hour(segments):
+    """Passenger-km, vehicle-km and average load by route, hour and direction"""
+    summary = segments.groupby(['route', 'hour', 'direction'], sort=True).agg(
+        passenger_km=('passenger_km', 'sum'),
+        vehicle_km=('distance_km', 'sum'),
+        segments=('load', 'size'),
+        max_load=('load', 'max'),
+    )
+    summary['average_load'] = summary['passenger_km'] / summary['vehicle_km']
+    return summary.reset_index()
+
+def segment_load_profile(segments):
+    """Average and peak load on each route segment"""
+    profile = segments.groupby(['route', 'direction', 'from_stop', 'to_stop'], sort=False).agg(
+        distance_km=('distance_km', 'first'),
+        average_load=('load', 'mean'),
+        max_load=('load', 'max'),
+        passenger_km=('passenger_km', 'sum'),
+    ).reset_index()
+
+    # Present segments in route order
+    stop_order = {s['name']: i for i, s in enumerate(ROUTE_STOPS)}
+    position = profile['from_stop'].map(stop_order).fillna(len(stop_order))
+    position = np.where(profile['direction'] == 'Backward', -position, position)
+    return profile.assign(_pos=position).sort_values(['route', 'direction', '_pos']).drop(columns='_pos')
+
+def main():
+    """Compute passenger-km for the dataset and benchmark a fleet-sized run"""
+    print("Passenger-km and Segment Loads")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    segments = compute_segments(df)
+    summary = passenger_km_by_route_hour(segments)
+    print(f"1. Total: {segments['passenger_km'].sum():,.1f} passenger-km over "
+          f"{segments['distance_km'].sum():,.1f} vehicle-km ({len(segments)} segments)")
+    print("\n2. Segment load profile:")
+    print(segment_load_profile(segments).to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    print("\n3. Busiest route-hours:")
+    print(summary.sort_values('passenger_km', ascending=False).head(5).to_string(
+        index=False, float_format=lambda x: f"{x:.1f}"))
+
+    # Fleet-sized benchmark: many buses over several days
+    fleet = build_fleet_history(df, n_buses=1000, n_days=10)
+    n_trips = len(fleet) // len(ROUTE_STOPS)
+    start = time.perf_counter()
+    fleet_segments = compute_segments(fleet)
+    fleet_summary = passenger_km_by_route_hour(fleet_segments)
+    elapsed = time.perf_counter() - start
+    print(f"\n4. Fleet run: {len(fleet):,} stop events ({n_trips:,} one-way trips) -> "
+          f"{len(fleet_summary)} route-hour-direction cells in {elapsed:.2f}s")
+
+    # Multi-day check: every one-way trip has one segment fewer than it has stops,
+    # so no segment may join the last stop of one day to the first stop of the next
+    expected = n_trips * (len(ROUTE_STOPS) - 1)
+    bus_days = fleet['bus_id'].nunique() * fleet['timestamp'].dt.normalize().nunique()
+    print(f"5. Multi-day check: {len(fleet_segments):,} segments (expected {expected:,}), "
+          f"{fleet_segments['distance_km'].sum() / bus_days:.1f} vehicle-km per bus-day")
+    if len(fleet_segments) != expected:
+        raise ValueError("Segments cross trip boundaries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import pandas as pd
+import numpy as np
+import json
+import time
+from scipy import stats
+
+from event_log import build_fleet_history
+from passenger_km import route_from_bus_id
+
+# Sketch size: at most about 3k retained values; at k=200 the worst rank error
+# over 99 quantiles stays under about 1.7% (see main())
+DEFAULT_K = 200
+PERCENTILES = (50, 90, 99)
+CELL_DIMENSIONS = ['route', 'stop', 'hour']
+
+CONFIDENCE = 0.95
+TARGET_PRECISION = 0.01    # Relative CI half-width used to suggest a replica count
+
+class KLLSketch:
+    """Mergeable quantile sketch with bounded memory (KLL compactors).
+
+    Values sit in levels; an item at level h stands for 2**h inputs. When a
+    level outgrows its capacity it is sorted and every other item (random
+    offset) is promoted to the next level, so total weight is preserved and
+    each compaction moves any rank by at most 2**h. Capacities shrink
+    geometrically below the top level, keeping at most about 3k items. The
+    normalized rank error of a quantile is O(1/k); main() measures it.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, height):
+        depth = len(self.levels) - height - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        height = 0
+        while height < len(self.levels):
+            level = self.levels[height]
+            if len(level) > self._capacity(height):
+                if height + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                level = np.sort(level)
+                # An odd item out stays behind so weight is conserved
+                odd = len(level) % 2
+                promoted = level[odd:][self._rng.integers(2)::2]
+                self.levels[height] = level[:odd]
+                self.levels[height + 1] = np.concatenate([self.levels[height + 1], promoted])
+            height += 1
+
+    def update(self, values):
+        """Add one value or an array of values"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for height, level in enumerate(other.levels):
+            self.levels[height] = np.concatenate([self.levels[height], level])
+        self.n += other.n
+        self._compress()
+        return self
+
+    @classmethod
+    def merged(cls, sketches, k=DEFAULT_K):
+        result = cls(k)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    @property
+    def size(self):
+        """Number of retained values"""
+        return sum(len(level) for level in self.levels)
+
+    def _sorted_weights(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Approximate value at quantile(s) q in [0, 1]"""
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        items, cumulative = self._sorted_weights()
+        index = np.searchsorted(cumulative, np.asarray(q) * cumulative[-1], side='left')
+        return items[np.minimum(index, len(items) - 1)]
+
+    def rank(self, x):
+        """Approximate fraction of inputs <= x"""
+        items, cumulative = self._sorted_weights()
+        index = np.searchsorted(items, x, side='right')
+        return np.where(index > 0, cumulative[np.maximum(index - 1, 0)], 0.0) / max(self.n, 1)
+
+    def to_arrays(self):
+        return np.concatenate(self.levels), np.array([len(level) for level in self.levels]), self.n
+
+    @classmethod
+    def from_arrays(cls, items, lengths, n, k=DEFAULT_K):
+        sketch = cls(k)
+        sketch.levels = np.split(np.asarray(items, dtype=np.float64), np.cumsum(lengths)[:-1])
+        sketch.n = int(n)
+        return sketch
+
+class RunningStats:
+    """Welford's online mean and variance, mergeable with Chan's parallel update"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        return self
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def confidence_interval(self, confidence=CONFIDENCE):
+        """Student-t interval for the mean"""
+        if self.n < 2:
+            return self.mean, np.nan, np.nan
+        half_width = stats.t.ppf((1 + confidence) / 2, self.n - 1) * self.std / np.sqrt(self.n)
+        return self.mean, self.mean - half_width, self.mean + half_width
+
+    def replicas_for_precision(self, precision=TARGET_PRECISION, confidence=CONFIDENCE):
+        """Replicas needed for a CI half-width of `precision` x mean"""
+        if self.n < 2 or self.mean == 0:
+            return np.nan
+        z = stats.norm.ppf((1 + confidence) / 2)
+        return int(np.ceil((z * self.std / (precision * abs(self.mean))) ** 2))
+
+class CellSketches:
+    """One KLL sketch of a metric per route x stop x hour cell.
+
+    Cells match the rollup cube's dimensions, so percentiles for any group of
+    cells come from merging their sketches. Ingestion takes chunks of rows in
+    the generator's schema and can run alongside RollupCube.ingest.
+    """
+
+    def __init__(self, column='validated_count', k=DEFAULT_K):
+        self.column = column
+        self.k = k
+        self.sketches = {}
+
+    def ingest(self, df):
+        routes = df['route'].values if 'route' in df.columns else route_from_bus_id(df['bus_id'])
+        hours = pd.to_datetime(df['timestamp']).dt.hour.values
+        values = df[self.column].values.astype(np.float64)
+        groups = pd.Series(values).groupby([routes, df['stop_name'].values, hours], sort=False)
+        for key, rows in groups.indices.items():
+            sketch = self.sketches.get(key)
+            if sketch is None:
+                sketch = self.sketches[key] = KLLSketch(self.k)
+            sketch.update(values[rows])
+        return self
+
+    def merge(self, other):
+        for key, sketch in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = KLLSketch(self.k).merge(sketch)
+        return self
+
+    def percentiles(self, by=('hour',), percentiles=PERCENTILES, routes=None, stops=None, hours=None):
+        """Percentiles of the metric per group, e.g. per hour or per stop x hour"""
+        by = list(by)
+        positions = [CELL_DIMENSIONS.index(d) for d in by]
+        filters = [routes, stops, hours]
+        groups = {}
+        for key, sketch in self.sketches.items():
+            if any(f is not None and key[i] not in f for i, f in enumerate(filters)):
+                continue
+            groups.setdefault(tuple(key[p] for p in positions), []).append(sketch)
+
+        q = np.asarray(percentiles) / 100
+        rows = {group: KLLSketch.merged(sketches, self.k).quantile(q) for group, sketches in groups.items()}
+        frame = pd.DataFrame.from_dict(rows, orient='index', columns=[f"p{p:g}" for p in percentiles])
+        if by:
+            frame.index = pd.MultiIndex.from_tuples(frame.index, names=by) if len(by) > 1 else \
+                pd.Index([g[0] for g in frame.index], name=by[0])
+        return frame.sort_index()
+
+    @property
+    def memory_bytes(self):
+        return sum(s.size for s in self.sketches.values()) * 8
+
+    def save(self, path):
+        keys = list(self.sketches)
+        parts = [self.sketches[key].to_arrays() for key in keys]
+        np.savez(path,
+                 keys=np.array(json.dumps([[str(key[0]), str(key[1]), int(key[2])] for key in keys])),
+                 meta=np.array(json.dumps({'column': self.column, 'k': self.k})),
+                 items=np.concatenate([p[0] for p in parts]) if parts else np.empty(0),
+                 n_levels=np.array([len(p[1]) for p in parts], dtype=np.int64),
+                 lengths=np.concatenate([p[1] for p in parts]) if parts else np.empty(0, dtype=np.int64),
+                 counts=np.array([p[2] for p in parts], dtype=np.int64))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        meta = json.loads(str(data['meta']))
+        cells = cls(meta['column'], meta['k'])
+        item_offsets = np.cumsum(np.concatenate([[0], data['lengths']]))
+        level_offsets = np.cumsum(np.concatenate([[0], data['n_levels']]))
+        for i, key in enumerate(json.loads(str(data['keys']))):
+            lo, hi = level_offsets[i], level_offsets[i + 1]
+            items = data['items'][item_offsets[lo]:item_offsets[hi]]
+            cells.sketches[tuple(key)] = KLLSketch.from_arrays(items, data['lengths'][lo:hi], data['counts'][i], meta['k'])
+        return cells
+
+def main():
+    """Measure sketch error and memory, then sketch a fleet's occupancy per cell"""
+    print("Streaming Approximate Quantiles (KLL)")
+    print("=" * 50)
+
+    # 1. Rank error on a skewed stream, fed in chunks and merged from shards
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.gamma(2.0, 8.0, 1_500_000), rng.normal(45, 3, 500_000)])
+    rng.shuffle(values)
+    shards = [KLLSketch().update(chunk) for chunk in np.array_split(values, 8)]
+    sketch = KLLSketch.merged(shards)
+    q = np.linspace(0.01, 0.99, 99)
+    estimates = sketch.quantile(q)
+    exact_rank = np.searchsorted(np.sort(values), estimates, side='right') / len(values)
+    print(f"1. {len(values):,} values in {sketch.size:,} retained items ({sketch.size * 8 / 1024:.0f} KiB): "
+          f"max rank error {np.abs(exact_rank - q).max() * 100:.2f}% over 99 quantiles (k={DEFAULT_K})")
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    # 2. Per-cell occupancy sketches fed one day at a time
+    fleet = build_fleet_history(df, n_buses=300, n_days=30)
+    fleet['validated_count'] = np.clip(fleet['validated_count'] + rng.integers(-3, 4, len(fleet)), 0, 50)
+    cells = CellSketches()
+    start = time.perf_counter()
+    for _, day in fleet.groupby(fleet['timestamp'].dt.date):
+        cells.ingest(day)
+    elapsed = time.perf_counter() - start
+    print(f"2. Sketched {len(fleet):,} records into {len(cells.sketches)} stop-hour cells in {elapsed:.1f}s, "
+          f"{cells.memory_bytes / 1024:.0f} KiB (raw column: {len(fleet) * 8 / 1024 ** 2:.0f} MiB)")
+
+    bands = cells.percentiles(['hour'])
+    exact = fleet.groupby(fleet['timestamp'].dt.hour)['validated_count'].quantile([0.5, 0.9, 0.99]).unstack()
+    print(f"3. Hourly P50/P90/P99 max deviation from exact: {np.abs(bands.values - exact.values).max():.1f} passengers")
+    print(bands.head(6).to_string())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import pandas as pd
+import numpy as np
+import argparse
+import heapq
+import socket
+import sys
+import threading
+import time
+from operator import itemgetter
+
+from event_log import build_fleet_history
+from quantile_sketch import KLLSketch, RunningStats
+
+DEFAULT_SOURCE = 'bus_overcrowding_data.csv'
+DEFAULT_SPEEDUP = 1000.0
+MAX_BATCH_RECORDS = 1000      # Records written per send when the streamer is behind
+SPIN_SECONDS = 0.002          # Busy-wait the last stretch before a send; sleep() alone overshoots
+LATE_THRESHOLD_MS = 10.0
+STAGGER_MINUTES = 60          # Replicated buses start up to this much apart, so they do not report in lockstep
+
+def load_records(paths, n_buses=None, n_days=1, stagger_minutes=STAGGER_MINUTES, seed=0):
+    """Stop records from one or more CSV files, optionally replicated into a larger fleet
+    with each bus shifted by its own offset"""
+    frames = [pd.read_csv(path) for path in paths]
+    df = pd.concat(frames, ignore_index=True)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    if n_buses:
+        df = build_fleet_history(df, n_buses, n_days)
+        codes, buses = pd.factorize(df['bus_id'])
+        offsets = np.random.default_rng(seed).uniform(0, stagger_minutes * 60, len(buses))
+        df['timestamp'] = df['timestamp'] + pd.to_timedelta(np.round(offsets[codes]), unit='s')
+    return df
+
+def bus_streams(df, fmt='json'):
+    """One time-ordered list of (unix seconds, encoded line) per bus"""
+    df = df.sort_values(['bus_id', 'timestamp'], kind='stable').reset_index(drop=True)
+    seconds = df['timestamp'].values.astype('datetime64[ms]').astype(np.int64) / 1000
+    if fmt == 'json':
+        lines = df.to_json(orient='records', lines=True, date_format='iso').splitlines()
+    else:
+        lines = df.to_csv(index=False, header=False).splitlines()
+    lines = [line.encode() + b'\n' for line in lines]
+    bounds = np.flatnonzero(df['bus_id'].values[1:] != df['bus_id'].values[:-1]) + 1
+    starts, ends = np.concatenate([[0], bounds]), np.concatenate([bounds, [len(df)]])
+    seconds = seconds.tolist()
+    return [list(zip(seconds[start:end], lines[start:end])) for start, end in zip(starts, ends)]
+
+def merge_streams(streams):
+    """Lazily interleave per-bus streams in timestamp order"""
+    return heapq.merge(*streams, key=itemgetter(0))
+
+class LoopbackReceiver:
+    """Local TCP consumer that counts what it receives, for self-tests"""
+
+    def __init__(self, host='127.0.0.1'):
+        self.server = socket.create_server((host, 0))
+        self.address = self.server.getsockname()
+        self.bytes = 0
+        self.lines = 0
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        conn, _ = self.server.accept()
+        with conn:
+            while True:
+                data = conn.recv(1 << 16)
+                if not data:
+                    break
+                self.bytes += len(data)
+                self.lines += data.count(b'\n')
+
+    def wait(self, timeout=10):
+        self._thread.join(timeout)
+        self.server.close()
+
+class SocketSink:
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def write(self, data):
+        self.sock.sendall(data)
+
+    def close(self):
+        self.sock.close()
+
+class PipeSink:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout.buffer
+
+    def write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+class ReplayStats:
+    """Throughput and pacing lag (send time minus scheduled time) of a replay"""
+
+    def __init__(self):
+        self.records = 0
+        self.bytes = 0
+        self.late = 0
+        self.lag = RunningStats()
+        self.lag_sketch = KLLSketch(seed=0)
+        self.max_lag = 0.0
+        self.wall_seconds = 0.0
+        self.simulated_seconds = 0.0
+
+    def add_batch(self, lags_ms, n_bytes):
+        self.records += len(lags_ms)
+        self.bytes += n_bytes
+        self.lag_sketch.update(lags_ms)
+        for lag in lags_ms:
+            self.lag.update(lag)
+        self.late += sum(lag > LATE_THRESHOLD_MS for lag in lags_ms)
+        self.max_lag = max(self.max_lag, max(lags_ms))
+
+    def summary(self):
+        p50, p99 = self.lag_sketch.quantile([0.5, 0.99]) if self.records else (np.nan, np.nan)
+        return {
+            'records': self.records,
+            'bytes': self.bytes,
+            'wall_seconds': self.wall_seconds,
+            'simulated_seconds': self.simulated_seconds,
+            'achieved_speedup': self.simulated_seconds / self.wall_seconds if self.wall_seconds else np.nan,
+            'records_per_second': self.records / self.wall_seconds if self.wall_seconds else np.nan,
+            'lag_mean_ms': self.lag.mean,
+            'lag_p50_ms': p50,
+            'lag_p99_ms': p99,
+            'lag_max_ms': self.max_lag,
+            'late_percent': self.late / max(self.records, 1) * 100,
+        }
+
+def sleep_until(target):
+    remaining = target - time.perf_counter()
+    if remaining > SPIN_SECONDS:
+        time.sleep(remaining - SPIN_SECONDS)
+    while time.perf_counter() < target:
+        pass
+
+def replay(records, sink, speedup=DEFAULT_SPEEDUP, max_seconds=None):
+    """Send (unix seconds, line) records so that simulated time runs `speedup` times faster than wall time.
+
+    Each record is due at start + (timestamp - first timestamp) / speedup.
+    Records that are due are written together in one send, so a streamer
+    that falls behind catches up in batches instead of paying one write
+    per record; lag is measured per record after its send completes.
+    """
+    if speedup <= 0:
+        raise ValueError("speedup must be positive")
+    stats = ReplayStats()
+    batch, targets = [], []
+    first = None
+    start = time.perf_counter()
+    deadline = start + max_seconds if max_seconds else None
+
+    def flush():
+        data = b''.join(batch)
+        sink.write(data)
+        sent = time.perf_counter()
+        stats.add_batch([(sent - target) * 1000 for target in targets], len(data))
+        batch.clear()
+        targets.clear()
+
+    last = None
+    for timestamp, line in records:
+        if first is None:
+            first = timestamp
+        target = start + (timestamp - first) / speedup
+        if deadline is not None and target > deadline:
+            if batch:
+                flush()
+            sleep_until(deadline)
+            last = first + max_seconds * speedup
+            break
+        if target > time.perf_counter() or len(batch) >= MAX_BATCH_RECORDS:
+            if batch:
+                flush()
+            sleep_until(target)
+        batch.append(line)
+        targets.append(target)
+        last = timestamp
+    if batch:
+        flush()
+
+    stats.wall_seconds = time.perf_counter() - start
+    stats.simulated_seconds = (last - first) if first is not None else 0.0
+    return stats
+
+def format_report(summary, speedup, n_buses):
+    return [
+        f"1. Replayed {summary['records']:,} records from {n_buses:,} buses "
+        f"({summary['simulated_seconds'] / 3600:.1f} simulated hours) in {summary['wall_seconds']:.1f}s",
+        f"2. Achieved speed-up {summary['achieved_speedup']:.0f}x (target {speedup:g}x), "
+        f"{summary['records_per_second']:,.0f} records/s, {summary['bytes'] / 1024 ** 2:.1f} MiB sent",
+        f"3. Pacing lag: mean {summary['lag_mean_ms']:.2f} ms, P50 {summary['lag_p50_ms']:.2f} ms, "
+        f"P99 {summary['lag_p99_ms']:.2f} ms, max {summary['lag_max_ms']:.1f} ms; "
+        f"{summary['late_percent']:.2f}% later than {LATE_THRESHOLD_MS:g} ms",
+    ]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay stored stop records in timestamp order at a chosen speed-up")
+    parser.add_argument('sources', nargs='*', default=[DEFAULT_SOURCE], help="CSV files of stop records")
+    parser.add_argument('--speedup', type=float, default=DEFAULT_SPEEDUP, help="simulated seconds per wall second")
+    parser.add_argument('--buses', type=int, default=200, help="replicate the records into this many buses (0: as stored)")
+    parser.add_argument('--days', type=int, default=1, help="days of history when replicating")
+    parser.add_argument('--stagger', type=float, default=STAGGER_MINUTES,
+                        help="spread replicated buses over this many minutes")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help="line format")
+    parser.add_argument('--output', choices=['loopback', 'tcp', 'stdout'], default='loopback',
+                        help="local counting receiver, a TCP consumer (--host/--port) or stdout for pipes")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--max-seconds', type=float, default=None, help="stop after this much wall time")
+    args = parser.parse_args(argv)
+    if not 1 <= args.speedup <= 1000:
+        parser.error("--speedup must be between 1 and 1000")
+    return args
+
+def main(argv=None):
+    """Replay recorded stop data to a consumer and report throughput and lag"""
+    args = parse_args(argv)
+    # Data goes to stdout in pipe mode, so the report moves to stderr
+    log = sys.stderr if args.output == 'stdout' else sys.stdout
+    print("Replay Streamer", file=log)
+    print("=" * 50, file=log)
+
+    try:
+        df = load_records(args.sources, n_buses=args.buses or None, n_days=args.days,
+                          stagger_minutes=args.stagger)
+    except FileNotFoundError as e:
+        print(f"Error: {e.filename} not found!", file=log)
+        print("Please run bus_data_generator.py first to generate the data.", file=log)
+        return
+
+    streams = bus_streams(df, args.format)
+    receiver = None
+    if args.output == 'loopback':
+        receiver = LoopbackReceiver()
+        sink = SocketSink(*receiver.address)
+    elif args.output == 'tcp':
+        sink = SocketSink(args.host, args.port)
+    else:
+        sink = PipeSink()
+
+    try:
+        stats = replay(merge_streams(streams), sink, args.speedup, args.max_seconds)
+    except (BrokenPipeError, ConnectionError) as e:
+        print(f"Consumer disconnected: {e}", file=log)
+        return
+    finally:
+        sink.close()
+
+    for line in format_report(stats.summary(), args.speedup, len(streams)):
+        print(line, file=log)
+    if receiver is not None:
+        receiver.wait()
+        print(f"4. Loopback consumer received {receiver.lines:,} lines ({receiver.bytes:,} bytes)", file=log)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import pandas as pd
+import numpy as np
+import time
+
+from event_log import build_fleet_history
+
+# Event time is bucketed per minute; windows are whole numbers of buckets
+BUCKET_SECONDS = 60
+WINDOW_MINUTES = (15, 60)
+# Events older than this behind the newest event seen are dropped as too late
+ALLOWED_LATENESS_MINUTES = 60
+
+MEASURES = ['records', 'occupancy_sum', 'alerts', 'boarding']
+
+class WindowedAggregator:
+    """Sliding event-time windows of stop-record measures for many keys.
+
+    Each key keeps a ring of per-minute buckets plus a running total per
+    window. An update adds to one bucket and the totals of the windows that
+    cover it; moving a key's window forward subtracts each bucket exactly once
+    as it leaves, so updates are O(1) amortized. Late events still inside a
+    window are applied to the right bucket; older ones are counted and dropped.
+    """
+
+    def __init__(self, window_minutes=WINDOW_MINUTES, allowed_lateness_minutes=ALLOWED_LATENESS_MINUTES,
+                 initial_keys=1024):
+        self.windows = np.array(sorted(window_minutes))
+        self.n_buckets = int(self.windows.max())
+        self.lateness = allowed_lateness_minutes
+        self.keys = {}
+        self.watermark = None   # Newest event bucket seen across all keys
+        self.late_dropped = 0
+
+        self._buckets = np.zeros((initial_keys, self.n_buckets, len(MEASURES)))
+        self._bucket_id = np.full((initial_keys, self.n_buckets), -1, dtype=np.int64)
+        self._totals = np.zeros((initial_keys, len(self.windows), len(MEASURES)))
+        self._head = np.full(initial_keys, -1, dtype=np.int64)
+
+    def _grow(self):
+        """Double the number of key slots"""
+        def doubled(array, fill):
+            extra = np.full_like(array, fill)
+            return np.concatenate([array, extra])
+        self._buckets = doubled(self._buckets, 0)
+        self._bucket_id = doubled(self._bucket_id, -1)
+        self._totals = doubled(self._totals, 0)
+        self._head = doubled(self._head, -1)
+
+    def _key_index(self, key):
+        index = self.keys.get(key)
+        if index is None:
+            index = len(self.keys)
+            if index == len(self._head):
+                self._grow()
+            self.keys[key] = index
+        return index
+
+    def _advance(self, k, bucket):
+        """Slide key k's windows forward so the newest bucket is `bucket`"""
+        head = self._head[k]
+        if head < 0 or bucket - head >= self.n_buckets:
+            # First event or a gap longer than every window: start empty
+            self._buckets[k] = 0
+            self._bucket_id[k] = -1
+            self._totals[k] = 0
+            self._head[k] = bucket
+            return
+
+        for new_head in range(head + 1, bucket + 1):
+            for w, width in enumerate(self.windows):
+                leaving = new_head - width
+                slot = leaving % self.n_buckets
+                if leaving >= 0 and self._bucket_id[k, slot] == leaving:
+                    self._totals[k, w] -= self._buckets[k, slot]
+            slot = new_head % self.n_buckets
+            self._buckets[k, slot] = 0
+            self._bucket_id[k, slot] = -1
+        self._head[k] = bucket
+
+    def update(self, key, event_time_s, occupancy_percent, alert, boarding):
+        """Add one stop record observed at `event_time_s` (Unix seconds)"""
+        bucket = int(event_time_s) // BUCKET_SECONDS
+        if self.watermark is None or bucket > self.watermark:
+            self.watermark = bucket
+        elif bucket < self.watermark - self.lateness:
+            self.late_dropped += 1
+            return False
+
+        k = self._key_index(key)
+        if bucket > self._head[k]:
+            self._advance(k, bucket)
+        age = self._head[k] - bucket
+        if age >= self.n_buckets:
+            self.late_dropped += 1
+            return False
+
+        slot = bucket % self.n_buckets
+        values = np.array([1.0, occupancy_percent, float(alert), boarding])
+        self._buckets[k, slot] += values
+        self._bucket_id[k, slot] = bucket
+        self._totals[k, self.windows > age] += values
+        return True
+
+    def update_frame(self, df, key_column):
+        """Stream a DataFrame of stop records in arrival order"""
+        seconds = pd.to_datetime(df['timestamp']).values.astype('datetime64[s]').astype(np.int64)
+        rows = zip(df[key_column].values, seconds, df['occupancy_percent'].values,
+                   df['alert_triggered'].values == 'Yes', df['boarding'].values)
+        accepted = 0
+        for key, ts, occupancy, alert, boarding in rows:
+            accepted += self.update(key, ts, occupancy, alert, boarding)
+        return accepted
+
+    def snapshot(self):
+        """Current window values for every key as of the newest event time"""
+        if self.watermark is None:
+            return pd.DataFrame()
+        for k in range(len(self.keys)):
+            if self._head[k] < self.watermark:
+                self._advance(k, self.watermark)
+
+        n = len(self.keys)
+        totals = self._totals[:n]
+        frames = []
+        for w, width in enumerate(self.windows):
+            records = totals[:, w, 0]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean_occupancy = totals[:, w, 1] / records
+            frames.append(pd.DataFrame({
+                'key': list(self.keys),
+                'window_minutes': int(width),
+                'records': records.astype(int),
+                'mean_occupancy': mean_occupancy,
+                'alerts': totals[:, w, 2].astype(int),
+                'boarding_per_minute': totals[:, w, 3] / width,
+            }))
+        return pd.concat(frames, ignore_index=True)
+
+class FleetWindowStats:
+    """Rolling windows per bus and per stop, fed from one record stream"""
+
+    def __init__(self, window_minutes=WINDOW_MINUTES, allowed_lateness_minutes=ALLOWED_LATENESS_MINUTES):
+        self.by_bus = WindowedAggregator(window_minutes, allowed_lateness_minutes)
+        self.by_stop = WindowedAggregator(window_minutes, allowed_lateness_minutes)
+
+    def update(self, record):
+        """Add one stop record given as a dict in the generator's schema"""
+        ts = pd.Timestamp(record['timestamp']).value // 10**9
+        alert = record['alert_triggered'] == 'Yes'
+        self.by_bus.update(record['bus_id'], ts, record['occupancy_percent'], alert, record['boarding'])
+        self.by_stop.update(record['stop_name'], ts, record['occupancy_percent'], alert, record['boarding'])
+
+    def update_frame(self, df):
+        self.by_bus.update_frame(df, 'bus_id')
+        self.by_stop.update_frame(df, 'stop_name')
+
+    def to_dashboard(self):
+        """Current window values keyed the way the dashboard looks them up"""
+        view = {}
+        for name, aggregator in (('buses', self.by_bus), ('stops', self.by_stop)):
+            snapshot = aggregator.snapshot()
+            view[name] = {}
+            for row in snapshot.itertuples(index=False):
+                view[name].setdefault(row.key, {})[f"{row.window_minutes}min"] = {
+                    'records': row.records,
+                    'mean_occupancy': None if np.isnan(row.mean_occupancy) else round(float(row.mean_occupancy), 1),
+                    'alerts': row.alerts,
+                    'boarding_per_minute': round(float(row.boarding_per_minute), 2),
+                }
+        return view
+
+def main():
+    """Stream a fleet day through the rolling windows and check against pandas"""
+    print("Sliding-Window Streaming Statistics")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    # Fleet stream up to mid-morning, arriving up to 2 minutes out of order
+    fleet = build_fleet_history(df, n_buses=300, n_days=1)
+    fleet = fleet[fleet['timestamp'].dt.hour < 9]
+    rng = np.random.default_rng(3)
+    arrival = fleet['timestamp'].values + rng.integers(0, 120, len(fleet)).astype('timedelta64[s]')
+    stream = fleet.iloc[np.argsort(arrival, kind='stable')].reset_index(drop=True)
+
+    stats = FleetWindowStats()
+    start = time.perf_counter()
+    stats.update_frame(stream)
+    elapsed = time.perf_counter() - start
+    updates = 2 * len(stream)
+    print(f"1. Streamed {len(stream):,} records (per-bus and per-stop windows) in {elapsed:.2f}s "
+          f"({updates / elapsed:,.0f} window updates/s), late drops: {stats.by_bus.late_dropped}")
+
+    # Check one bus against a batch computation over the same event-time window
+    snapshot = stats.by_bus.snapshot()
+    now = pd.Timestamp(stats.by_bus.watermark * BUCKET_SECONDS, unit='s')
+    bus = 'BUS-138-0007'
+    for width in WINDOW_MINUTES:
+        window_start = now - pd.Timedelta(minutes=width - 1)
+        rows = stream[(stream['bus_id'] == bus) & (stream['timestamp'] >= window_start)]
+        row = snapshot[(snapshot['key'] == bus) & (snapshot['window_minutes'] == width)].iloc[0]
+        print(f"2. {bus} last {width} min: {row.records} records, mean occupancy {row.mean_occupancy:.1f}%, "
+              f"{row.alerts} alerts (batch check: {len(rows)} records, "
+              f"{rows['occupancy_percent'].mean():.1f}%)")
+
+    stop_view = stats.to_dashboard()['stops']
+    print(f"3. Dashboard stop view at {now:%H:%M}:")
+    for stop, windows in stop_view.items():
+        occupancy = windows['15min']['mean_occupancy']
+        occupancy = 'no buses' if occupancy is None else f"{occupancy}% occupancy"
+        print(f"   {stop:<13} 15min: {occupancy}, "
+              f"{windows['15min']['boarding_per_minute']} boardings/min | "
+              f"60min alerts: {windows['60min']['alerts']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+import json
+import time
+import os
+
+from bus_data_generator import ROUTE_STOPS, STATUS_LEVELS
+from event_log import build_fleet_history
+from passenger_km import route_from_bus_id
+
+CUBE_DIR = 'rollup_cube'
+DIMENSIONS = ['route', 'stop', 'hour', 'status']
+
+# Additive measures; occupancy_sq_sum lets the variance be derived from sums
+SUM_MEASURES = {
+    'records': None,
+    'occupancy_sum': 'occupancy_percent',
+    'occupancy_sq_sum': 'occupancy_percent',
+    'validated_sum': 'validated_count',
+    'ir_sum': 'ir_sensor_count',
+    'camera_sum': 'camera_count',
+    'boarding': 'boarding',
+    'alighting': 'alighting',
+    'alerts': 'alert_triggered',
+    'mismatch_sum': 'sensor_mismatch',
+}
+
+# Extrema merge with max; minima are stored negated so one rule covers both
+EXTREMA = {
+    'occupancy_max': ('occupancy_percent', 1),
+    'validated_max': ('validated_count', 1),
+    'validated_min': ('validated_count', -1),
+}
+
+class RollupCube:
+    """Persistent route x stop x hour x status cube, partitioned by day.
+
+    Each day is a pair of .npy arrays (sums and extrema) in a directory,
+    plus a running all-days partition, so a query that does not slice by
+    day reads one partition however much history has been ingested.
+    Dimension labels live in dimensions.json and only ever grow; older
+    partitions are zero-padded to the current shape when read. Only the
+    total partition is kept in memory.
+    """
+
+    def __init__(self, directory=CUBE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'dimensions.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                dims = json.load(f)
+        else:
+            dims = {'routes': [], 'stops': [s['name'] for s in ROUTE_STOPS], 'days': []}
+        self.routes = dims['routes']
+        self.stops = dims['stops']
+        self.days = dims['days']
+        self._cache = {}
+
+    @property
+    def shape(self):
+        return (len(self.routes), len(self.stops), 24, len(STATUS_LEVELS))
+
+    def _path(self, partition, kind):
+        return os.path.join(self.directory, f"{partition}.{kind}.npy")
+
+    def _save_dimensions(self):
+        path = os.path.join(self.directory, 'dimensions.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'routes': self.routes, 'stops': self.stops, 'days': self.days}, f)
+        os.replace(path + '.tmp', path)
+
+    def _codes(self, values, labels):
+        """Codes of values in a growing label list"""
+        inverse, uniques = pd.factorize(np.asarray(values, dtype=object))
+        for value in uniques:
+            if value not in labels:
+                labels.append(value)
+        lookup = {label: i for i, label in enumerate(labels)}
+        return np.array([lookup[v] for v in uniques], dtype=np.int64)[inverse]
+
+    def load(self, partition):
+        """Sums and extrema arrays of a partition ('total' or a day), padded to the current shape"""
+        cached = self._cache.get(partition)
+        if cached is not None and cached[0].shape[:4] == self.shape:
+            return cached
+        shape = self.shape
+        sums = np.zeros(shape + (len(SUM_MEASURES),))
+        extrema = np.full(shape + (len(EXTREMA),), -np.inf)
+        if os.path.exists(self._path(partition, 'sums')):
+            stored_sums = np.load(self._path(partition, 'sums'))
+            stored_extrema = np.load(self._path(partition, 'extrema'))
+            region = tuple(slice(0, n) for n in stored_sums.shape[:2])
+            sums[region] = stored_sums
+            extrema[region] = stored_extrema
+        if partition == 'total':
+            self._cache[partition] = (sums, extrema)
+        return sums, extrema
+
+    def _store(self, partition, sums, extrema):
+        for kind, array in (('sums', sums), ('extrema', extrema)):
+            path = self._path(partition, kind)
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(path + '.tmp', path)
+        if partition == 'total':
+            self._cache[partition] = (sums, extrema)
+
+    def ingest(self, df):
+        """Add stop records to their day partitions and the running total"""
+        timestamps = pd.to_datetime(df['timestamp'])
+        routes = df['route'].values if 'route' in df.columns else route_from_bus_id(df['bus_id'])
+        route_code = self._codes(routes, self.routes)
+        stop_code = self._codes(df['stop_name'].values, self.stops)
+        status_code = pd.Categorical(df['status'], categories=STATUS_LEVELS).codes.astype(np.int64)
+        if (status_code < 0).any():
+            raise ValueError("Unknown status value")
+        cell = np.ravel_multi_index((route_code, stop_code, timestamps.dt.hour.values, status_code), self.shape)
+        n_cells = int(np.prod(self.shape))
+
+        measures = np.empty((len(df), len(SUM_MEASURES)))
+        for i, (name, column) in enumerate(SUM_MEASURES.items()):
+            if column is None:
+                measures[:, i] = 1.0
+            elif name == 'alerts':
+                measures[:, i] = df[column].values == 'Yes'
+            else:
+                measures[:, i] = df[column].values
+        occupancy_sq = list(SUM_MEASURES).index('occupancy_sq_sum')
+        measures[:, occupancy_sq] **= 2
+        extreme_values = np.column_stack([sign * df[column].values.astype(np.float64)
+                                          for column, sign in EXTREMA.values()])
+
+        total_sums, total_extrema = self.load('total')
+        day_index, day_starts = pd.factorize(timestamps.dt.normalize().values)
+        day_labels = pd.DatetimeIndex(day_starts).strftime('%Y-%m-%d')
+        for d, day in enumerate(day_labels):
+            rows = day_index == d
+            day_cell = cell[rows]
+            add = np.column_stack([np.bincount(day_cell, weights=measures[rows, i], minlength=n_cells)
+                                   for i in range(len(SUM_MEASURES))]).reshape(total_sums.shape)
+            top = np.full((n_cells, len(EXTREMA)), -np.inf)
+            np.maximum.at(top, day_cell, extreme_values[rows])
+            top = top.reshape(total_extrema.shape)
+
+            sums, extrema = self.load(day)
+            self._store(day, sums + add, np.maximum(extrema, top))
+            total_sums = total_sums + add
+            total_extrema = np.maximum(total_extrema, top)
+            if day not in self.days:
+                self.days.append(day)
+
+        self.days.sort()
+        self._store('total', total_sums, total_extrema)
+        self._save_dimensions()
+
+    def query(self, by=(), days=None, routes=None, stops=None, hours=None, statuses=None):
+        """Measures grouped by any of route, stop, hour, status and day.
+
+        Filters take lists of labels. Returns one row per non-empty group
+        with the additive measures, extrema and derived means.
+        """
+        by = list(by)
+        selectors = [None if v is None else np.asarray(v) for v in (routes, stops, hours, statuses)]
+        labels = [self.routes, self.stops, list(range(24)), STATUS_LEVELS]
+        index = []
+        for axis, selected in enumerate(selectors):
+            if selected is None:
+                index.append(np.arange(self.shape[axis]))
+            else:
+                lookup = {label: i for i, label in enumerate(labels[axis])}
+                index.append(np.array([lookup[v] for v in selected if v in lookup], dtype=np.int64))
+        # Reductions leave the kept axes in DIMENSIONS order; they are moved into `by` order below
+        keep = sorted(DIMENSIONS.index(d) for d in by if d != 'day')
+        drop = tuple(a for a in range(len(DIMENSIONS)) if a not in keep)
+
+        def reduce(partition):
+            sums, extrema = self.load(partition)
+            grid = np.ix_(*index)
+            sums, extrema = sums[grid], extrema[grid]
+            return sums.sum(axis=drop), extrema.max(axis=drop, initial=-np.inf)
+
+        def empty():
+            shape = tuple(len(index[a]) for a in keep)
+            return np.zeros(shape + (len(SUM_MEASURES),)), np.full(shape + (len(EXTREMA),), -np.inf)
+
+        day_list = self.days if days is None else [pd.Timestamp(d).strftime('%Y-%m-%d') for d in days]
+        day_list = [d for d in day_list if d in self.days]
+        if 'day' in by:
+            parts = [reduce(day) for day in day_list] or [empty()]
+            sums = np.stack([p[0] for p in parts])[:len(day_list)]
+            extrema = np.stack([p[1] for p in parts])[:len(day_list)]
+        elif days is None:
+            sums, extrema = reduce('total')
+        else:
+            sums, extrema = empty()
+            for day in day_list:
+                day_sums, day_extrema = reduce(day)
+                sums = sums + day_sums
+                extrema = np.maximum(extrema, day_extrema)
+        axis_names = (['day'] if 'day' in by else []) + [DIMENSIONS[a] for a in keep]
+        axis_labels = ([day_list] if 'day' in by else []) + \
+            [np.asarray(labels[a], dtype=object)[index[a]] for a in keep]
+
+        # Put the grouping axes in the requested order
+        order = [axis_names.index(d) for d in by]
+        sums = np.transpose(sums, order + [len(order)]).reshape(-1, len(SUM_MEASURES))
+        extrema = np.transpose(extrema, order + [len(order)]).reshape(-1, len(EXTREMA))
+        frame = pd.DataFrame(sums, columns=list(SUM_MEASURES))
+        for i, (name, (_, sign)) in enumerate(EXTREMA.items()):
+            frame[name] = np.where(np.isfinite(extrema[:, i]), sign * extrema[:, i], np.nan)
+        if by:
+            frame.index = pd.MultiIndex.from_product([axis_labels[o] for o in order], names=by)
+        frame = frame[frame['records'] > 0]
+
+        records = frame['records']
+        frame['occupancy_mean'] = frame['occupancy_sum'] / records
+        frame['occupancy_std'] = np.sqrt(np.maximum(frame['occupancy_sq_sum'] / records - frame['occupancy_mean'] ** 2, 0))
+        frame['validated_mean'] = frame['validated_sum'] / records
+        frame['mismatch_mean'] = frame['mismatch_sum'] / records
+        frame['alert_rate'] = frame['alerts'] / records * 100
+        if len(by) == 1:
+            frame.index = frame.index.get_level_values(0)
+        return frame
+
+    def peak_hour_stats(self, days=None):
+        """Hourly frame in the layout create_peak_hour_analysis builds from raw rows"""
+        hourly = self.query(['hour'], days=days)
+        return pd.DataFrame({
+            ('validated_count', 'mean'): hourly['validated_mean'],
+            ('validated_count', 'max'): hourly['validated_max'],
+            ('validated_count', 'min'): hourly['validated_min'],
+            ('boarding', 'sum'): hourly['boarding'],
+            ('alighting', 'sum'): hourly['alighting'],
+            ('alert_triggered', '<lambda>'): hourly['alerts'],
+        })
+
+    def stop_metrics(self, days=None):
+        """Per-stop frame in the layout create_stop_performance_dashboard builds"""
+        per_stop = self.query(['stop'], days=days)
+        return pd.DataFrame({
+            'boarding': per_stop['boarding'],
+            'alighting': per_stop['alighting'],
+            'validated_count': per_stop['validated_mean'],
+            'alert_triggered': per_stop['alerts'],
+            'visits': per_stop['records'],
+        })
+
+    def kpi_summary(self, days=None):
+        """Headline values used by create_kpi_summary_dashboard"""
+        overall = self.query(days=days)
+        per_status = self.query(['status'], days=days)
+        hourly = self.query(['hour'], days=days)
+        records = overall['records'].sum()
+        return {
+            'max_utilization': overall['occupancy_max'].max(),
+            'avg_utilization': overall['occupancy_sum'].sum() / records,
+            'overcrowded_percentage': per_status['records'].get('OVERCROWDED', 0) / records * 100,
+            'total_alerts': int(overall['alerts'].sum()),
+            'total_passengers': int(overall['boarding'].sum()),
+            'avg_sensor_mismatch': overall['mismatch_sum'].sum() / records,
+            'status_percentages': per_status['records'] / records * 100,
+            'hourly_avg': hourly['occupancy_mean'],
+        }
+
+def main():
+    """Ingest a month of fleet history day by day and time cube queries"""
+    print("Rollup Cube (route x stop x hour x day x status)")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    directory = tempfile.mkdtemp(prefix='sbod_cube_')
+    try:
+        # 1. Days arrive one at a time; 300 buses spread over 20 routes
+        fleet = build_fleet_history(df, n_buses=300, n_days=30)
+        fleet['route'] = 'R' + (fleet['bus_id'].str[-4:].astype(int) % 20).astype(str).str.zfill(2)
+        cube = RollupCube(directory)
+        start = time.perf_counter()
+        for _, day in fleet.groupby(fleet['timestamp'].dt.date):
+            cube.ingest(day)
+        elapsed = time.perf_counter() - start
+        print(f"1. Ingested {len(fleet):,} records over {len(cube.days)} days in {elapsed:.1f}s "
+              f"({len(cube.routes)} routes x {len(cube.stops)} stops x 24 hours x {len(STATUS_LEVELS)} statuses)")
+
+        # 2. Queries against a reopened cube, compared with grouping the raw rows
+        cube = RollupCube(directory)
+        queries = [
+            ('stop x hour, all days', dict(by=['stop', 'hour'])),
+            ('route x status, one week', dict(by=['route', 'status'], days=cube.days[:7])),
+            ('day x hour at Pettah', dict(by=['day', 'hour'], stops=['Pettah'])),
+        ]
+        for label, query in queries:
+            cube.query(**query)
+            start = time.perf_counter()
+            result = cube.query(**query)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"2. {label}: {len(result)} groups in {elapsed:.1f} ms")
+
+        start = time.perf_counter()
+        fleet.groupby([fleet['stop_name'], fleet['timestamp'].dt.hour])['occupancy_percent'].mean()
+        print(f"   (pandas groupby over the raw rows: {(time.perf_counter() - start) * 1000:.0f} ms)")
+
+        # 3. Cube answers match the raw data
+        hourly = cube.peak_hour_stats()
+        raw = fleet.groupby(fleet['timestamp'].dt.hour)['validated_count'].agg(['mean', 'max', 'min'])
+        match = np.allclose(hourly[('validated_count', 'mean')].values, raw['mean'].values) and \
+            (hourly[('validated_count', 'min')].values == raw['min'].values).all()
+        print(f"3. Peak-hour frame matches raw aggregation: {match}")
+        reordered = cube.query(['status', 'hour', 'stop'])['records']
+        raw = fleet.groupby(['status', fleet['timestamp'].dt.hour, 'stop_name']).size()
+        match = bool((reordered.values == raw.reindex(reordered.index).values).all() and len(reordered) == len(raw))
+        print(f"   status x hour x stop (non-canonical order) matches raw aggregation: {match}")
+        print("\n4. Busiest stop-hours (mean occupancy, std):")
+        busiest = cube.query(['stop', 'hour']).sort_values('occupancy_mean', ascending=False).head(5)
+        print(busiest[['records', 'occupancy_mean', 'occupancy_std', 'alert_rate']].round(1).to_string())
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
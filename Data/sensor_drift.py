@@ -0,0 +1,238 @@
+import pandas as pd
+import numpy as np
+import time
+
+from bus_data_generator import MAX_CAPACITY, fuse_counts
+from occupancy_forecast import generate_history
+from what_if import reclassify
+
+# Signed error channels watched per bus, and the unit each one implicates
+CHANNELS = ['mismatch', 'ir_bias', 'camera_bias']
+CHANNEL_UNITS = {'mismatch': 'IR or camera', 'ir_bias': 'IR', 'camera_bias': 'camera'}
+
+# Sensor error grows with crowding, so the in-control reference is kept per occupancy band
+OCCUPANCY_BANDS = [40, 60, 80]
+
+# Detector defaults, in standard deviations of the in-control error
+EWMA_LAMBDA = 0.2
+EWMA_LIMIT = 3.0
+CUSUM_K = 0.5
+CUSUM_H = 5.0
+
+SIGNAL_COLUMNS = ['bus_id', 'timestamp', 'channel', 'unit', 'chart', 'shift', 'statistic']
+
+def error_channels(df):
+    """Signed errors per row: camera - IR, IR - actual and camera - actual"""
+    ir = df['ir_sensor_count'].values.astype(np.float64)
+    camera = df['camera_count'].values.astype(np.float64)
+    actual = df['actual_count'].values.astype(np.float64)
+    return np.column_stack([camera - ir, ir - actual, camera - actual])
+
+def occupancy_band(df):
+    """Occupancy band index of each row, from the fused count"""
+    percent = df['validated_count'].values / MAX_CAPACITY * 100
+    return np.digitize(percent, OCCUPANCY_BANDS)
+
+def fit_reference(df):
+    """In-control mean and standard deviation of each channel per occupancy band"""
+    errors = error_channels(df)
+    band = occupancy_band(df)
+    n_bands = len(OCCUPANCY_BANDS) + 1
+    mean = np.zeros((n_bands, len(CHANNELS)))
+    std = np.ones((n_bands, len(CHANNELS)))
+    for b in range(n_bands):
+        rows = errors[band == b]
+        if len(rows) > 1:
+            mean[b] = rows.mean(axis=0)
+            std[b] = np.maximum(rows.std(axis=0, ddof=1), 0.5)  # Counts are integers; avoid zero spread
+    return {'mean': mean, 'std': std}
+
+class SensorDriftDetector:
+    """Per-bus EWMA and two-sided CUSUM charts on standardized sensor errors.
+
+    State is a few arrays indexed by bus, so a batch of records is applied
+    with vectorized updates. Records of the same bus within a batch are split
+    into rounds by their order of arrival, so every round touches each bus at
+    most once. A chart that signals is reset, so a persisting fault keeps
+    signalling at a rate set by the thresholds rather than on every record.
+    """
+
+    def __init__(self, reference, ewma_lambda=EWMA_LAMBDA, ewma_limit=EWMA_LIMIT,
+                 cusum_k=CUSUM_K, cusum_h=CUSUM_H, initial_buses=1024):
+        self.reference = reference
+        self.ewma_lambda = ewma_lambda
+        self.ewma_limit = ewma_limit * np.sqrt(ewma_lambda / (2 - ewma_lambda))
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.buses = {}
+
+        shape = (initial_buses, len(CHANNELS))
+        self._ewma = np.zeros(shape)
+        self._cusum_high = np.zeros(shape)
+        self._cusum_low = np.zeros(shape)
+
+    def _bus_index(self, bus_ids):
+        codes, uniques = pd.factorize(bus_ids)
+        lookup = np.array([self.buses.setdefault(bus, len(self.buses)) for bus in uniques], dtype=np.int64)
+        while len(self.buses) > len(self._ewma):
+            self._ewma, self._cusum_high, self._cusum_low = (
+                np.concatenate([a, np.zeros_like(a)]) for a in (self._ewma, self._cusum_high, self._cusum_low))
+        return lookup[codes]
+
+    def standardize(self, df):
+        band = occupancy_band(df)
+        return (error_channels(df) - self.reference['mean'][band]) / self.reference['std'][band]
+
+    def update(self, df):
+        """Apply a batch of stop records in arrival order and return the signals raised"""
+        if len(df) == 0:
+            return pd.DataFrame(columns=SIGNAL_COLUMNS)
+        bus = self._bus_index(df['bus_id'].values)
+        z = self.standardize(df)
+        rounds = pd.Series(bus).groupby(bus).cumcount().values
+
+        signals = []
+        lam = self.ewma_lambda
+        for r in range(rounds.max() + 1):
+            rows = np.flatnonzero(rounds == r)
+            b = bus[rows]
+            x = z[rows]
+            ewma = lam * x + (1 - lam) * self._ewma[b]
+            high = np.maximum(0.0, self._cusum_high[b] + x - self.cusum_k)
+            low = np.maximum(0.0, self._cusum_low[b] - x - self.cusum_k)
+
+            ewma_signal = np.abs(ewma) > self.ewma_limit
+            high_signal = high > self.cusum_h
+            low_signal = low > self.cusum_h
+            for chart, shift, fired, statistic in (('EWMA', np.sign(ewma), ewma_signal, ewma),
+                                                   ('CUSUM', 1.0, high_signal, high),
+                                                   ('CUSUM', -1.0, low_signal, low)):
+                row, channel = np.nonzero(fired)
+                if len(row):
+                    signals.append((rows[row], channel, chart,
+                                    np.broadcast_to(shift, fired.shape)[row, channel], statistic[row, channel]))
+
+            # Restart the charts that signalled
+            restart = ewma_signal | high_signal | low_signal
+            self._ewma[b] = np.where(restart, 0.0, ewma)
+            self._cusum_high[b] = np.where(restart, 0.0, high)
+            self._cusum_low[b] = np.where(restart, 0.0, low)
+
+        if not signals:
+            return pd.DataFrame(columns=SIGNAL_COLUMNS)
+        row = np.concatenate([s[0] for s in signals])
+        channel = np.concatenate([s[1] for s in signals])
+        channel_names = np.asarray(CHANNELS, dtype=object)[channel]
+        return pd.DataFrame({
+            'bus_id': df['bus_id'].values[row],
+            'timestamp': df['timestamp'].values[row],
+            'channel': channel_names,
+            'unit': [CHANNEL_UNITS[c] for c in channel_names],
+            'chart': np.concatenate([np.full(len(s[0]), s[2], dtype=object) for s in signals]),
+            'shift': np.where(np.concatenate([s[3] for s in signals]) > 0, 'high', 'low'),
+            'statistic': np.concatenate([s[4] for s in signals]),
+        }).sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+def replay(history, reference, batch='5min', **params):
+    """Stream stored history through a fresh detector in time-ordered batches"""
+    detector = SensorDriftDetector(reference, **params)
+    history = history.sort_values('timestamp', kind='stable')
+    batches = history.groupby(history['timestamp'].dt.floor(batch), sort=True)
+    signals = [detector.update(chunk) for _, chunk in batches]
+    signals = [s for s in signals if len(s)]
+    return pd.concat(signals, ignore_index=True) if signals else pd.DataFrame(columns=SIGNAL_COLUMNS)
+
+def inject_drift(df, bus_ids, sensor, start, step=0.0, ramp_per_hour=0.0):
+    """Degrade the IR or camera unit of some buses from `start` onward.
+
+    The reading is offset by `step` passengers plus `ramp_per_hour` per hour
+    since the fault began. The fused count and everything derived from it
+    (occupancy, status, alert) and the sensor mismatch are recomputed.
+    """
+    df = df.copy()
+    column = {'IR': 'ir_sensor_count', 'camera': 'camera_count'}[sensor]
+    hours = (df['timestamp'] - pd.Timestamp(start)).dt.total_seconds() / 3600
+    faulty = df['bus_id'].isin(bus_ids).values & (hours.values >= 0)
+    offset = np.round(step + ramp_per_hour * hours.values[faulty])
+    df.loc[faulty, column] = np.clip(df.loc[faulty, column].values + offset, 0, MAX_CAPACITY + 3).astype(int)
+    df['sensor_mismatch'] = (df['camera_count'] - df['ir_sensor_count']).abs()
+    df['validated_count'] = fuse_counts(df['ir_sensor_count'].values, df['camera_count'].values,
+                                        df['actual_count'].values)
+    return reclassify(df)
+
+def score_signals(signals, fault_start, faulty_buses, unit, n_bus_days):
+    """False signals per bus-day and detection delay of the faulty unit"""
+    signals = signals.assign(on_faulty=signals['bus_id'].isin(faulty_buses),
+                             after_fault=signals['timestamp'] >= pd.Timestamp(fault_start))
+    false = signals[~(signals['on_faulty'] & signals['after_fault'])]
+    hits = signals[signals['on_faulty'] & signals['after_fault'] & (signals['unit'] == unit)]
+    first = hits.groupby('bus_id')['timestamp'].min()
+    delay = (first - pd.Timestamp(fault_start)).dt.total_seconds() / 60
+    return {
+        'false_signals_per_bus_day': len(false) / n_bus_days,
+        'detected': len(first) / len(faulty_buses),
+        'median_delay_min': float(delay.median()) if len(delay) else np.nan,
+    }
+
+def tune_thresholds(history, reference, fault_start, faulty_buses, unit, n_bus_days,
+                    cusum_h_values=(3, 4, 5, 6, 8), ewma_limit_values=(2.5, 3.0, 3.5)):
+    """Replay faulty history over a grid of thresholds and score each setting"""
+    rows = []
+    for h in cusum_h_values:
+        for limit in ewma_limit_values:
+            signals = replay(history, reference, cusum_h=h, ewma_limit=limit)
+            rows.append({'cusum_h': h, 'ewma_limit': limit,
+                         **score_signals(signals, fault_start, faulty_buses, unit, n_bus_days)})
+    return pd.DataFrame(rows)
+
+def choose_thresholds(scores, max_false_signals_per_bus_day):
+    """Fastest full-detection setting within the false-signal budget"""
+    ok = scores[(scores['false_signals_per_bus_day'] <= max_false_signals_per_bus_day) & (scores['detected'] == 1)]
+    if ok.empty:
+        return None
+    return ok.sort_values(['median_delay_min', 'false_signals_per_bus_day']).iloc[0]
+
+def independent_buses(n_buses, seed=0):
+    """Give each generated day its own bus id on a common date"""
+    history = generate_history(n_buses, seed=seed)
+    day = (history['timestamp'].dt.normalize() - history['timestamp'].min().normalize()).dt.days
+    history['bus_id'] = [f"BUS-138-{d:04d}" for d in day]
+    history['timestamp'] = history['timestamp'] - pd.to_timedelta(day, unit='D')
+    return history
+
+def main():
+    """Tune drift thresholds on replayed history and time a fleet-sized stream"""
+    print("Streaming Sensor-Drift Detection")
+    print("=" * 50)
+
+    reference = fit_reference(generate_history(14, seed=1))
+    print("1. In-control error spread (std, passengers) by occupancy band:")
+    labels = ['<40%', '40-60%', '60-80%', '>=80%']
+    for label, std in zip(labels, reference['std']):
+        print(f"   {label:<7} " + ", ".join(f"{c}: {s:.2f}" for c, s in zip(CHANNELS, std)))
+
+    # 2. Replay a day where a tenth of the buses' IR units start undercounting at 10:00
+    buses = independent_buses(100, seed=2)
+    faulty = [f"BUS-138-{i:04d}" for i in range(0, 100, 10)]
+    fault_start = buses['timestamp'].min().normalize() + pd.Timedelta(hours=10)
+    degraded = inject_drift(buses, faulty, 'IR', fault_start, step=-2, ramp_per_hour=-1)
+    scores = tune_thresholds(degraded, reference, fault_start, faulty, 'IR', n_bus_days=100)
+    best = choose_thresholds(scores, max_false_signals_per_bus_day=0.5)
+    print("\n2. Threshold tuning on replayed history (IR fault on 10 of 100 buses):")
+    print(scores.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    if best is not None:
+        print(f"   Chosen: CUSUM h={best['cusum_h']:g}, EWMA limit={best['ewma_limit']:g} -> "
+              f"median detection {best['median_delay_min']:.0f} min after fault onset")
+
+    # 3. Fleet-sized stream: thousands of buses in 5-minute batches
+    n_copies = 30
+    fleet = pd.concat([buses.assign(bus_id=buses['bus_id'] + f"-{c:02d}") for c in range(n_copies)],
+                      ignore_index=True)
+    start = time.perf_counter()
+    signals = replay(fleet, reference)
+    elapsed = time.perf_counter() - start
+    print(f"\n3. Streamed {len(fleet):,} records from {fleet['bus_id'].nunique():,} buses in {elapsed:.2f}s "
+          f"({len(fleet) / elapsed:,.0f} records/s), {len(signals)} signals")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import pandas as pd
+import numpy as np
+import time
+from scipy import optimize, stats
+
+from bus_data_generator import MAX_CAPACITY, fuse_counts
+
+CROWDED_ABOVE = 40          # simulate_sensor_readings switches error bands above this many passengers
+CAMERA_MAX_READING = MAX_CAPACITY + 3
+PMF_FLOOR = 1e-12           # Keeps the log-likelihood finite for readings a model calls impossible
+SPAN = 60                   # Unclipped readings are modelled from -SPAN to max_reading + SPAN
+ACCURACY_GRID = 400         # Points used to integrate over a uniform camera accuracy
+
+SENSOR_MODELS = {}
+
+def register_model(cls):
+    """Class decorator adding a SensorModel subclass to SENSOR_MODELS under its name"""
+    SENSOR_MODELS[cls.name] = cls
+    return cls
+
+def make_model(name, max_reading=MAX_CAPACITY, **params):
+    if name not in SENSOR_MODELS:
+        raise KeyError(f"Unknown sensor model '{name}' (registered: {', '.join(SENSOR_MODELS)})")
+    return SENSOR_MODELS[name](max_reading=max_reading, **params)
+
+def count_table(actual_counts, readings, max_reading):
+    """(true count, reading) contingency table: the sufficient statistic for every model"""
+    actual = np.clip(np.asarray(actual_counts, dtype=np.int64), 0, MAX_CAPACITY)
+    readings = np.clip(np.asarray(readings, dtype=np.int64), 0, max_reading)
+    cells = actual * (max_reading + 1) + readings
+    return np.bincount(cells, minlength=(MAX_CAPACITY + 1) * (max_reading + 1)).reshape(MAX_CAPACITY + 1, -1)
+
+class SensorModel:
+    """Error model of one counting sensor: the distribution of its reading given the true count.
+
+    A model only describes P(unclipped reading | true count) for true counts
+    0..MAX_CAPACITY through _unclipped(); readings outside 0..max_reading pile
+    up at the limits, as the firmware clamps them. From that one table the
+    base class samples readings (inverse CDF for all rows at once), scores
+    history and fits parameters by maximum likelihood with scipy. History
+    enters only through its (true count, reading) contingency table, so a
+    fit costs the same for a day or a year of records.
+    """
+
+    name = None
+    defaults = {}
+    bounds = {}
+    fit_method = 'L-BFGS-B'
+
+    def __init__(self, max_reading=MAX_CAPACITY, **params):
+        unknown = set(params) - set(self.defaults)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {self.name}: {sorted(unknown)}")
+        self.max_reading = max_reading
+        self.params = {**self.defaults, **params}
+        self._cdf = None
+
+    def __repr__(self):
+        values = ', '.join(f"{k}={v:.3g}" for k, v in self.params.items())
+        return f"{self.name}({values})"
+
+    def _unclipped(self, params, actual, values):
+        """P(unclipped reading = values[j] | true count = actual[i]) as an (actual x values) array"""
+        raise NotImplementedError
+
+    def pmf_table(self, params=None):
+        """(MAX_CAPACITY + 1) x (max_reading + 1) reading probabilities, rows summing to 1"""
+        params = self.params if params is None else params
+        actual = np.arange(MAX_CAPACITY + 1)
+        values = np.arange(-SPAN, self.max_reading + SPAN + 1)
+        dist = self._unclipped(params, actual, values)
+        table = dist[:, SPAN:SPAN + self.max_reading + 1].copy()
+        table[:, 0] += dist[:, :SPAN].sum(axis=1)
+        table[:, -1] += dist[:, SPAN + self.max_reading + 1:].sum(axis=1)
+        return table / table.sum(axis=1, keepdims=True)
+
+    def sample(self, actual_counts, rng):
+        """One reading per true count, drawn from the model's table"""
+        if self._cdf is None:
+            cdf = np.cumsum(self.pmf_table(), axis=1)
+            cdf[:, -1] = 1.0
+            # Row r of the CDF shifted by r, so one searchsorted serves every true count
+            self._cdf = (cdf + np.arange(MAX_CAPACITY + 1)[:, None]).ravel()
+        actual = np.clip(np.asarray(actual_counts, dtype=np.int64), 0, MAX_CAPACITY)
+        index = np.searchsorted(self._cdf, actual + rng.random(len(actual)), side='right')
+        return np.minimum(index - actual * (self.max_reading + 1), self.max_reading)
+
+    def log_likelihood(self, counts, params=None):
+        return float((counts * np.log(np.maximum(self.pmf_table(params), PMF_FLOOR))).sum())
+
+    def aic(self, counts):
+        return 2 * len(self.bounds) - 2 * self.log_likelihood(counts)
+
+    @classmethod
+    def fit(cls, actual_counts, readings, max_reading=MAX_CAPACITY, counts=None):
+        """Maximum-likelihood parameters for (true count, reading) history"""
+        model = cls(max_reading=max_reading)
+        counts = count_table(actual_counts, readings, max_reading) if counts is None else counts
+        names = list(cls.bounds)
+
+        def objective(theta):
+            return -model.log_likelihood(counts, {**model.params, **dict(zip(names, theta))})
+
+        start = [model.params[n] for n in names]
+        result = optimize.minimize(objective, start, method=cls.fit_method, bounds=[cls.bounds[n] for n in names])
+        model.params.update(zip(names, (float(v) for v in result.x)))
+        return model
+
+@register_model
+class BandedOffset(SensorModel):
+    """Reading = true count + a uniform integer offset, with a wider band when crowded.
+
+    The IR model of simulate_sensor_readings (-1..+1, or -2..+1 above 40
+    passengers). For a discrete uniform the maximum-likelihood band is the
+    observed range, so fitting needs no optimiser.
+    """
+
+    name = 'banded_offset'
+    defaults = dict(low=-1, high=1, crowded_low=-2, crowded_high=1)
+    bounds = dict.fromkeys(defaults, (-SPAN, SPAN))
+
+    def _unclipped(self, params, actual, values):
+        crowded = actual[:, None] > CROWDED_ABOVE
+        low = np.where(crowded, params['crowded_low'], params['low'])
+        high = np.where(crowded, params['crowded_high'], params['high'])
+        offset = values[None, :] - actual[:, None]
+        return ((offset >= low) & (offset <= high)) / (high - low + 1.0)
+
+    @classmethod
+    def fit(cls, actual_counts, readings, max_reading=MAX_CAPACITY, counts=None):
+        counts = count_table(actual_counts, readings, max_reading) if counts is None else counts
+        actual, reading = np.nonzero(counts)
+        # Readings at the clamp limits only bound the offset from one side
+        offset = np.where((reading > 0) & (reading < max_reading), reading - actual, 0)
+        crowded = actual > CROWDED_ABOVE
+        params = {}
+        for prefix, rows in (('', ~crowded), ('crowded_', crowded)):
+            if rows.any():
+                params[prefix + 'low'], params[prefix + 'high'] = int(offset[rows].min()), int(offset[rows].max())
+        return cls(max_reading=max_reading, **params)
+
+@register_model
+class AccuracyBand(SensorModel):
+    """Reading = true count + uniform offset of +/- count x (1 - accuracy), skewed up by `overcount`.
+
+    The camera model of simulate_sensor_readings: accuracy is uniform over
+    a band (90-98%, or 85-95% above 40 passengers) drawn afresh per reading.
+    The likelihood is flat between band edges, so it is fitted with
+    Nelder-Mead rather than a gradient method.
+    """
+
+    name = 'accuracy_band'
+    defaults = dict(accuracy_low=0.90, accuracy_high=0.98, crowded_accuracy_low=0.85,
+                    crowded_accuracy_high=0.95, overcount=2)
+    bounds = dict(accuracy_low=(0.5, 1.0), accuracy_high=(0.5, 1.0), crowded_accuracy_low=(0.5, 1.0),
+                  crowded_accuracy_high=(0.5, 1.0))
+    fit_method = 'Nelder-Mead'
+
+    def _unclipped(self, params, actual, values):
+        crowded = actual > CROWDED_ABOVE
+        low = np.where(crowded, params['crowded_accuracy_low'], params['accuracy_low'])
+        high = np.maximum(np.where(crowded, params['crowded_accuracy_high'], params['accuracy_high']), low)
+        # Integer offset spread for accuracies evenly spaced over each row's band: a mixture of
+        # a few uniform offset ranges per true count
+        grid = (np.arange(ACCURACY_GRID) + 0.5) / ACCURACY_GRID
+        accuracy = low[:, None] + (high - low)[:, None] * grid[None, :]
+        variation = (actual[:, None] * (1 - accuracy)).astype(np.int64)
+        weights = np.stack([np.bincount(row, minlength=MAX_CAPACITY + 1) for row in variation]) / ACCURACY_GRID
+        spread = np.arange(MAX_CAPACITY + 1)
+        offsets = np.arange(-MAX_CAPACITY - 1, MAX_CAPACITY + params['overcount'] + 2)
+        inside = (offsets[None, :] >= -spread[:, None]) & (offsets[None, :] <= spread[:, None] + params['overcount'])
+        by_offset = weights @ (inside / (2 * spread[:, None] + params['overcount'] + 1.0))
+        index = values[None, :] - actual[:, None] - offsets[0]
+        valid = (index >= 0) & (index < len(offsets))
+        return np.where(valid, np.take_along_axis(by_offset, np.clip(index, 0, len(offsets) - 1), axis=1), 0.0)
+
+@register_model
+class Gaussian(SensorModel):
+    """Reading = round(true count x (1 + bias) + noise), noise sd growing with the count"""
+
+    name = 'gaussian'
+    defaults = dict(bias=0.0, sigma=1.0, sigma_per_passenger=0.02)
+    bounds = dict(bias=(-0.5, 0.5), sigma=(0.05, 20.0), sigma_per_passenger=(0.0, 1.0))
+
+    def _unclipped(self, params, actual, values):
+        mean = actual * (1 + params['bias'])
+        sd = params['sigma'] + params['sigma_per_passenger'] * actual
+        upper = stats.norm.cdf((values[None, :] + 0.5 - mean[:, None]) / sd[:, None])
+        lower = stats.norm.cdf((values[None, :] - 0.5 - mean[:, None]) / sd[:, None])
+        return upper - lower
+
+@register_model
+class Thinning(SensorModel):
+    """Each passenger is missed independently, more often in a crowd (occlusion), plus Poisson false counts.
+
+    Miss probability is logistic in occupancy: 1 / (1 + exp(-(miss_logit +
+    miss_slope x count / capacity))).
+    """
+
+    name = 'thinning'
+    defaults = dict(miss_logit=-4.0, miss_slope=2.0, false_rate=0.2)
+    bounds = dict(miss_logit=(-12.0, 4.0), miss_slope=(-10.0, 15.0), false_rate=(1e-4, 10.0))
+
+    def _unclipped(self, params, actual, values):
+        miss = 1 / (1 + np.exp(-(params['miss_logit'] + params['miss_slope'] * actual / MAX_CAPACITY)))
+        counted = np.arange(MAX_CAPACITY + 1)
+        detected = stats.binom.pmf(counted[None, :], actual[:, None], 1 - miss[:, None])
+        extra = stats.poisson.pmf(np.arange(len(values)), params['false_rate'])
+        dist = np.zeros((len(actual), len(values)))
+        start = -values[0]
+        for i, row in enumerate(detected):
+            dist[i, start:] = np.convolve(row, extra)[:len(values) - start]
+        return dist
+
+class SensorSuite:
+    """IR and camera models of one vendor, producing fused readings like simulate_sensor_readings_batch"""
+
+    def __init__(self, ir_model=None, camera_model=None):
+        self.ir_model = ir_model or make_model('banded_offset')
+        self.camera_model = camera_model or make_model('accuracy_band', max_reading=CAMERA_MAX_READING)
+
+    def readings(self, actual_counts, rng=None):
+        rng = rng if rng is not None else np.random.default_rng()
+        ir_count = self.ir_model.sample(actual_counts, rng)
+        camera_count = self.camera_model.sample(actual_counts, rng)
+        return ir_count, camera_count, fuse_counts(ir_count, camera_count, actual_counts)
+
+def select_model(actual_counts, readings, max_reading=MAX_CAPACITY, candidates=None):
+    """Fit every candidate model; returns the fits ordered by AIC (best first)"""
+    counts = count_table(actual_counts, readings, max_reading)
+    fits = [SENSOR_MODELS[name].fit(None, None, max_reading, counts=counts) for name in (candidates or SENSOR_MODELS)]
+    return sorted(fits, key=lambda model: model.aic(counts)), counts
+
+def fit_vendor_models(df, vendor_column='sensor_vendor', candidates=None):
+    """Best IR and camera models for each vendor's history; returns (vendor -> SensorSuite, fit table)"""
+    suites, rows = {}, []
+    for vendor, group in df.groupby(vendor_column):
+        best = {}
+        for sensor, column, max_reading in (('ir', 'ir_sensor_count', MAX_CAPACITY),
+                                            ('camera', 'camera_count', CAMERA_MAX_READING)):
+            fits, counts = select_model(group['actual_count'].values, group[column].values, max_reading, candidates)
+            best[sensor] = fits[0]
+            for rank, model in enumerate(fits):
+                rows.append({'vendor': vendor, 'sensor': sensor, 'model': model.name, 'aic': model.aic(counts),
+                             'selected': rank == 0, 'params': repr(model)})
+        suites[vendor] = SensorSuite(best['ir'], best['camera'])
+    return suites, pd.DataFrame(rows)
+
+def error_distance(model, actual_counts, readings):
+    """Total variation distance between observed and modelled reading errors (reading - true count)"""
+    counts = count_table(actual_counts, readings, model.max_reading)
+    expected = model.pmf_table() * counts.sum(axis=1, keepdims=True)
+    offsets = np.arange(model.max_reading + 1)[None, :] - np.arange(MAX_CAPACITY + 1)[:, None]
+    observed = np.bincount((offsets + MAX_CAPACITY).ravel(), weights=counts.ravel())
+    modelled = np.bincount((offsets + MAX_CAPACITY).ravel(), weights=expected.ravel())
+    return 0.5 * np.abs(observed / observed.sum() - modelled / modelled.sum()).sum()
+
+def main():
+    """Fit sensor error models to stored and multi-vendor history and time the samplers"""
+    print("Sensor Error Models")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    # 1. Model choice on the stored history
+    print(f"1. Registered models: {', '.join(SENSOR_MODELS)}; fits to {len(df)} stored records:")
+    for sensor, column, max_reading in (('IR', 'ir_sensor_count', MAX_CAPACITY),
+                                        ('Camera', 'camera_count', CAMERA_MAX_READING)):
+        fits, counts = select_model(df['actual_count'].values, df[column].values, max_reading)
+        print(f"   - {sensor}: " + ", ".join(f"{m.name} AIC {m.aic(counts):.0f}" for m in fits))
+        print(f"     selected {fits[0]!r}")
+
+    # 2. Recover per-vendor models from a mixed fleet
+    rng = np.random.default_rng(0)
+    vendors = {
+        'VendorA': SensorSuite(make_model('thinning', miss_logit=-5.0, miss_slope=4.0, false_rate=0.3),
+                               make_model('gaussian', CAMERA_MAX_READING, bias=-0.04, sigma=0.8,
+                                          sigma_per_passenger=0.05)),
+        'VendorB': SensorSuite(make_model('banded_offset', low=-1, high=2, crowded_low=-3, crowded_high=1),
+                               make_model('thinning', CAMERA_MAX_READING, miss_logit=-3.0, miss_slope=3.0,
+                                          false_rate=1.0)),
+    }
+    actual = np.tile(df['actual_count'].values, 100)
+    history = []
+    for vendor, suite in vendors.items():
+        ir_count, camera_count, _ = suite.readings(actual, rng)
+        history.append(pd.DataFrame({'sensor_vendor': vendor, 'actual_count': actual,
+                                     'ir_sensor_count': ir_count, 'camera_count': camera_count}))
+    history = pd.concat(history, ignore_index=True)
+    start = time.perf_counter()
+    suites, fits = fit_vendor_models(history)
+    elapsed = time.perf_counter() - start
+    print(f"2. Fitted {len(fits)} vendor x sensor x model combinations on {len(history):,} readings "
+          f"in {elapsed:.1f}s:")
+    for (vendor, sensor), group in fits[fits['selected']].groupby(['vendor', 'sensor']):
+        true_model = getattr(vendors[vendor], f"{sensor}_model")
+        column = 'ir_sensor_count' if sensor == 'ir' else 'camera_count'
+        rows = history['sensor_vendor'] == vendor
+        fitted = getattr(suites[vendor], f"{sensor}_model")
+        print(f"   - {vendor} {sensor}: true {true_model!r}")
+        print(f"     fitted {group['params'].iloc[0]}, error TV distance "
+              f"{error_distance(fitted, history.loc[rows, 'actual_count'], history.loc[rows, column]):.4f}")
+
+    # 3. Sampling throughput
+    n = 5_000_000
+    actual = rng.integers(0, MAX_CAPACITY + 1, n)
+    print(f"3. Fused IR + camera readings for {n:,} true counts:")
+    for vendor, suite in suites.items():
+        start = time.perf_counter()
+        suite.readings(actual, rng)
+        elapsed = time.perf_counter() - start
+        print(f"   - {vendor}: {elapsed:.2f}s ({n / elapsed / 1e6:.1f}M readings/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import numpy as np
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+from bus_data_generator import MAX_CAPACITY, ROUTE_STOPS, STATUS_LEVELS, get_status
+
+# Compact per-second telemetry sample sent by the ESP32 (16 bytes per record)
+TELEMETRY_DTYPE = np.dtype([
+    ('timestamp', '<u4'),        # Unix time in seconds
+    ('latitude', '<f4'),
+    ('longitude', '<f4'),
+    ('passenger_count', 'u1'),   # Validated count
+    ('ir_count', 'u1'),
+    ('camera_count', 'u1'),
+    ('status', 'u1'),            # Index into STATUS_LEVELS
+])
+
+# Buffer sizing: 24 hours of one record per second must fit the memory budget
+BUFFER_HOURS = 24
+SAMPLES_PER_SECOND = 1
+BUFFER_CAPACITY = BUFFER_HOURS * 3600 * SAMPLES_PER_SECOND
+MEMORY_BUDGET_BYTES = 2 * 1024 * 1024
+
+# File layout: two alternating header slots followed by the record area.
+# A header is only trusted if its CRC matches, so a torn header write falls
+# back to the previous slot instead of corrupting the buffer.
+HEADER_MAGIC = b'SBRB'
+HEADER_VERSION = 1
+HEADER_FORMAT = '<4sHHIQII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT) + 4   # + CRC32
+HEADER_SLOTS = 2
+DATA_OFFSET = 64
+
+class TelemetryRingBuffer:
+    """Fixed-capacity, disk-backed ring buffer of telemetry records.
+
+    Records live in a memory-mapped file, so appends are constant-time memory
+    writes and survive a process crash. The oldest record is evicted when the
+    buffer is full. Call sync() to push dirty pages to disk; it runs
+    automatically every `sync_every` appends and after each flushed batch.
+    """
+
+    def __init__(self, path, capacity=BUFFER_CAPACITY, dtype=TELEMETRY_DTYPE, sync_every=60):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.sync_every = sync_every
+        self._pending_sync = 0
+
+        file_size = DATA_OFFSET + capacity * self.dtype.itemsize
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self._file.truncate(file_size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+        if exists:
+            self._load_header(capacity)
+        else:
+            self.capacity = capacity
+            self.head = 0
+            self.count = 0
+            self._seq = 0
+            self._commit()
+            self.sync()
+
+        self._records = np.frombuffer(self._mmap, dtype=self.dtype,
+                                      count=self.capacity, offset=DATA_OFFSET)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def nbytes(self):
+        """Size of the backing file in bytes"""
+        return DATA_OFFSET + self.capacity * self.dtype.itemsize
+
+    def _load_header(self, capacity):
+        """Restore ring state from the newest valid header slot"""
+        best = None
+        for slot in range(HEADER_SLOTS):
+            raw = self._mmap[slot * HEADER_SIZE:(slot + 1) * HEADER_SIZE]
+            body, crc = raw[:-4], struct.unpack('<I', raw[-4:])[0]
+            if zlib.crc32(body) != crc:
+                continue
+            magic, version, record_size, cap, seq, head, count = struct.unpack(HEADER_FORMAT, body)
+            if magic != HEADER_MAGIC or version != HEADER_VERSION:
+                continue
+            if best is None or seq > best[0]:
+                best = (seq, record_size, cap, head, count)
+
+        if best is None:
+            raise ValueError(f"{self.path} is not a telemetry ring buffer or both headers are corrupt")
+        seq, record_size, cap, head, count = best
+        if record_size != self.dtype.itemsize:
+            raise ValueError(f"Record size mismatch: file has {record_size} bytes, dtype has {self.dtype.itemsize}")
+        if cap != capacity:
+            raise ValueError(f"Capacity mismatch: file has {cap} records, requested {capacity}")
+
+        self.capacity = cap
+        self.head = head
+        self.count = count
+        self._seq = seq
+
+    def _commit(self):
+        """Write ring state into the next header slot"""
+        self._seq += 1
+        body = struct.pack(HEADER_FORMAT, HEADER_MAGIC, HEADER_VERSION, self.dtype.itemsize,
+                           self.capacity, self._seq, self.head, self.count)
+        slot = self._seq % HEADER_SLOTS
+        self._mmap[slot * HEADER_SIZE:(slot + 1) * HEADER_SIZE] = body + struct.pack('<I', zlib.crc32(body))
+
+    def append(self, record):
+        """Append one record (tuple in dtype field order), evicting the oldest if full"""
+        if self.count == self.capacity:
+            # Evict first so a crash mid-write never exposes the overwritten slot as the oldest record
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+            self._commit()
+
+        self._records[(self.head + self.count) % self.capacity] = record
+        self.count += 1
+        self._commit()
+
+        self._pending_sync += 1
+        if self._pending_sync >= self.sync_every:
+            self.sync()
+
+    def extend(self, records):
+        """Append a structured array of records in bulk"""
+        records = np.asarray(records, dtype=self.dtype)
+        if len(records) > self.capacity:
+            records = records[-self.capacity:]
+        n = len(records)
+        if n == 0:
+            return
+
+        overflow = max(0, self.count + n - self.capacity)
+        if overflow:
+            self.head = (self.head + overflow) % self.capacity
+            self.count -= overflow
+            self._commit()
+
+        start = (self.head + self.count) % self.capacity
+        first = min(n, self.capacity - start)
+        self._records[start:start + first] = records[:first]
+        self._records[:n - first] = records[first:]
+        self.count += n
+        self._commit()
+        self.sync()
+
+    def peek(self, n=None):
+        """Return a copy of the oldest `n` records without removing them"""
+        n = self.count if n is None else min(n, self.count)
+        idx = (self.head + np.arange(n)) % self.capacity
+        return self._records[idx].copy()
+
+    def flush(self, uplink, batch_size=3600):
+        """Send buffered records oldest-first in bulk until empty or the uplink fails.
+
+        A batch is only dropped from the buffer after the uplink accepts it, so
+        delivery is at-least-once: a crash between send and commit resends that batch.
+        """
+        sent = 0
+        while self.count > 0:
+            # Contiguous slice up to the physical end of the ring
+            n = min(batch_size, self.count, self.capacity - self.head)
+            batch = self._records[self.head:self.head + n].copy()
+            if not uplink.send(batch):
+                break
+            self.head = (self.head + n) % self.capacity
+            self.count -= n
+            self._commit()
+            self.sync()
+            sent += n
+        return sent
+
+    def sync(self):
+        """Flush dirty pages of the memory map to disk"""
+        self._mmap.flush()
+        self._pending_sync = 0
+
+    def close(self):
+        if self._mmap.closed:
+            return
+        self.sync()
+        del self._records
+        self._mmap.close()
+        self._file.close()
+
+class LocalIngestEndpoint:
+    """Local stand-in for the cloud ingestion endpoint reached over 4G"""
+
+    def __init__(self):
+        self.online = True
+        self.batches = []
+        self.records_received = 0
+
+    def send(self, batch):
+        """Accept a batch of records; returns False while the link is down"""
+        if not self.online:
+            return False
+        self.batches.append(batch)
+        self.records_received += len(batch)
+        return True
+
+def make_telemetry_record(timestamp, validated_count, ir_count, camera_count, latitude, longitude):
+    """Pack one sample into a TELEMETRY_DTYPE-ordered tuple"""
+    occupancy_percent = validated_count / MAX_CAPACITY * 100
+    status = STATUS_LEVELS.index(get_status(occupancy_percent))
+    return (int(timestamp), latitude, longitude, validated_count, ir_count, camera_count, status)
+
+def simulate_telemetry(n_seconds, start_timestamp=1705276800, seed=42):
+    """Generate `n_seconds` of per-second telemetry as a structured array"""
+    rng = np.random.default_rng(seed)
+    records = np.zeros(n_seconds, dtype=TELEMETRY_DTYPE)
+    records['timestamp'] = start_timestamp + np.arange(n_seconds)
+
+    # Daily load cycle plus sensor-level noise
+    phase = np.arange(n_seconds) / 86400 * 2 * np.pi
+    load = np.clip(25 - 20 * np.cos(2 * phase) + rng.normal(0, 3, n_seconds), 0, MAX_CAPACITY).astype(int)
+    records['passenger_count'] = load
+    records['ir_count'] = np.clip(load + rng.integers(-1, 2, n_seconds), 0, MAX_CAPACITY)
+    records['camera_count'] = np.clip(load + rng.integers(-2, 3, n_seconds), 0, MAX_CAPACITY + 3)
+
+    thresholds = np.array([40, 60, 80])
+    records['status'] = np.searchsorted(thresholds, load / MAX_CAPACITY * 100, side='right')
+
+    stop_idx = (np.arange(n_seconds) // 240) % len(ROUTE_STOPS)
+    records['latitude'] = np.array([s['lat'] for s in ROUTE_STOPS], dtype=np.float32)[stop_idx]
+    records['longitude'] = np.array([s['lon'] for s in ROUTE_STOPS], dtype=np.float32)[stop_idx]
+    return records
+
+def run_benchmark():
+    """Benchmark 24 hours of per-second telemetry through an outage and recovery"""
+    print("Store-and-forward Buffer Benchmark")
+    print("=" * 50)
+
+    samples = simulate_telemetry(BUFFER_CAPACITY + 3600)
+    uplink = LocalIngestEndpoint()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'telemetry.ring')
+        buffer = TelemetryRingBuffer(path)
+
+        # 1. Memory budget
+        print(f"1. Capacity: {buffer.capacity:,} records ({BUFFER_HOURS}h at {SAMPLES_PER_SECOND}/s)")
+        print(f"   Record size: {TELEMETRY_DTYPE.itemsize} bytes, file size: {buffer.nbytes / 1024 / 1024:.2f} MiB "
+              f"(budget {MEMORY_BUDGET_BYTES / 1024 / 1024:.2f} MiB) -> "
+              f"{'OK' if buffer.nbytes <= MEMORY_BUDGET_BYTES else 'OVER BUDGET'}")
+
+        # 2. 4G disconnected for 25 hours: every sample goes to the buffer
+        uplink.online = False
+        start = time.perf_counter()
+        for record in samples.tolist():
+            buffer.append(record)
+        elapsed = time.perf_counter() - start
+        print(f"2. Appended {len(samples):,} records offline in {elapsed:.2f}s "
+              f"({elapsed / len(samples) * 1e6:.1f} us/append)")
+        print(f"   Buffered: {len(buffer):,}, oldest kept timestamp: {buffer.peek(1)['timestamp'][0]} "
+              f"(first {len(samples) - buffer.capacity:,} evicted)")
+
+        # 3. Crash recovery: reopen from disk without closing cleanly
+        buffer.sync()
+        recovered = TelemetryRingBuffer(path)
+        same = len(recovered) == len(buffer) and recovered.head == buffer.head
+        print(f"3. Reopened after simulated crash: {len(recovered):,} records, state consistent: {same}")
+
+        # 4. Connectivity returns: bulk flush
+        uplink.online = True
+        start = time.perf_counter()
+        sent = recovered.flush(uplink)
+        elapsed = time.perf_counter() - start
+        delivered = np.concatenate(uplink.batches)
+        in_order = bool(np.all(np.diff(delivered['timestamp'].astype(np.int64)) == 1))
+        print(f"4. Flushed {sent:,} records in {len(uplink.batches)} batches in {elapsed * 1000:.1f} ms, "
+              f"oldest-first order: {in_order}, remaining: {len(recovered)}")
+
+        recovered.close()
+        buffer.close()
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,287 @@
+import pandas as pd
+import numpy as np
+import os
+import time
+
+from bus_data_generator import (ROUTE_STOPS, MAX_CAPACITY, STATUS_LEVELS, generate_passenger_pattern,
+                                simulate_sensor_readings_batch)
+from passenger_km import haversine_km
+from what_if import classify
+
+TIMETABLE_FILE = 'timetable_138.csv'
+TRAVEL_TIME_FILE = 'segment_travel_times.csv'
+ROUTES = {'138': [s['name'] for s in ROUTE_STOPS]}
+DAY_TYPES = ['weekday', 'saturday', 'sunday']
+
+# Default travel-time table: a median of 4 minutes per hop on an average-length
+# segment (the generator's 3-5 minutes), slower and less predictable in the peaks
+BASE_MEDIAN_SECONDS = 240
+P90_Z = 1.2816                  # Standard normal 90th percentile
+CONGESTION = {7: 1.4, 8: 1.45, 9: 1.25, 12: 1.1, 13: 1.1, 17: 1.35, 18: 1.4, 19: 1.2}
+NIGHT_FACTOR = 0.8              # 21:00-05:00
+P90_RATIO_OFFPEAK = 1.25
+P90_RATIO_PEAK = 1.6
+
+# Default timetable: hourly round trips on the base bus, an extra bus on the
+# half hours in weekday peaks; the return leg leaves 35 minutes after the outbound
+RETURN_AFTER_MINUTES = 35
+
+def day_types(dates):
+    """weekday / saturday / sunday for each date"""
+    weekday = pd.DatetimeIndex(dates).weekday
+    return np.asarray(DAY_TYPES, dtype=object)[np.minimum(np.maximum(weekday - 4, 0), 2)]
+
+def load_timetable(path=TIMETABLE_FILE):
+    """Scheduled trips: route, bus_id, trip_number, direction, departure (HH:MM or HH:MM:SS) and
+    service (weekday, saturday, sunday or daily)"""
+    timetable = pd.read_csv(path, dtype={'route': str})
+    unknown = set(timetable['service']) - set(DAY_TYPES) - {'daily'}
+    if unknown:
+        raise ValueError(f"Unknown service day types: {sorted(unknown)}")
+    departure = timetable['departure'].astype(str)
+    departure = departure.where(departure.str.count(':') == 2, departure + ':00')
+    timetable['departure_s'] = pd.to_timedelta(departure).dt.total_seconds()
+    return timetable
+
+class TravelTimeTable:
+    """Stop-to-stop running time (dwell included) by directed segment and hour of day.
+
+    Each segment-hour is a lognormal fitted to a median and a 90th
+    percentile, so a table of quantiles, as published by an AVL system,
+    is enough to drive the simulation.
+    """
+
+    def __init__(self, table):
+        table = table.sort_values(['from_stop', 'to_stop', 'hour'])
+        if ((table['median_seconds'] <= 0) | (table['p90_seconds'] < table['median_seconds'])).any():
+            raise ValueError("Need 0 < median_seconds <= p90_seconds for every segment")
+        segments = table[['from_stop', 'to_stop']].drop_duplicates()
+        self.segments = {(f, t): i for i, (f, t) in enumerate(segments.itertuples(index=False))}
+        seg = np.array([self.segments[(f, t)] for f, t in zip(table['from_stop'], table['to_stop'])])
+        self.mu = np.full((len(self.segments), 24), np.nan)
+        self.sigma = np.full((len(self.segments), 24), np.nan)
+        self.mu[seg, table['hour'].values] = np.log(table['median_seconds'].values)
+        self.sigma[seg, table['hour'].values] = (np.log(table['p90_seconds'].values) -
+                                                 np.log(table['median_seconds'].values)) / P90_Z
+        if np.isnan(self.mu).any():
+            raise ValueError("Every segment needs all 24 hours")
+        self.table = table.reset_index(drop=True)
+
+    @classmethod
+    def from_csv(cls, path=TRAVEL_TIME_FILE):
+        return cls(pd.read_csv(path))
+
+    def segment_ids(self, from_stops, to_stops):
+        missing = {(f, t) for f, t in zip(from_stops, to_stops)} - set(self.segments)
+        if missing:
+            raise KeyError(f"No travel times for segments {sorted(missing)[:3]}")
+        return np.array([self.segments[(f, t)] for f, t in zip(from_stops, to_stops)], dtype=np.int64)
+
+    def sample(self, segment_ids, hours, rng):
+        """One running time (seconds) per (segment, hour) pair"""
+        segment_ids = np.asarray(segment_ids)
+        hours = np.asarray(hours) % 24
+        return np.exp(self.mu[segment_ids, hours] + self.sigma[segment_ids, hours] * rng.standard_normal(len(hours)))
+
+    def sample_one(self, segment_id, hour, rand):
+        """Scalar sample with a random.Random, for event-by-event simulators"""
+        return rand.lognormvariate(self.mu[segment_id, hour % 24], self.sigma[segment_id, hour % 24])
+
+def default_travel_times(routes=ROUTES):
+    """Travel-time table for the built-in route: median scales with segment length and congestion by hour"""
+    stops = {s['name']: s for s in ROUTE_STOPS}
+    rows = []
+    for names in routes.values():
+        for sequence in (names, names[::-1]):
+            for a, b in zip(sequence[:-1], sequence[1:]):
+                rows.append((a, b, haversine_km(stops[a]['lat'], stops[a]['lon'], stops[b]['lat'], stops[b]['lon'])))
+    segments = pd.DataFrame(rows, columns=['from_stop', 'to_stop', 'km']).drop_duplicates(['from_stop', 'to_stop'])
+    length_factor = np.sqrt(segments['km'] / segments['km'].mean())
+
+    hours = np.arange(24)
+    congestion = np.array([CONGESTION.get(h, NIGHT_FACTOR if h >= 21 or h < 5 else 1.0) for h in hours])
+    p90_ratio = np.where(congestion > 1.2, P90_RATIO_PEAK, P90_RATIO_OFFPEAK)
+    table = segments.loc[segments.index.repeat(24), ['from_stop', 'to_stop']].reset_index(drop=True)
+    table['hour'] = np.tile(hours, len(segments))
+    median = BASE_MEDIAN_SECONDS * np.repeat(length_factor.values, 24) * np.tile(congestion, len(segments))
+    table['median_seconds'] = median.round(1)
+    table['p90_seconds'] = (median * np.tile(p90_ratio, len(segments))).round(1)
+    return table
+
+def default_timetable(route='138'):
+    """Route 138 timetable in the load_timetable layout"""
+    rows = []
+    for service in DAY_TYPES:
+        trips = {}
+        first, last = (5, 22) if service != 'sunday' else (6, 21)
+        for hour in range(first, last + 1):
+            trips.setdefault('BUS-138-CMB', []).append(hour * 60)
+            if service == 'weekday' and (7 <= hour <= 8 or 17 <= hour <= 18):
+                trips.setdefault('BUS-138-CMB2', []).append(hour * 60 + 30)
+        for bus_id, departures in trips.items():
+            for trip_number, minutes in enumerate(departures, 1):
+                for direction, offset in (('Forward', 0), ('Backward', RETURN_AFTER_MINUTES)):
+                    m = minutes + offset
+                    rows.append(dict(route=route, bus_id=bus_id, trip_number=trip_number, direction=direction,
+                                     departure=f"{m // 60:02d}:{m % 60:02d}", service=service))
+    return pd.DataFrame(rows)
+
+def expand_timetable(timetable, start_date, days):
+    """One row per operated trip over `days` consecutive service dates"""
+    dates = pd.date_range(start_date, periods=days, freq='D')
+    calendar = pd.DataFrame({'date': dates, 'day_type': day_types(dates)})
+    trips = timetable.assign(_key=1).merge(calendar.assign(_key=1), on='_key').drop(columns='_key')
+    trips = trips[(trips['service'] == 'daily') | (trips['service'] == trips['day_type'])]
+    return trips.sort_values(['date', 'departure_s', 'bus_id'], kind='stable').reset_index(drop=True)
+
+def sample_trip_times(trips, travel_times, routes=ROUTES, seed=0):
+    """Stop arrival times (seconds from the service date's midnight) for every trip, as a
+    trips x stops matrix per (route, direction) group.
+
+    All trips of a group are sampled together, one stop position at a time:
+    the hour that picks a segment's distribution is the hour the bus leaves
+    the previous stop, so a late-running trip moves into the next hour's
+    conditions as it would on the road.
+    """
+    rng = np.random.default_rng(seed)
+    groups = {}
+    for (route, direction), group in trips.groupby(['route', 'direction'], sort=False):
+        names = routes[route] if direction == 'Forward' else routes[route][::-1]
+        segment_ids = travel_times.segment_ids(names[:-1], names[1:])
+        times = np.empty((len(group), len(names)))
+        times[:, 0] = group['departure_s'].values
+        for position, segment in enumerate(segment_ids):
+            hours = (times[:, position] // 3600).astype(np.int64)
+            times[:, position + 1] = times[:, position] + travel_times.sample(np.full(len(group), segment), hours, rng)
+        groups[(route, direction)] = (group.index.values, names, times)
+    return groups
+
+def simulate_loads(arrival_times, avg_passengers, start_load, rng, multipliers=None):
+    """generate_bus_data's boarding and alighting rules, vectorized over trips (rows) and run stop by stop.
+
+    `multipliers` (trips x stops) replaces the hourly generate_passenger_pattern, e.g. from DemandProfiles.
+    """
+    n_trips, n_stops = arrival_times.shape
+    if multipliers is None:
+        pattern = np.array([generate_passenger_pattern(h) for h in range(24)])
+        multipliers = pattern[(arrival_times // 3600).astype(np.int64) % 24]
+    base = np.maximum(1, (avg_passengers[None, :] * multipliers).astype(np.int64))
+
+    boarding = np.zeros((n_trips, n_stops), dtype=np.int64)
+    alighting = np.zeros((n_trips, n_stops), dtype=np.int64)
+    onboard = np.zeros((n_trips, n_stops), dtype=np.int64)
+    count = np.asarray(start_load, dtype=np.int64).copy()
+    for s in range(n_stops):
+        b = base[:, s]
+        if s == 0:
+            board = np.maximum(1, np.minimum(rng.integers(b - 5, b + 6), MAX_CAPACITY - count))
+            alight = np.zeros(n_trips, dtype=np.int64)
+        elif s == n_stops - 1:
+            board = np.zeros(n_trips, dtype=np.int64)
+            alight = count.copy()
+        else:
+            alight = np.where(count > 2, rng.integers(2, np.maximum(np.minimum(10, count), 2) + 1),
+                              rng.integers(0, count + 1))
+            available = MAX_CAPACITY - count + alight
+            low, high = np.maximum(0, b - 8), np.minimum(b + 8, available)
+            board = np.where(low > high, np.minimum(available, b), rng.integers(low, np.maximum(low, high) + 1))
+        count = np.clip(count - alight + board, 0, MAX_CAPACITY)
+        boarding[:, s], alighting[:, s], onboard[:, s] = board, alight, count
+    return boarding, alighting, onboard
+
+def generate_timetabled_data(timetable, travel_times, start_date='2024-01-15', days=1, routes=ROUTES, seed=0,
+                             profiles=None, sensors=None):
+    """Stop records in the generate_bus_data schema for every timetabled trip over `days` days.
+
+    Departures from the first stop are exactly the timetabled times; running
+    times between stops come from the travel-time table. With DemandProfiles,
+    demand follows each date's calendar day type instead of the hourly pattern,
+    and a sensor_models.SensorSuite replaces the generator's sensor error model.
+    """
+    rng = np.random.default_rng(seed)
+    stops = {s['name']: s for s in ROUTE_STOPS}
+    trips = expand_timetable(timetable, start_date, days)
+    frames = []
+    for (route, direction), (index, names, times) in sample_trip_times(trips, travel_times, routes, seed).items():
+        group = trips.loc[index]
+        avg_passengers = np.array([stops[name]['avg_passengers'] for name in names])
+        # Outbound legs start with 5-15 on board; return legs start empty, as in the generator
+        start_load = rng.integers(5, 16, len(group)) if direction == 'Forward' else np.zeros(len(group))
+        multipliers = None
+        if profiles is not None:
+            stop_ids = np.array([profiles.stop_index[name] for name in names])
+            codes = profiles.day_type_codes(group['date'].values)
+            multipliers = profiles.lookup(stop_ids[None, :], codes[:, None], times)
+        boarding, alighting, onboard = simulate_loads(times, avg_passengers, start_load, rng, multipliers)
+
+        n_stops = len(names)
+        frames.append(pd.DataFrame({
+            'timestamp': np.repeat(group['date'].values, n_stops) + pd.to_timedelta(np.round(times.ravel()), unit='s'),
+            'trip_number': np.repeat(group['trip_number'].values, n_stops),
+            'direction': direction,
+            'bus_id': np.repeat(group['bus_id'].values, n_stops),
+            'stop_name': np.tile(names, len(group)),
+            'latitude': np.tile([stops[name]['lat'] for name in names], len(group)),
+            'longitude': np.tile([stops[name]['lon'] for name in names], len(group)),
+            'boarding': boarding.ravel(),
+            'alighting': alighting.ravel(),
+            'actual_count': onboard.ravel(),
+        }))
+    df = pd.concat(frames, ignore_index=True).sort_values(['timestamp', 'bus_id'], kind='stable')
+    df = df.reset_index(drop=True)
+
+    readings = sensors.readings if sensors is not None else simulate_sensor_readings_batch
+    ir_count, camera_count, validated_count = readings(df['actual_count'].values, rng)
+    _, occupancy_percent, codes = classify(validated_count)
+    df.insert(9, 'ir_sensor_count', ir_count)
+    df.insert(10, 'camera_count', camera_count)
+    df.insert(11, 'validated_count', validated_count)
+    df['occupancy_percent'] = occupancy_percent
+    df['status'] = np.asarray(STATUS_LEVELS, dtype=object)[codes]
+    df['alert_triggered'] = np.where(codes == len(STATUS_LEVELS) - 1, 'Yes', 'No')
+    df['sensor_mismatch'] = np.abs(camera_count - ir_count)
+    df['hour'] = df['timestamp'].dt.hour
+    return df
+
+def main():
+    """Simulate a year of timetabled service and check it against the schedule"""
+    print("Timetable-Driven Simulation")
+    print("=" * 50)
+
+    # 1. Timetable and travel-time table, written out as editable defaults the first time
+    if not os.path.exists(TIMETABLE_FILE):
+        default_timetable().to_csv(TIMETABLE_FILE, index=False)
+    if not os.path.exists(TRAVEL_TIME_FILE):
+        default_travel_times().to_csv(TRAVEL_TIME_FILE, index=False)
+    timetable = load_timetable(TIMETABLE_FILE)
+    travel_times = TravelTimeTable.from_csv(TRAVEL_TIME_FILE)
+    print(f"1. {len(timetable)} timetabled trips ({', '.join(f'{n} {t}' for t, n in timetable['service'].value_counts().items())}), "
+          f"{len(travel_times.segments)} segments x 24 hours of travel times")
+
+    # 2. A year of service in one vectorized pass
+    start = time.perf_counter()
+    df = generate_timetabled_data(timetable, travel_times, start_date='2024-01-01', days=366)
+    elapsed = time.perf_counter() - start
+    trips = df.groupby(['bus_id', df['timestamp'].dt.date, 'trip_number', 'direction'])
+    print(f"2. Simulated {trips.ngroups:,} trips ({len(df):,} stop records) for 2024 in {elapsed:.2f}s")
+
+    # 3. Departures follow the timetable; running times follow the table
+    first = df.loc[trips['timestamp'].idxmin()]
+    scheduled = load_timetable(TIMETABLE_FILE).set_index(['bus_id', 'trip_number', 'direction', 'service'])
+    first_types = day_types(first['timestamp'].dt.normalize())
+    expected = scheduled['departure_s'].reindex(pd.MultiIndex.from_arrays(
+        [first['bus_id'], first['trip_number'], first['direction'], first_types])).values
+    seconds = (first['timestamp'] - first['timestamp'].dt.normalize()).dt.total_seconds().values
+    print(f"3. First-stop departures off timetable by at most {np.nanmax(np.abs(seconds - expected)):.0f}s")
+    run_minutes = (trips['timestamp'].max() - trips['timestamp'].min()).dt.total_seconds() / 60
+    by_hour = run_minutes.groupby(trips['timestamp'].min().dt.hour).agg(['median', lambda m: m.quantile(0.9)])
+    print("   End-to-end running time (median/P90 min) by departure hour: " +
+          ", ".join(f"{h}:00 {m:.0f}/{p:.0f}" for h, (m, p) in by_hour.iloc[::3].iterrows()))
+
+    # 4. Load outcome in the generator's terms
+    print(f"4. Overcrowded {(df['status'] == 'OVERCROWDED').mean() * 100:.1f}% of stop visits, "
+          f"{(df['alert_triggered'] == 'Yes').sum():,} alerts, "
+          f"peak hour {df.groupby('hour')['occupancy_percent'].mean().idxmax()}:00")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import pandas as pd
+import numpy as np
+import time
+
+from bus_data_generator import MAX_CAPACITY, NORMAL_THRESHOLD, YELLOW_THRESHOLD, RED_THRESHOLD, STATUS_LEVELS
+from event_log import build_fleet_history
+
+DEFAULT_SCENARIO = {
+    'capacity': MAX_CAPACITY,
+    'normal': NORMAL_THRESHOLD,
+    'yellow': YELLOW_THRESHOLD,
+    'red': RED_THRESHOLD,
+}
+CSV_CHUNK_ROWS = 500_000
+
+def scenario_table(scenarios):
+    """One row per scenario with capacity and thresholds, defaults filled in from the module constants"""
+    table = pd.DataFrame([{**DEFAULT_SCENARIO, **params} for params in scenarios.values()],
+                         index=pd.Index(list(scenarios), name='scenario'))
+    if (table['capacity'] <= 0).any():
+        raise ValueError("Capacity must be positive")
+    if not ((table['normal'] < table['yellow']) & (table['yellow'] < table['red'])).all():
+        raise ValueError("Thresholds must satisfy normal < yellow < red")
+    return table
+
+def classify(validated_count, capacity=MAX_CAPACITY, normal=NORMAL_THRESHOLD, yellow=YELLOW_THRESHOLD,
+             red=RED_THRESHOLD):
+    """Clipped counts, occupancy percent and status codes (index into STATUS_LEVELS), as the generator computes them"""
+    counts = np.clip(np.asarray(validated_count), 0, capacity)
+    occupancy_percent = np.round(counts / capacity * 100, 2)
+    codes = np.digitize(occupancy_percent, np.array([normal, yellow, red]) * 100)
+    return counts, occupancy_percent, codes
+
+def reclassify(df, capacity=MAX_CAPACITY, normal=NORMAL_THRESHOLD, yellow=YELLOW_THRESHOLD, red=RED_THRESHOLD):
+    """Copy of the records with validated_count, occupancy_percent, status and alert_triggered
+    recomputed for another capacity and thresholds.
+
+    Stored counts are already clipped to the capacity they were recorded
+    with, so a larger bus lowers occupancy but cannot recover passengers
+    the sensors never counted.
+    """
+    df = df.copy()
+    counts, occupancy_percent, codes = classify(df['validated_count'].values, capacity, normal, yellow, red)
+    df['validated_count'] = counts.astype(int)
+    df['occupancy_percent'] = occupancy_percent
+    df['status'] = np.asarray(STATUS_LEVELS, dtype=object)[codes]
+    df['alert_triggered'] = np.where(codes == len(STATUS_LEVELS) - 1, 'Yes', 'No')
+    return df
+
+class CountHistogram:
+    """Stop x hour x validated_count histogram of stored records.
+
+    Every derived column depends on a record only through validated_count,
+    so the histogram (plus a few scenario-independent sums) is enough to
+    recompute every KPI for any capacity and thresholds. It is built in one
+    pass over a frame, a CSV in chunks or a KPIStore, after which each
+    scenario costs a product over the count values instead of a pass over
+    the rows.
+    """
+
+    def __init__(self, max_count=MAX_CAPACITY):
+        self.max_count = max_count
+        self.stops = []
+        self._stop_index = {}
+        self.counts = np.zeros((0, 24, max_count + 1), dtype=np.int64)
+        self.mismatch_sum = 0.0
+        self.boarding_sum = 0
+
+    def _stop_codes(self, stop_names):
+        codes, uniques = pd.factorize(np.asarray(stop_names))
+        for name in uniques:
+            if name not in self._stop_index:
+                self._stop_index[name] = len(self.stops)
+                self.stops.append(name)
+        if len(self.stops) > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros((len(self.stops) - len(self.counts),) +
+                                                                self.counts.shape[1:], dtype=np.int64)])
+        return np.array([self._stop_index[name] for name in uniques], dtype=np.int64)[codes]
+
+    def add_counts(self, stop_names, hours, values, records):
+        """Add pre-aggregated (stop, hour, validated_count) -> record counts"""
+        values = np.asarray(values, dtype=np.int64)
+        if len(values) and (values.min() < 0 or values.max() > self.max_count):
+            raise ValueError(f"validated_count outside 0-{self.max_count}")
+        cells = np.ravel_multi_index((self._stop_codes(stop_names), np.asarray(hours, dtype=np.int64), values),
+                                     self.counts.shape)
+        self.counts.ravel()[:] += np.bincount(cells, weights=records, minlength=self.counts.size).astype(np.int64)
+        return self
+
+    def add_frame(self, df):
+        hours = df['hour'].values if 'hour' in df.columns else pd.to_datetime(df['timestamp']).dt.hour.values
+        self.mismatch_sum += df['sensor_mismatch'].sum()
+        self.boarding_sum += int(df['boarding'].sum())
+        return self.add_counts(df['stop_name'].values, hours, df['validated_count'].values, np.ones(len(df)))
+
+    @classmethod
+    def from_csv(cls, path, chunk_rows=CSV_CHUNK_ROWS):
+        histogram = cls()
+        columns = ['timestamp', 'stop_name', 'validated_count', 'sensor_mismatch', 'boarding']
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_rows):
+            histogram.add_frame(chunk)
+        return histogram
+
+    @classmethod
+    def from_store(cls, store):
+        """Histogram aggregated inside a KPIStore's database"""
+        histogram = cls()
+        cells = store.query("SELECT stop_name, hour, validated_count, COUNT(*) AS records FROM stop_records "
+                            "GROUP BY stop_name, hour, validated_count")
+        histogram.add_counts(cells['stop_name'].values, cells['hour'].values, cells['validated_count'].values,
+                             cells['records'].values)
+        sums = store.query("SELECT SUM(sensor_mismatch) AS mismatch, SUM(boarding) AS boarding FROM stop_records")
+        histogram.mismatch_sum = float(sums['mismatch'].iloc[0] or 0)
+        histogram.boarding_sum = int(sums['boarding'].iloc[0] or 0)
+        return histogram
+
+    @property
+    def records(self):
+        return int(self.counts.sum())
+
+    def _scenario_arrays(self, table):
+        """Occupancy percent and status code of every count value under every scenario (scenarios x values)"""
+        values = np.arange(self.max_count + 1)
+        capacity = table['capacity'].values[:, None]
+        occupancy = np.round(np.minimum(values[None, :], capacity) / capacity * 100, 2)
+        thresholds = table[['normal', 'yellow', 'red']].values * 100
+        codes = (occupancy[:, :, None] >= thresholds[:, None, :]).sum(axis=2)
+        return occupancy, codes
+
+    def kpis(self, scenarios):
+        """All headline KPIs for every scenario, side by side (one row per scenario)"""
+        table = scenario_table(scenarios)
+        occupancy, codes = self._scenario_arrays(table)
+        by_value = self.counts.sum(axis=(0, 1))
+        by_stop_value = self.counts.sum(axis=1)
+        by_hour_value = self.counts.sum(axis=0)
+        n = by_value.sum()
+
+        status = np.stack([(codes == level) @ by_value for level in range(len(STATUS_LEVELS))], axis=1)
+        stop_occupancy = (by_stop_value @ occupancy.T) / np.maximum(by_stop_value.sum(axis=1), 1)[:, None]
+        hour_records = by_hour_value.sum(axis=1)
+        hour_occupancy = (by_hour_value @ occupancy.T) / np.maximum(hour_records, 1)[:, None]
+        hour_occupancy[hour_records == 0] = -np.inf
+        seen = by_value > 0
+
+        result = pd.DataFrame({
+            'capacity': table['capacity'].values,
+            'alert_line_percent': table['red'].values * 100,
+            'max_utilization': np.where(seen[None, :], occupancy, -np.inf).max(axis=1),
+            'avg_utilization': occupancy @ by_value / n,
+            'overcrowded_percentage': status[:, -1] / n * 100,
+            'total_alerts': status[:, -1],
+            'most_crowded_stop': np.asarray(self.stops, dtype=object)[stop_occupancy.argmax(axis=0)],
+            'most_crowded_stop_occupancy': stop_occupancy.max(axis=0),
+            'peak_hour': hour_occupancy.argmax(axis=0),
+            'peak_hour_occupancy': hour_occupancy.max(axis=0),
+            'avg_sensor_mismatch': self.mismatch_sum / n,
+        }, index=table.index)
+        for level, name in enumerate(STATUS_LEVELS):
+            result[f"{name.lower()}_percent"] = status[:, level] / n * 100
+        return result
+
+    def breakdown(self, scenarios, by='hour', measure='alerts'):
+        """Alerts or mean occupancy per hour or per stop, one column per scenario"""
+        table = scenario_table(scenarios)
+        occupancy, codes = self._scenario_arrays(table)
+        counts = self.counts.sum(axis=1 if by == 'stop' else 0)
+        if measure == 'alerts':
+            values = counts @ (codes == len(STATUS_LEVELS) - 1).T
+        else:
+            values = (counts @ occupancy.T) / np.maximum(counts.sum(axis=1), 1)[:, None]
+        index = pd.Index(self.stops if by == 'stop' else np.arange(24), name=by)
+        frame = pd.DataFrame(values, index=index, columns=table.index)
+        return frame[counts.sum(axis=1) > 0]
+
+def main():
+    """Re-run the KPIs for several bus sizes and alert lines on stored data"""
+    print("What-If Capacity and Threshold Analysis")
+    print("=" * 50)
+
+    try:
+        df = pd.read_csv('bus_overcrowding_data.csv')
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    except FileNotFoundError:
+        print("Error: bus_overcrowding_data.csv not found!")
+        print("Please run bus_data_generator.py first to generate the data.")
+        return
+
+    scenarios = {
+        'current': {},
+        '60-seat bus': dict(capacity=60),
+        '75% alert line': dict(red=0.75),
+        '60 seats, 75% line': dict(capacity=60, red=0.75),
+        '40-seat minibus': dict(capacity=40),
+    }
+
+    # 1. One pass over the data serves every scenario
+    histogram = CountHistogram().add_frame(df)
+    results = histogram.kpis(scenarios)
+    print(f"1. {histogram.records:,} records, {len(scenarios)} scenarios:")
+    for name, row in results.iterrows():
+        print(f"   - {name}: {row['avg_utilization']:.1f}% average occupancy, "
+              f"{row['overcrowded_percentage']:.1f}% overcrowded, {row['total_alerts']:,} alerts, "
+              f"peak hour {row['peak_hour']}:00")
+
+    # 2. Check against reclassifying every row
+    for name, params in scenarios.items():
+        direct = reclassify(df, **params)
+        assert (direct['alert_triggered'] == 'Yes').sum() == results.loc[name, 'total_alerts']
+        assert np.isclose(direct['occupancy_percent'].mean(), results.loc[name, 'avg_utilization'])
+    print("2. Matches row-by-row reclassification for every scenario")
+
+    # 3. Many scenarios over a fleet history
+    fleet = build_fleet_history(df, n_buses=300, n_days=30)
+    grid = {f"{capacity} seats, {red:.0%} line": dict(capacity=capacity, red=red)
+            for capacity in range(40, 81, 5) for red in (0.7, 0.75, 0.8, 0.85, 0.9)}
+    start = time.perf_counter()
+    fleet_results = CountHistogram().add_frame(fleet).kpis(grid)
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    for params in list(grid.values())[:5]:
+        (reclassify(fleet, **params)['alert_triggered'] == 'Yes').sum()
+    per_scenario = (time.perf_counter() - start) / 5
+    print(f"3. {len(grid)} scenarios over {len(fleet):,} records in {elapsed:.2f}s "
+          f"(row-by-row: about {per_scenario * len(grid):.1f}s)")
+    alerts = fleet_results.pivot_table(index='capacity', columns='alert_line_percent', values='total_alerts')
+    print("   Alerts per day and bus by capacity (rows) and alert line (columns):")
+    print((alerts / (300 * 30)).round(1).to_string())
+
+if __name__ == "__main__":
+    main()